@@ -0,0 +1,383 @@
+"""
+Multi-session Email Agent HTTP/JSON server.
+
+Many conversations share one loaded model. Session state lives in a
+compact __slots__ table with TTL expiry; model work goes through a fair
+round-robin scheduler so one busy session cannot starve the others. With
+--workers N the model runs in N worker processes (model_pool) and the
+scheduler serves N sessions at a time.
+
+Endpoints:
+    POST   /sessions                  -> {"session_id": ...}
+    POST   /sessions/<id>/message     {"text": ...}      -> process_step result
+    POST   /sessions/<id>/confirm     {"response": ...}  -> handle_confirmation result
+    GET    /sessions/<id>             -> session state and wait times
+    DELETE /sessions/<id>
+    GET    /metrics                   -> queue depth, sessions, wait times
+    GET    /contacts?q=<prefix>       -> contact autocomplete (with EMAIL_AGENT_CONTACTS)
+
+Usage:
+    python agent_server.py --port 8080
+    python agent_server.py --fake     # fake model + fake Gmail, for testing
+    python agent_server.py --workers 4
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from agents_email_agent import CONTACTS_PATH, MODEL_WORKERS, EmailAgent
+
+SESSION_TTL = 30 * 60  # seconds of inactivity before a session expires
+
+
+# ============================================================
+# Session table
+# ============================================================
+
+class Session:
+    __slots__ = ("session_id", "state", "last_seen", "jobs", "total_wait", "last_wait")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.state = (None,) * len(EmailAgent.STATE_FIELDS)
+        self.last_seen = time.monotonic()
+        self.jobs = 0
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+
+    def to_dict(self):
+        data = dict(zip(EmailAgent.STATE_FIELDS, self.state))
+        data.update(
+            session_id=self.session_id,
+            jobs=self.jobs,
+            last_wait_ms=round(self.last_wait * 1000, 1),
+            avg_wait_ms=round(self.total_wait / self.jobs * 1000, 1) if self.jobs else 0.0,
+        )
+        return data
+
+
+class SessionTable:
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        session = Session(uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        """Return a live session (refreshing its TTL) or None"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if now - session.last_seen > self.ttl:
+                del self._sessions[session_id]
+                return None
+            session.last_seen = now
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def expire(self):
+        """Drop sessions idle for longer than the TTL; returns how many"""
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s.last_seen < cutoff]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+
+# ============================================================
+# Fair model scheduler
+# ============================================================
+
+class FairScheduler:
+    """
+    Model workers that serve sessions round-robin: each session has its own
+    FIFO, and the workers take one job per session in turn. A session's
+    jobs never run concurrently (they share its state).
+    """
+
+    def __init__(self, workers=1):
+        self._queues = {}          # session_id -> deque of jobs
+        self._ready = deque()      # idle session ids with pending jobs, in turn order
+        self._running = set()      # session ids with a job on a worker
+        self._cond = threading.Condition()
+        self._depth = 0
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"model-scheduler-{i}")
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def submit(self, session, func, *args):
+        """Queue func(*args) for session; returns a Future"""
+        future = Future()
+        job = (session, func, args, future, time.monotonic())
+        with self._cond:
+            queue = self._queues.get(session.session_id)
+            if queue is None:
+                queue = self._queues[session.session_id] = deque()
+                if session.session_id not in self._running:
+                    self._ready.append(session.session_id)
+            queue.append(job)
+            self._depth += 1
+            self._cond.notify()
+        return future
+
+    def _next_job(self):
+        with self._cond:
+            while not self._ready:
+                self._cond.wait()
+            session_id = self._ready.popleft()
+            queue = self._queues[session_id]
+            job = queue.popleft()
+            if not queue:
+                del self._queues[session_id]
+            self._running.add(session_id)
+            self._depth -= 1
+            return job
+
+    def _job_done(self, session_id):
+        with self._cond:
+            self._running.discard(session_id)
+            if session_id in self._queues:
+                self._ready.append(session_id)  # back of the line
+                self._cond.notify()
+
+    def _worker(self):
+        while True:
+            session, func, args, future, enqueued = self._next_job()
+            wait = time.monotonic() - enqueued
+            session.jobs += 1
+            session.total_wait += wait
+            session.last_wait = wait
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func(*args))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                self._job_done(session.session_id)
+
+
+# ============================================================
+# Server
+# ============================================================
+
+class AgentServer:
+    def __init__(self, model=None, send_func=None, ttl=SESSION_TTL, workers=1, contacts=None):
+        """
+        Args:
+            model: Model shared by all sessions (EmailAgent's default if None)
+            send_func: Callable(to, subject, body) -> str (Gmail tool if None)
+            ttl: Session inactivity timeout in seconds
+            workers: Sessions served concurrently (match the model's worker processes)
+            contacts: Optional ContactDirectory shared by all sessions
+        """
+        # Attaching reads files on this machine, which remote users must not do
+        self.agent_kwargs = {"allow_attachments": False}
+        if model is not None:
+            self.agent_kwargs["model"] = model
+        if send_func is not None:
+            self.agent_kwargs["send_func"] = send_func
+        self.contacts = contacts
+        if contacts is not None:
+            self.agent_kwargs["contacts"] = contacts
+        self.sessions = SessionTable(ttl)
+        self.scheduler = FairScheduler(workers)
+
+    def _run(self, session, method, text):
+        """Run an EmailAgent method against the session's stored state"""
+        agent = EmailAgent(**self.agent_kwargs)
+        agent.import_state(session.state)
+        result = getattr(agent, method)(text)
+        session.state = agent.export_state()
+        return result
+
+    def message(self, session, text):
+        return self.scheduler.submit(session, self._run, session, "process_step", text).result()
+
+    def confirm(self, session, response):
+        # Sending needs no model time, but it reads and resets session.state:
+        # queue it behind the session's in-flight message/regenerate jobs
+        return self.scheduler.submit(session, self._run, session, "handle_confirmation", response).result()
+
+    def metrics(self):
+        sessions = self.sessions.sessions()
+        waits = [s.last_wait for s in sessions if s.jobs]
+        return {
+            "queue_depth": self.scheduler.depth,
+            "sessions": len(sessions),
+            "max_last_wait_ms": round(max(waits, default=0.0) * 1000, 1),
+            "avg_last_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+        }
+
+    def make_http_server(self, host="127.0.0.1", port=8080):
+        server = ThreadingHTTPServer((host, port), _AgentRequestHandler)
+        server.daemon_threads = True
+        server.agent_server = self
+        return server
+
+
+class _AgentRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _session_route(self):
+        """Split /sessions/<id>[/action] into (session, action)"""
+        parts = self.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "sessions":
+            return None, None
+        session = self.server.agent_server.sessions.get(parts[1])
+        return session, (parts[2] if len(parts) > 2 else None)
+
+    def do_GET(self):
+        app = self.server.agent_server
+        if self.path == "/metrics":
+            self._send_json(200, app.metrics())
+            return
+        url = urlsplit(self.path)
+        if url.path == "/contacts":
+            if app.contacts is None:
+                self._send_json(404, {"status": "error", "message": "No contact directory configured"})
+                return
+            query = parse_qs(url.query).get("q", [""])[0]
+            matches = app.contacts.search(query)
+            self._send_json(200, {"contacts": [{"email": c.email, "name": c.name, "organization": c.organization}
+                                               for c in matches]})
+            return
+        session, _ = self._session_route()
+        if session is None:
+            self._send_json(404, {"status": "error", "message": "Unknown or expired session"})
+            return
+        self._send_json(200, session.to_dict())
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        deleted = len(parts) == 2 and self.server.agent_server.sessions.delete(parts[1])
+        self._send_json(200 if deleted else 404, {"deleted": bool(deleted)})
+
+    def do_POST(self):
+        app = self.server.agent_server
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json(400, {"status": "error", "message": "Invalid JSON"})
+            return
+
+        if self.path == "/sessions":
+            app.sessions.expire()
+            self._send_json(201, {"session_id": app.sessions.create().session_id})
+            return
+
+        session, action = self._session_route()
+        if session is None:
+            self._send_json(404, {"status": "error", "message": "Unknown or expired session"})
+            return
+        try:
+            if action == "message":
+                result = app.message(session, str(body.get("text", "")))
+            elif action == "confirm":
+                result = app.confirm(session, str(body.get("response", "")))
+            else:
+                self._send_json(404, {"status": "error", "message": f"Unknown action {action}"})
+                return
+        except Exception as e:
+            self._send_json(500, {"status": "error", "message": str(e)})
+            return
+        self._send_json(200, result)
+
+
+def _fake_send(to, subject, body):
+    return f"✓ Email sent successfully to {to} (Message ID: fake-{uuid.uuid4().hex[:8]})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session Email Agent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ttl", type=float, default=SESSION_TTL, help="Session TTL in seconds")
+    parser.add_argument("--fake", action="store_true", help="Use the fake model and fake Gmail send")
+    parser.add_argument("--workers", type=int, default=MODEL_WORKERS,
+                        help="Model worker processes (sessions served concurrently)")
+    args = parser.parse_args(argv)
+
+    contacts = None
+    if CONTACTS_PATH:
+        from contacts import ContactDirectory
+
+        contacts = ContactDirectory(CONTACTS_PATH)
+        print(f"📇 {len(contacts)} contacts loaded from {CONTACTS_PATH}")
+
+    if args.fake:
+        from fake_model import FakeModel
+        app = AgentServer(model=FakeModel(), send_func=_fake_send, ttl=args.ttl, workers=args.workers,
+                          contacts=contacts)
+    elif args.workers > 1:
+        from agents_email_agent import local_model
+        from model_pool import PooledModelWrapper
+
+        model = PooledModelWrapper(args.workers, generation_cache=local_model.generation_cache)
+        print(f"→ Starting {args.workers} model workers ({model.threads_per_worker} threads each)...")
+        model.warm_up()
+        app = AgentServer(model=model, ttl=args.ttl, workers=args.workers, contacts=contacts)
+    else:
+        app = AgentServer(ttl=args.ttl, contacts=contacts)
+
+    server = app.make_http_server(args.host, args.port)
+    print(f"🤖 Email Agent server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
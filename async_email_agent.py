@@ -0,0 +1,87 @@
+"""
+asyncio front-end for EmailAgent.
+
+Each AsyncEmailAgent wraps one EmailAgent conversation. Model work runs on
+a dedicated executor behind a bounded queue (ModelQueue) shared by all
+sessions, and Gmail sends run on a separate I/O executor, so a slow send
+never holds up generation and hundreds of sessions can interleave in one
+event loop.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from agents_email_agent import EmailAgent
+
+YES_RESPONSES = ('yes', 'y', 'send')
+REGENERATE_RESPONSES = ('regenerate', 'r')
+ATTACHMENT_COMMANDS = ('attach', 'detach')
+
+
+class ModelQueue:
+    """Dedicated model executor with a bounded number of pending jobs"""
+
+    def __init__(self, workers=1, max_pending=64):
+        """
+        Args:
+            workers: Model worker threads (1 per loaded llama.cpp context,
+                or one per process of a model_pool.PooledModelWrapper)
+            max_pending: Jobs admitted at once; further callers wait their turn
+        """
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="model")
+        self._slots = None
+        self.pending = 0
+
+    async def run(self, func, *args):
+        """Run func(*args) on the model executor and await its result"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+# Shared by every AsyncEmailAgent unless one is passed in explicitly
+default_model_queue = ModelQueue()
+default_send_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="send")
+
+
+class AsyncEmailAgent:
+    def __init__(self, agent=None, model_queue=None, send_executor=None, **agent_kwargs):
+        """
+        Args:
+            agent: EmailAgent holding this session's state (created if omitted)
+            model_queue: ModelQueue for generation work
+            send_executor: Executor for blocking Gmail calls
+            **agent_kwargs: Passed to EmailAgent when agent is omitted
+        """
+        self.agent = agent or EmailAgent(**agent_kwargs)
+        self.model_queue = model_queue or default_model_queue
+        self.send_executor = send_executor or default_send_executor
+
+    async def process_step(self, user_input: str):
+        """Awaitable EmailAgent.process_step"""
+        return await self.model_queue.run(self.agent.process_step, user_input)
+
+    async def handle_confirmation(self, user_response: str):
+        """Awaitable EmailAgent.handle_confirmation"""
+        choice = user_response.lower()
+        if choice in YES_RESPONSES or choice.strip().partition(" ")[0] in ATTACHMENT_COMMANDS:
+            # Gmail and file I/O (attaching stats the files): off the event loop
+            # and off the model executor
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.send_executor, self.agent.handle_confirmation, user_response
+            )
+        if choice in REGENERATE_RESPONSES:
+            return await self.model_queue.run(self.agent.handle_confirmation, user_response)
+        # Cancelling (no or anything else) only resets state
+        return self.agent.handle_confirmation(user_response)
@@ -1,136 +1,293 @@
-"""
-Automatic Gmail OAuth Token Manager
-Handles token creation, refresh, and validation automatically.
-
-Save this file as: auth_manager.py
-Place it in the same directory as your other code files.
-"""
-
-import os
-import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-
-SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
-
-class GmailAuthManager:
-    def __init__(self, credentials_file="credentials.json", token_file="token.json"):
-        """
-        Initialize the auth manager.
-        
-        Args:
-            credentials_file: Path to OAuth credentials from Google Cloud Console
-            token_file: Path where token will be stored/loaded
-        """
-        self.credentials_file = credentials_file
-        self.token_file = token_file
-        self.creds = None
-    
-    def get_credentials(self):
-        """
-        Get valid credentials, creating new ones if needed.
-        This method handles the entire OAuth flow automatically.
-        
-        Returns:
-            Valid Google OAuth credentials
-        """
-        # Check if token.json exists and load it
-        if os.path.exists(self.token_file):
-            try:
-                self.creds = Credentials.from_authorized_user_file(self.token_file, SCOPES)
-                print(f"✓ Loaded existing token from {self.token_file}")
-            except Exception as e:
-                print(f"⚠ Error loading token: {e}")
-                self.creds = None
-        
-        # If credentials don't exist or are invalid
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                # Token expired but can be refreshed
-                print("⟳ Refreshing expired token...")
-                try:
-                    self.creds.refresh(Request())
-                    print("✓ Token refreshed successfully")
-                except Exception as e:
-                    print(f"⚠ Token refresh failed: {e}")
-                    print("→ Generating new token...")
-                    self.creds = self._generate_new_token()
-            else:
-                # No valid credentials, need to generate new token
-                self.creds = self._generate_new_token()
-            
-            # Save the credentials for next time
-            self._save_token()
-        
-        return self.creds
-    
-    def _generate_new_token(self):
-        """
-        Generate a new token via OAuth flow.
-        Opens browser for user authorization.
-        """
-        if not os.path.exists(self.credentials_file):
-            raise FileNotFoundError(
-                f"\n{'='*60}\n"
-                f"ERROR: {self.credentials_file} not found!\n\n"
-                f"To fix this:\n"
-                f"1. Go to Google Cloud Console (console.cloud.google.com)\n"
-                f"2. Enable Gmail API for your project\n"
-                f"3. Create OAuth 2.0 credentials (Desktop app)\n"
-                f"4. Download the credentials JSON file\n"
-                f"5. Save it as '{self.credentials_file}' in this directory\n"
-                f"{'='*60}\n"
-            )
-        
-        print("\n" + "="*60)
-        print("🔐 FIRST TIME SETUP - Gmail OAuth Authorization")
-        print("="*60)
-        print(f"→ Opening browser for authorization...")
-        print(f"→ Please log in and grant access to send emails")
-        print(f"→ This only needs to be done once\n")
-        
-        try:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                self.credentials_file, 
-                SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-            print("\n✓ Authorization successful!")
-            return creds
-        except Exception as e:
-            print(f"\n✗ Authorization failed: {e}")
-            raise
-    
-    def _save_token(self):
-        """Save credentials to token file"""
-        try:
-            with open(self.token_file, 'w') as f:
-                f.write(self.creds.to_json())
-            print(f"✓ Token saved to {self.token_file}")
-        except Exception as e:
-            print(f"⚠ Failed to save token: {e}")
-    
-    def is_authenticated(self):
-        """Check if user is already authenticated"""
-        return os.path.exists(self.token_file)
-
-
-# Singleton instance for easy access
-_auth_manager = None
-
-def get_auth_manager(credentials_file="credentials.json", token_file="token.json"):
-    """
-    Get or create the global auth manager instance.
-    
-    Args:
-        credentials_file: Path to credentials.json
-        token_file: Path to token.json
-    
-    Returns:
-        GmailAuthManager instance
-    """
-    global _auth_manager
-    if _auth_manager is None:
-        _auth_manager = GmailAuthManager(credentials_file, token_file)
+"""
+Automatic Gmail OAuth Token Manager
+Handles token creation, refresh, and validation automatically.
+
+Save this file as: auth_manager.py
+Place it in the same directory as your other code files.
+
+tools_send_email_gmail.py uses this manager too. The Google auth libraries
+are imported on first use, so importing this module stays cheap.
+"""
+
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+TOKEN_REFRESH_MARGIN = 300  # seconds before expiry to refresh in the background (> google-auth's 225 s skew)
+TOKEN_RETRY_DELAY = 30  # seconds between background refresh attempts after a failure
+
+
+@contextmanager
+def _token_file_lock(token_file):
+    """Hold an exclusive cross-process lock on token_file (via a .lock sibling)"""
+    with open(token_file + ".lock", "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10 s; keep waiting
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _seconds_left(creds):
+    """Seconds until creds expire (None if they never do)"""
+    if creds.expiry is None:
+        return None
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+    return (creds.expiry - now).total_seconds()
+
+
+class GmailAuthManager:
+    def __init__(self, credentials_file="credentials.json", token_file="token.json",
+                 refresh_margin=TOKEN_REFRESH_MARGIN):
+        """
+        Initialize the auth manager.
+        
+        Args:
+            credentials_file: Path to OAuth credentials from Google Cloud Console
+            token_file: Path where token will be stored/loaded
+            refresh_margin: Seconds before expiry to refresh the token in the background
+        """
+        self.credentials_file = credentials_file
+        self.token_file = token_file
+        self.refresh_margin = refresh_margin
+        self.creds = None
+        self.refreshes = 0  # token endpoint calls made by this process
+        self._lock = threading.Lock()
+        self._timer = None
+    
+    def get_credentials(self):
+        """
+        Get valid credentials, creating new ones if needed.
+        This method handles the entire OAuth flow automatically.
+        
+        Credentials are kept in memory and refreshed by a background timer
+        shortly before they expire, so callers normally never wait on auth.
+        token.json is only read and written under a cross-process lock, so
+        several processes can share it and only one of them refreshes.
+        
+        Returns:
+            Valid Google OAuth credentials
+        """
+        creds = self.creds
+        if creds is not None and creds.valid:
+            return creds
+        
+        with self._lock:
+            if self.creds is None or not self.creds.valid:
+                self._renew("foreground")
+            return self.creds
+    
+    def _renew(self, mode):
+        """
+        Bring self.creds up to date under the token file lock: adopt a token
+        another process already refreshed, otherwise refresh it (or, in the
+        foreground, run the OAuth flow) and save it. Then schedule the next
+        background refresh.
+        """
+        interactive = mode == "foreground"
+        with _token_file_lock(self.token_file):
+            creds = self._load_token(verbose=interactive) or self.creds
+            left = _seconds_left(creds) if creds is not None else None
+            if creds is not None and creds.valid and (left is None or left > self.refresh_margin):
+                result = "loaded"  # still fresh (e.g. another process already refreshed it)
+            elif creds is not None and creds.refresh_token:
+                # Token expired (or about to) but can be refreshed
+                if interactive:
+                    print("⟳ Refreshing expired token...")
+                try:
+                    from google.auth.transport.requests import Request
+
+                    creds.refresh(Request())
+                    self.refreshes += 1
+                    result = "refreshed"
+                    if interactive:
+                        print("✓ Token refreshed successfully")
+                except Exception as e:
+                    if not interactive:
+                        raise
+                    print(f"⚠ Token refresh failed: {e}")
+                    print("→ Generating new token...")
+                    creds = self._generate_new_token()
+                    result = "authorized"
+                self._save_token(creds, verbose=interactive)
+            elif interactive:
+                # No valid credentials, need to generate new token
+                creds = self._generate_new_token()
+                result = "authorized"
+                self._save_token(creds)
+            else:
+                return
+            self._adopt(creds)
+        metrics.inc("gmail_token_renewals_total", mode=mode, result=result)
+        self._schedule_refresh()
+    
+    def _adopt(self, creds):
+        """Make creds current, in place when possible so cached services see the new token"""
+        current = self.creds
+        if current is None or current is creds or current.refresh_token != creds.refresh_token:
+            self.creds = creds
+        else:
+            current.token = creds.token
+            current.expiry = creds.expiry
+    
+    def _schedule_refresh(self):
+        """Refresh in the background refresh_margin seconds before the token expires"""
+        if self._timer is not None:
+            self._timer.cancel()
+        left = _seconds_left(self.creds)
+        if left is None or not self.creds.refresh_token:
+            return
+        # Short-lived tokens (shorter than the margin) refresh halfway through
+        delay = max(left - self.refresh_margin, left / 2, 1.0)
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+    
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                self._renew("background")
+        except Exception as e:
+            # Keep the current token; the next send refreshes it if it expires first
+            print(f"⚠ Background token refresh failed: {e}")
+            metrics.inc("gmail_token_renewals_total", mode="background", result="error")
+            self._timer = threading.Timer(TOKEN_RETRY_DELAY, self._background_refresh)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def close(self):
+        """Stop background refreshes"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+    
+    def _load_token(self, verbose=True):
+        """
+        Load the token file.
+        
+        Returns:
+            Credentials, or None if the file is missing or unreadable
+        """
+        if not os.path.exists(self.token_file):
+            return None
+        from google.oauth2.credentials import Credentials
+
+        try:
+            creds = Credentials.from_authorized_user_file(self.token_file, SCOPES)
+        except Exception as e:
+            print(f"⚠ Error loading token: {e}")
+            return None
+        if verbose:
+            print(f"✓ Loaded existing token from {self.token_file}")
+        return creds
+    
+    def _generate_new_token(self):
+        """
+        Generate a new token via OAuth flow.
+        Opens browser for user authorization.
+        """
+        if not os.path.exists(self.credentials_file):
+            raise FileNotFoundError(
+                f"\n{'='*60}\n"
+                f"ERROR: {self.credentials_file} not found!\n\n"
+                f"To fix this:\n"
+                f"1. Go to Google Cloud Console (console.cloud.google.com)\n"
+                f"2. Enable Gmail API for your project\n"
+                f"3. Create OAuth 2.0 credentials (Desktop app)\n"
+                f"4. Download the credentials JSON file\n"
+                f"5. Save it as '{self.credentials_file}' in this directory\n"
+                f"{'='*60}\n"
+            )
+        
+        print("\n" + "="*60)
+        print("🔐 FIRST TIME SETUP - Gmail OAuth Authorization")
+        print("="*60)
+        print(f"→ Opening browser for authorization...")
+        print(f"→ Please log in and grant access to send emails")
+        print(f"→ This only needs to be done once\n")
+        
+        try:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
+            flow = InstalledAppFlow.from_client_secrets_file(
+                self.credentials_file, 
+                SCOPES
+            )
+            creds = flow.run_local_server(port=0)
+            print("\n✓ Authorization successful!")
+            return creds
+        except Exception as e:
+            print(f"\n✗ Authorization failed: {e}")
+            raise
+    
+    def _save_token(self, creds, verbose=True):
+        """
+        Save credentials to the token file.
+        Writes a temporary file and renames it over token.json, so readers
+        never see a partial file; the caller holds the token file lock.
+        """
+        try:
+            directory = os.path.dirname(os.path.abspath(self.token_file))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(creds.to_json())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.token_file)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            if verbose:
+                print(f"✓ Token saved to {self.token_file}")
+        except Exception as e:
+            print(f"⚠ Failed to save token: {e}")
+    
+    def is_authenticated(self):
+        """Check if user is already authenticated"""
+        return os.path.exists(self.token_file)
+
+
+# Singleton instance for easy access
+_auth_manager = None
+
+def get_auth_manager(credentials_file="credentials.json", token_file="token.json"):
+    """
+    Get or create the global auth manager instance.
+    
+    Args:
+        credentials_file: Path to credentials.json
+        token_file: Path to token.json
+    
+    Returns:
+        GmailAuthManager instance
+    """
+    global _auth_manager
+    if _auth_manager is None:
+        _auth_manager = GmailAuthManager(credentials_file, token_file)
     return _auth_manager
\ No newline at end of file
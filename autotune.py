@@ -0,0 +1,243 @@
+"""
+Hardware auto-tuning for llama.cpp runtime parameters.
+
+Sweeps n_threads, n_threads_batch, n_batch, n_ctx, use_mmap and use_mlock
+on this machine (one parameter at a time, keeping the best value of the
+others), runs a fixed set of agent prompts for every candidate, and
+measures prompt-eval and generation tokens/sec. The fastest settings are
+saved as a JSON profile that agents_email_agent picks up automatically
+for the same model file on the same host.
+
+Usage:
+    python autotune.py                       # tune EMAIL_AGENT_MODEL_PATH
+    python autotune.py --quick               # fewer candidates
+    python autotune.py --profile my.json --gen-tokens 64
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+
+PROFILE_PATH = os.environ.get("EMAIL_AGENT_TUNING_PROFILE", "llama_profile.json")
+TUNABLE_PARAMS = ("n_threads", "n_threads_batch", "n_batch", "n_ctx", "use_mmap", "use_mlock")
+
+SAMPLE_REQUESTS = [
+    ("john.smith@example.com", "Remind John about the project meeting on Friday at 10am"),
+    ("sarah@company.com", "Ask Sarah for the Q4 report before the end of the week and mention "
+                          "that the board meeting was moved to Monday morning"),
+    ("support@service.com", "Report that I cannot log in to my account since yesterday"),
+]
+
+
+# ============================================================
+# Profile storage
+# ============================================================
+
+def host_signature():
+    """What a profile is only valid for: CPU count, architecture, OS"""
+    return {"cpu_count": os.cpu_count(), "machine": platform.machine(), "system": platform.system()}
+
+
+def model_signature(model_path):
+    try:
+        size = os.path.getsize(model_path)
+    except OSError:
+        size = None
+    return {"file": os.path.basename(model_path), "size": size}
+
+
+def load_profile(model_path, path=PROFILE_PATH):
+    """
+    Return the tuned Llama parameters for model_path on this host, or {}
+    if there is no profile or it was made for another model or machine.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if profile.get("host") != host_signature() or profile.get("model") != model_signature(model_path):
+        return {}
+    params = profile.get("params", {})
+    return {key: params[key] for key in TUNABLE_PARAMS if key in params}
+
+
+def save_profile(model_path, params, results, path=PROFILE_PATH):
+    profile = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "host": host_signature(),
+        "model": model_signature(model_path),
+        "params": {key: params[key] for key in TUNABLE_PARAMS if key in params},
+        "results": results,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ============================================================
+# Measurement
+# ============================================================
+
+def sample_prompts():
+    """The agent's real prompt shapes (subject, body, single-pass draft)"""
+    from agents_email_agent import BODY_PROMPT_PREFIX, DRAFT_PROMPT_PREFIX, SUBJECT_PROMPT_PREFIX
+
+    prompts = []
+    for receiver, request in SAMPLE_REQUESTS:
+        name = receiver.split("@")[0].split(".")[0].title()
+        prompts.append(SUBJECT_PROMPT_PREFIX + f" {request}\nJSON:\n")
+        prompts.append(BODY_PROMPT_PREFIX + f"REQUEST: {request}\nSUBJECT: Follow Up\n"
+                       f"RECEIVER: {name}\nGREETING: Dear {name},\n\nEMAIL:")
+        prompts.append(DRAFT_PROMPT_PREFIX + f"REQUEST: {request}\nRECEIVER: {name}\n"
+                       f"GREETING: Dear {name},\n\nJSON:")
+    return prompts
+
+
+def measure(model_path, params, prompts, gen_tokens):
+    """
+    Load the model with params and run every prompt from a clean context.
+
+    Returns:
+        dict with prompt_tps, gen_tps, seconds_per_email and load_s
+    """
+    from llama_cpp import Llama
+
+    started = time.perf_counter()
+    llm = Llama(model_path=model_path, verbose=False, **params)
+    load_s = time.perf_counter() - started
+
+    prompt_tokens = prompt_time = gen_count = gen_time = 0
+    try:
+        for prompt in prompts:
+            llm.reset()  # no KV reuse between prompts: measure full prompt eval
+            n_prompt = len(llm.tokenize(prompt.encode("utf-8")))
+            started = time.perf_counter()
+            first = None
+            tokens = 0
+            for _ in llm(prompt, max_tokens=gen_tokens, temperature=0.0, stream=True):
+                if first is None:
+                    first = time.perf_counter()
+                tokens += 1
+            finished = time.perf_counter()
+            prompt_tokens += n_prompt
+            prompt_time += (first or finished) - started
+            if tokens > 1:
+                gen_count += tokens - 1
+                gen_time += finished - first
+    finally:
+        if hasattr(llm, "close"):
+            llm.close()
+
+    prompt_tps = prompt_tokens / prompt_time if prompt_time else 0.0
+    gen_tps = gen_count / gen_time if gen_time else 0.0
+    # Time of one typical email: ~1 prompt of average length + a 150-token body
+    avg_prompt = prompt_tokens / len(prompts)
+    seconds = (avg_prompt / prompt_tps if prompt_tps else float("inf")) + (150 / gen_tps if gen_tps else float("inf"))
+    return {
+        "prompt_tps": round(prompt_tps, 1),
+        "gen_tps": round(gen_tps, 2),
+        "seconds_per_email": round(seconds, 3),
+        "load_s": round(load_s, 2),
+    }
+
+
+def candidates(base_ctx, quick=False):
+    """Values to try for each parameter on this host"""
+    cpus = os.cpu_count() or 1
+    threads = sorted({max(1, cpus * f // 4) for f in (1, 2, 3, 4)} | ({2, 4, 6, 8} if not quick else set()))
+    threads = [t for t in threads if t <= cpus]
+    return {
+        "n_threads": threads,
+        "n_threads_batch": sorted({cpus, max(1, cpus // 2)}),
+        "n_batch": [256, 512] if quick else [128, 256, 512, 1024],
+        # Only contexts large enough for the agent's prompts
+        "n_ctx": sorted({2048, base_ctx}) if base_ctx >= 2048 else [base_ctx],
+        "use_mmap": [True, False],
+        "use_mlock": [False] if quick else [False, True],
+    }
+
+
+def tune(model_path, base_params, quick=False, gen_tokens=32):
+    """
+    Coordinate-descent sweep: try every candidate of one parameter with the
+    best values found so far for the others.
+
+    Returns:
+        (best params, best result, list of (params, result) for every run)
+    """
+    prompts = sample_prompts()
+    best = {key: base_params[key] for key in base_params if key != "verbose"}
+    best.setdefault("n_threads_batch", os.cpu_count() or 1)
+    best.setdefault("n_batch", 512)
+    best.setdefault("use_mmap", True)
+    best.setdefault("use_mlock", False)
+
+    runs = []
+    best_result = measure(model_path, best, prompts, gen_tokens)
+    runs.append((dict(best), best_result))
+    print(f"  baseline {_describe(best)}: {_summary(best_result)}")
+
+    for key, values in candidates(best["n_ctx"], quick).items():
+        tried = {best[key]}
+        for value in values:
+            if value in tried:
+                continue
+            tried.add(value)
+            trial = {**best, key: value}
+            try:
+                result = measure(model_path, trial, prompts, gen_tokens)
+            except Exception as e:
+                print(f"  {key}={value}: ✗ {e}")
+                continue
+            runs.append((trial, result))
+            # Keep the configured context size unless a change is clearly faster
+            margin = 0.97 if key == "n_ctx" else 1.0
+            better = result["seconds_per_email"] < best_result["seconds_per_email"] * margin
+            print(f"  {key}={value}: {_summary(result)}{'  ← best so far' if better else ''}")
+            if better:
+                best, best_result = trial, result
+    return best, best_result, runs
+
+
+def _describe(params):
+    return ", ".join(f"{key}={params[key]}" for key in TUNABLE_PARAMS if key in params)
+
+
+def _summary(result):
+    return (f"prompt {result['prompt_tps']:.0f} tok/s, gen {result['gen_tps']:.1f} tok/s, "
+            f"{result['seconds_per_email']:.2f} s/email")
+
+
+def main(argv=None):
+    from agents_email_agent import MODEL_PARAMS, MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Tune llama.cpp runtime parameters for this machine")
+    parser.add_argument("--model", default=MODEL_PATH, help="GGUF model file")
+    parser.add_argument("--profile", default=PROFILE_PATH, help="Where to save the tuned profile")
+    parser.add_argument("--gen-tokens", type=int, default=32, help="Tokens generated per prompt")
+    parser.add_argument("--quick", action="store_true", help="Try fewer candidates")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.model):
+        print(f"✗ Model not found: {args.model}")
+        return 1
+
+    print("=" * 60)
+    print(f"🔧 AUTO-TUNING llama.cpp on {os.cpu_count()} CPUs ({platform.machine()})")
+    print("=" * 60)
+    started = time.perf_counter()
+    best, result, runs = tune(args.model, MODEL_PARAMS, quick=args.quick, gen_tokens=args.gen_tokens)
+    save_profile(args.model, best, {**result, "runs": len(runs)}, args.profile)
+    print()
+    print(f"✓ Best: {_describe(best)}")
+    print(f"  {_summary(result)}  ({len(runs)} runs in {time.perf_counter() - started:.0f} s)")
+    print(f"✓ Profile saved to {args.profile}; the agent uses it automatically")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
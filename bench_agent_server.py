@@ -0,0 +1,71 @@
+"""
+Benchmark: agent server confirmations racing in-flight model jobs.
+
+Every session sends "yes" while its "regenerate" is still running on the
+fake model (per-call latency standing in for llama.cpp). The confirmation
+must wait for the regenerate instead of sending and then having the
+regenerated draft written back over the reset session. Reports how long
+"yes" waited and checks that each session sent exactly once and ended
+with no pending draft.
+
+Usage:
+    python bench_agent_server.py
+    python bench_agent_server.py --sessions 8 --latency 0.5
+"""
+
+import argparse
+import threading
+import time
+
+from fake_model import FakeModel
+
+
+def main(argv=None):
+    from agent_server import AgentServer
+    from agents_email_agent import EmailAgent
+    from campaign_runner import percentile
+
+    parser = argparse.ArgumentParser(description="Check that confirmations wait for in-flight session jobs")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake model call")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    sent = []
+    sent_lock = threading.Lock()
+
+    def send(to, subject, body):
+        with sent_lock:
+            sent.append(to)
+        return f"✓ Email sent successfully to {to}"
+
+    app = AgentServer(model=FakeModel(latency=args.latency), send_func=send, workers=args.workers)
+    sessions = [app.sessions.create() for _ in range(args.sessions)]
+    for i, session in enumerate(sessions):
+        app.message(session, f"Send user{i}@example.com a note about the launch")
+
+    print("=" * 60)
+    print(f"📊 AGENT SERVER CONFIRM BENCHMARK ({args.sessions} sessions, {args.latency:.2f} s per model call)")
+    print("=" * 60)
+    waits, statuses = [], []
+    for session in sessions:
+        regenerate = threading.Thread(target=app.confirm, args=(session, "regenerate"))
+        regenerate.start()
+        time.sleep(args.latency / 4)  # the regenerate is now on the model
+        started = time.perf_counter()
+        statuses.append(app.confirm(session, "yes")["status"])
+        waits.append((time.perf_counter() - started) * 1000)
+        regenerate.join()
+
+    receiver = EmailAgent.STATE_FIELDS.index("current_receiver")
+    pending = sum(session.state[receiver] is not None for session in sessions)
+    ok = (statuses == ["sent"] * args.sessions and pending == 0
+          and sorted(sent) == sorted(f"user{i}@example.com" for i in range(args.sessions)))
+    print(f"\"yes\" during regenerate  p50 {percentile(waits, 50):7.1f} ms  p99 {percentile(waits, 99):7.1f} ms")
+    print(f"emails sent {len(sent)}/{args.sessions}, sessions left with a pending draft {pending}")
+    print("✓ Confirmations wait for in-flight jobs" if ok else "⚠ Confirmation raced an in-flight job")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
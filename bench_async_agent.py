@@ -0,0 +1,70 @@
+"""
+Load test: many concurrent AsyncEmailAgent sessions in one event loop,
+with a fake model and a fake (slow) Gmail send.
+
+Usage:
+    python bench_async_agent.py --sessions 300 --model-latency 0.005 --send-latency 0.2
+"""
+
+import argparse
+import asyncio
+import time
+
+from async_email_agent import AsyncEmailAgent, ModelQueue
+from campaign_runner import percentile
+from fake_model import FakeModel
+
+
+def _fake_send(latency):
+    def send(to, subject, body):
+        time.sleep(latency)  # blocking, like the Gmail client
+        return f"✓ Email sent successfully to {to} (Message ID: fake)"
+    return send
+
+
+async def _session(i, model, model_queue, send, latencies):
+    agent = AsyncEmailAgent(model_queue=model_queue, model=model, send_func=send)
+    started = time.perf_counter()
+    response = await agent.process_step(f"Email user{i}@example.com about the meeting on day {i}")
+    assert response["status"] == "confirmation", response
+    result = await agent.handle_confirmation("yes")
+    assert result["status"] == "sent", result
+    latencies.append(time.perf_counter() - started)
+
+
+async def _run(args):
+    model = FakeModel(latency=args.model_latency)
+    model_queue = ModelQueue(workers=args.model_workers, max_pending=args.max_pending)
+    send = _fake_send(args.send_latency)
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _session(i, model, model_queue, send, latencies) for i in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - started
+    model_queue.shutdown()
+    return elapsed, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent AsyncEmailAgent load test")
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--model-latency", type=float, default=0.005, help="Seconds per model call")
+    parser.add_argument("--send-latency", type=float, default=0.2, help="Seconds per Gmail send")
+    parser.add_argument("--model-workers", type=int, default=1)
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    elapsed, latencies = asyncio.run(_run(args))
+
+    print("=" * 60)
+    print(f"📊 ASYNC AGENT LOAD TEST ({args.sessions} sessions)")
+    print("=" * 60)
+    print(f"Total time: {elapsed:.2f} s ({args.sessions / elapsed:.1f} emails/sec)")
+    for pct in (50, 90, 95, 99):
+        print(f"p{pct}: {percentile(latencies, pct) * 1000:8.1f} ms")
+    print(f"max: {max(latencies) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Stress test: several processes sending through one shared token.json while
+short-lived access tokens expire and are refreshed in the background.
+
+Every process runs its own GmailAuthManager against the local fake token
+endpoint and fake Gmail API. Checks that
+  - sends never wait on auth (get_credentials latency per send),
+  - the token endpoint is hit about once per token lifetime, not once per
+    process (the others adopt the refreshed token from token.json),
+  - no send goes out with an expired token,
+  - token.json is never seen half-written by a concurrent reader.
+
+Token lifetimes are compressed (seconds instead of an hour), so google-auth's
+expiry skew is shortened to match inside the child processes, which are also
+pointed at the fake token endpoint (google-auth ignores token.json's
+token_uri).
+
+Usage:
+    python bench_auth.py --processes 4 --duration 20 --lifetime 6
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from campaign_runner import percentile
+from fake_gmail_api import FakeGmailServer
+
+
+def _write_seed_token(path, token_uri):
+    """An already-expired token that can be refreshed against token_uri"""
+    expiry = datetime.now(timezone.utc) - timedelta(seconds=1)
+    with open(path, "w") as f:
+        json.dump({
+            "token": "seed-token", "refresh_token": "bench-refresh-token",
+            "token_uri": token_uri, "client_id": "bench-client", "client_secret": "bench-secret",
+            "scopes": ["https://www.googleapis.com/auth/gmail.send"],
+            "expiry": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }, f)
+
+
+def _child(token_file, url, token_uri, args, results):
+    import google.auth._helpers
+    import google.oauth2.credentials
+
+    from auth_manager import GmailAuthManager
+    from tools_send_email_gmail import get_gmail_service, send_message
+
+    google.auth._helpers.REFRESH_THRESHOLD = timedelta(seconds=args.skew)
+    google.oauth2.credentials._GOOGLE_OAUTH2_TOKEN_ENDPOINT = token_uri
+    manager = GmailAuthManager("credentials.json", token_file, refresh_margin=args.margin)
+    manager.get_credentials()  # cold start: load (or refresh) once before timing
+    warm_refreshes = manager.refreshes
+
+    auth_us, sends, failures = [], 0, 0
+    deadline = time.monotonic() + args.duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        creds = manager.get_credentials()
+        auth_us.append((time.perf_counter() - started) * 1e6)
+        try:
+            send_message(get_gmail_service(creds, api_endpoint=url), "bench@example.com", "Auth", "Body")
+            sends += 1
+        except Exception:
+            failures += 1
+        time.sleep(args.interval)
+    manager.close()
+    results.put({"auth_us": auth_us, "sends": sends, "failures": failures,
+                 "refreshes": manager.refreshes, "warm_refreshes": warm_refreshes})
+
+
+def _watch_token_file(path, stop, counts):
+    """Re-read token.json as fast as possible, counting reads that do not parse"""
+    while not stop.is_set():
+        try:
+            with open(path) as f:
+                json.load(f)
+            counts["reads"] += 1
+        except (OSError, ValueError):
+            counts["torn"] += 1
+
+
+def _reload_cost(token_file, reads=200):
+    """Per-call cost of the old behaviour: re-reading token.json on every send"""
+    from google.oauth2.credentials import Credentials
+
+    started = time.perf_counter()
+    for _ in range(reads):
+        Credentials.from_authorized_user_file(token_file)
+    return (time.perf_counter() - started) / reads * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress-test shared token refresh across processes")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of sending per process")
+    parser.add_argument("--lifetime", type=int, default=6, help="Access token lifetime (seconds)")
+    parser.add_argument("--margin", type=float, default=3.0, help="Refresh this many seconds before expiry")
+    parser.add_argument("--skew", type=float, default=1.0, help="google-auth expiry skew (seconds)")
+    parser.add_argument("--interval", type=float, default=0.01, help="Pause between sends")
+    args = parser.parse_args(argv)
+
+    ctx = multiprocessing.get_context("spawn")
+    with FakeGmailServer(token_lifetime=args.lifetime) as server, tempfile.TemporaryDirectory() as tmp:
+        token_file = os.path.join(tmp, "token.json")
+        _write_seed_token(token_file, server.token_uri)
+        print("=" * 60)
+        print(f"📊 AUTH STRESS TEST ({args.processes} processes, {args.duration:.0f} s, "
+              f"{args.lifetime} s tokens)")
+        print("=" * 60)
+
+        stop = threading.Event()
+        counts = {"reads": 0, "torn": 0}
+        watcher = threading.Thread(target=_watch_token_file, args=(token_file, stop, counts), daemon=True)
+        watcher.start()
+
+        results = ctx.Queue()
+        child_args = (token_file, server.url, server.token_uri, args, results)
+        children = [ctx.Process(target=_child, args=child_args) for _ in range(args.processes)]
+        for child in children:
+            child.start()
+        reports = [results.get(timeout=args.duration + 120) for _ in children]
+        for child in children:
+            child.join()
+        stop.set()
+        watcher.join()
+
+        auth_us = [us for report in reports for us in report["auth_us"]]
+        sends = sum(report["sends"] for report in reports)
+        refreshes = sum(report["refreshes"] for report in reports)
+        warm = sum(report["warm_refreshes"] for report in reports)
+        # One cold-start refresh, then one per (lifetime - margin) window
+        expected = 1 + args.duration / max(args.lifetime - args.margin, args.lifetime / 2)
+        stats = server.stats
+        print(f"sends                 {sends:8d}  ({sum(r['failures'] for r in reports)} failed)")
+        print(f"auth per send         p50 {percentile(auth_us, 50):6.1f} µs  p99 {percentile(auth_us, 99):6.1f} µs  "
+              f"max {max(auth_us):8.1f} µs")
+        print(f"re-read token.json    {_reload_cost(token_file):8.1f} µs per send (previous behaviour)")
+        print(f"token endpoint calls  {stats['token_refreshes']:8d}  (expected ~{expected:.0f}; "
+              f"{warm} at cold start, {refreshes - warm} in the background)")
+        print(f"expired-token sends   {stats['expired_tokens']:8d}")
+        print(f"token.json reads      {counts['reads']:8d}  ({counts['torn']} unreadable)")
+        ok = stats["expired_tokens"] == 0 and counts["torn"] == 0 and stats["token_refreshes"] <= expected + 1
+        print("✓ Shared token refresh is consistent" if ok else "⚠ Shared token refresh check failed")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,163 @@
+"""
+Microbenchmarks for the post-processing engine in text_cleaning.py.
+
+Checks that clean_email_body()/clean_response() match the original regex
+chains (kept below as reference implementations) on a randomized corpus,
+then times both on typical, large and adversarial inputs, including
+"Email.*?:.*?\\n"-style catastrophic backtracking cases.
+
+Usage:
+    python bench_cleaning.py --fuzz 20000
+"""
+
+import argparse
+import random
+import re
+import time
+
+from text_cleaning import BodyStreamFilter, clean_email_body, clean_response
+
+
+# ============================================================
+# Reference implementations (original EmailAgent code)
+# ============================================================
+
+def reference_clean_response(text):
+    if not text:
+        return ""
+    text = re.sub(r'```.*?```', '', text, flags=re.DOTALL)
+    text = re.sub(r'def\s+\w+\(.*?\):', '', text)
+    text = re.sub(r'#.*', '', text)
+    text = ' '.join(text.split())
+    return text.strip()
+
+
+def reference_clean_email_body(text, receiver_name):
+    if not text:
+        return ""
+    text = re.sub(r'^Subject:.*?\n', '', text, flags=re.IGNORECASE | re.MULTILINE)
+    text = re.sub(r'^Re:.*?\n', '', text, flags=re.IGNORECASE | re.MULTILINE)
+    text = re.sub(r'\[.*?\]', '', text)
+    text = re.sub(r'Your Contact Information.*?$', '', text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r'Email.*?:.*?\n', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'Phone.*?:.*?\n', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'Website.*?:.*?\n', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^Your Job Title.*?\n', '', text, flags=re.IGNORECASE | re.MULTILINE)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = text.strip()
+    has_greeting = bool(re.search(r'^(Dear|Hello|Hi|Greetings)\s+\w+', text, re.IGNORECASE))
+    if not has_greeting:
+        text = f"Dear {receiver_name},\n\n{text}"
+    has_closing = bool(re.search(r'(Best regards|Regards|Sincerely|Thank you|Best)\s*$', text, re.IGNORECASE | re.MULTILINE))
+    if not has_closing:
+        if not text.endswith(('.', '!', '?')):
+            text += '.'
+        text += "\n\nBest regards"
+    lines = text.split('\n')
+    cleaned_lines = [line for line in lines if not re.match(r'^[-=_]{3,}$', line.strip())]
+    text = '\n'.join(cleaned_lines)
+    lines = text.split('\n')
+    final_lines = []
+    prev_line = None
+    for line in lines:
+        if line.strip() != prev_line:
+            final_lines.append(line)
+        prev_line = line.strip()
+    text = '\n'.join(final_lines)
+    return text.strip()
+
+
+# ============================================================
+# Corpus
+# ============================================================
+
+FRAGMENTS = [
+    "Dear John,", "Hello Sarah", "hi", "Subject: Meeting", "subject:x", "Re: hello", "RE:",
+    "[Your Name]", "[", "]", "[a [b] c]", "Your Contact Information", "your contact information:",
+    "Email: me@x.com", "email", "EMAIL me", ":", "Phone: 555", "phone", "Website: x.com",
+    "website", "Your Job Title", "your job title: CEO", "---", "===", "___", "-=_", "- - -",
+    "Best regards", "Regards", "Sincerely", "Thank you", "Best", "best regards  ",
+    "I wanted to follow up on the meeting.", "Please confirm.", "Thanks!", "ok?",
+    "```code```", "```", "def foo(x):", "def bar(", "):", "# comment", "#", "  ", "\t",
+    "\n", "\n", "\n\n", "\n\n\n\n", "\r\n", "é", "İ", "ß", "Ⅻ",
+]
+
+
+def random_text(rng, pieces=25):
+    return "".join(rng.choice(FRAGMENTS) + rng.choice(["", " ", "\n", ""]) for _ in range(rng.randint(0, pieces)))
+
+
+TYPICAL = (
+    "Subject: Project meeting\n\nDear John,\n\nI wanted to confirm our project meeting "
+    "scheduled for tomorrow [Time]. Please let me know if the time still works for you.\n\n"
+    "Best regards\n[Your Name]\nYour Job Title\nEmail: me@example.com\nPhone: 555-0100\n"
+)
+
+ADVERSARIAL = {
+    "email without colon (1 line, 20k chars)": "email " * 3500 + "\n",
+    "phone without colon (1 line, 20k chars)": "phone " * 3500 + "\n",
+    "email, no newline (20k chars)": "email: " + "x" * 20000,
+    "brackets never closed": "[" * 20000 + "\n",
+    "def without close (20k chars)": "def f(" * 3500,
+    "many short lines": "Line of text\n" * 5000,
+    "many duplicates": "Same line\n" * 5000,
+}
+
+
+def _time(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def check_equivalence(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        text = random_text(rng)
+        expected = reference_clean_email_body(text, "John")
+        actual = clean_email_body(text, "John")
+        if expected != actual:
+            raise AssertionError(f"clean_email_body mismatch for {text!r}:\n{expected!r}\n{actual!r}")
+        if reference_clean_response(text) != clean_response(text):
+            raise AssertionError(f"clean_response mismatch for {text!r}")
+    return count
+
+
+def stream_through_filter(text, piece_size=3):
+    out = []
+    stream = BodyStreamFilter(out.append)
+    for i in range(0, len(text), piece_size):
+        stream.feed(text[i:i + piece_size])
+    stream.flush()
+    return "".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark email body post-processing")
+    parser.add_argument("--fuzz", type=int, default=20000, help="Random inputs to compare")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("📊 POST-PROCESSING BENCHMARK")
+    print("=" * 60)
+    print(f"✓ Identical output on {check_equivalence(args.fuzz)} random inputs")
+
+    cases = {"typical body": TYPICAL, "large body (x500)": TYPICAL * 500}
+    cases.update(ADVERSARIAL)
+    print(f"{'case':<42} {'original':>10} {'compiled':>10}")
+    for name, text in cases.items():
+        before = _time(reference_clean_email_body, text, "John")
+        after = _time(clean_email_body, text, "John")
+        print(f"{name:<42} {before:8.2f}ms {after:8.2f}ms")
+    for name in ("typical body", "large body (x500)"):
+        print(f"{'stream filter: ' + name:<42} {'':>10} {_time(stream_through_filter, cases[name]):8.2f}ms")
+    before = _time(reference_clean_response, ADVERSARIAL["def without close (20k chars)"])
+    after = _time(clean_response, ADVERSARIAL["def without close (20k chars)"])
+    print(f"{'clean_response: def without close':<42} {before:8.2f}ms {after:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark: contact directory load time, lookup latency and incremental
+reload with a synthetic directory (100k contacts by default), and a check
+that surnames that are also ordinary words ("price list", "Friday
+meeting") do not pick a recipient the request never named.
+
+Usage:
+    python bench_contacts.py --contacts 100000 --lookups 20000
+"""
+
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+
+from campaign_runner import percentile
+from contacts import ContactDirectory
+
+FIRST_NAMES = ("Sarah John Michael Anna David Laura James Maria Robert Linda Thomas Emma Daniel Olivia "
+               "Peter Sophie Paul Julia Mark Chloe Kevin Nina Brian Clara Steven Alice").split()
+DEPARTMENTS = "Finance Sales Marketing Engineering Support Legal HR Operations Research Design".split()
+
+
+def write_contacts(path, count, seed=7):
+    """Write count synthetic contacts; returns the rows written"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        first = rng.choice(FIRST_NAMES)
+        last = f"{rng.choice(FIRST_NAMES)}son{i}"
+        company = f"company{i % 2000}"
+        rows.append({
+            "Name": f"{first} {last}",
+            "Email": f"{first.lower()}.{last.lower()}@{company}.com",
+            "Aliases": f"{first[:3]}{i}",
+            "Company": company.title(),
+            "Department": rng.choice(DEPARTMENTS),
+        })
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def _timed(func, items):
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        func(item)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+# (request, expected recipient or None) against SURNAME_CONTACTS
+SURNAME_CONTACTS = (("Grace Price", "grace.price@acme.com"), ("Bob Friday", "bob.friday@acme.com"))
+SURNAME_CASES = [
+    ("Send the updated price list to the team", None),
+    ("Remind everyone about the Friday meeting", None),
+    ("Email Grace about the price list", "grace.price@acme.com"),
+    ("Send the price list to Grace Price", "grace.price@acme.com"),
+    ("Tell Price the budget is approved", "grace.price@acme.com"),
+    ("Remind Bob about the Friday meeting", "bob.friday@acme.com"),
+]
+
+
+def check_surnames():
+    """Requests naming nobody ask for the receiver; names, full names and cued surnames resolve"""
+    from agents_email_agent import EmailAgent
+    from contacts import Contact
+    from fake_model import FakeModel
+
+    directory = ContactDirectory()
+    for name, email in SURNAME_CONTACTS:
+        directory.add(Contact(email, name))
+    ok = True
+    for text, expected in SURNAME_CASES:
+        contact, _ = directory.resolve(text)
+        got = contact.email if contact else None
+        ok = ok and got == expected
+        print(f"  {'✓' if got == expected else '✗'} {text!r} -> {got}")
+
+    # End to end: the agent asks, and a bare surname as the answer resolves
+    agent = EmailAgent(model=FakeModel(), contacts=directory, single_pass=False, semantic_cache=None)
+    asked = agent.process_step("Send the updated price list to the team")["status"] == "need_receiver"
+    answered = agent.process_step("Price")
+    named = answered.get("email_preview", {}).get("receiver") == "grace.price@acme.com"
+    print(f"  {'✓' if asked and named else '✗'} agent asks, then resolves the reply 'Price'")
+    return ok and asked and named
+
+
+def _line(label, samples):
+    print(f"{label:<28} p50 {percentile(samples, 50):8.1f} µs  p99 {percentile(samples, 99):8.1f} µs")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the contact directory")
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "contacts.csv")
+        rows = write_contacts(path, args.contacts)
+        print("=" * 60)
+        print(f"📊 CONTACT DIRECTORY BENCHMARK ({len(rows)} contacts)")
+        print("=" * 60)
+
+        started = time.perf_counter()
+        directory = ContactDirectory(path, check_interval=3600)
+        print(f"Initial load                 {(time.perf_counter() - started) * 1000:8.1f} ms  "
+              f"({directory.stats()['contact_tokens']} tokens)")
+
+        rng = random.Random(1)
+        sample = [rng.choice(rows) for _ in range(args.lookups)]
+        unique = [f"email {r['Aliases']} about the budget" for r in sample]
+        full = [f"remind {r['Name']} about the meeting on Friday" for r in sample]
+        by_dept = [f"email {r['Name'].split()[0]} from {r['Department'].lower()} at {r['Company']} "
+                   f"about the budget" for r in sample]
+        prefixes = [r["Name"][:3] + " " + r["Department"][:3] for r in sample]
+        _line("resolve(alias)", _timed(directory.resolve, unique))
+        _line("resolve(full name)", _timed(directory.resolve, full))
+        _line("resolve(first name + org)", _timed(directory.resolve, by_dept))
+        _line("search(prefixes)", _timed(directory.search, prefixes))
+
+        resolved = sum(directory.resolve(text)[0] is not None for text in full)
+        print(f"Full-name requests resolved  {resolved / len(full):8.1%}")
+
+        # Incremental reload: append rows, then rewrite one row in place
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            for i in range(100):
+                writer.writerow({"Name": f"Zelda Newhire{i}", "Email": f"zelda{i}@newco.com",
+                                 "Aliases": "", "Company": "Newco", "Department": "Finance"})
+        changed = directory.refresh()
+        print(f"Append 100 rows              {directory.last_reload_ms:8.1f} ms  ({changed} contacts indexed)")
+        assert directory.resolve("email Zelda Newhire7")[0].email == "zelda7@newco.com"
+
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text.replace(rows[0]["Name"], "Renamed Person", 1))
+        changed = directory.refresh()
+        print(f"Rewrite (1 row changed)      {directory.last_reload_ms:8.1f} ms  ({changed} contacts re-indexed)")
+        assert directory.resolve("email Renamed Person")[0].email == rows[0]["Email"]
+
+        started = time.perf_counter()
+        ContactDirectory(path, check_interval=3600)
+        print(f"Full reload (for comparison) {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+    print("Surname collisions:")
+    ok = check_surnames()
+    print("✓ Only named recipients resolved" if ok else "⚠ Surname collision check failed")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
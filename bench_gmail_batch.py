@@ -0,0 +1,82 @@
+"""
+Benchmark: messages/sec for one messages.send call per email versus
+send_emails_gmail_batch, against the local fake Gmail API.
+
+Usage:
+    python bench_gmail_batch.py --messages 500 --latency 0.02 --error-every 37
+"""
+
+import argparse
+import time
+
+from google.oauth2.credentials import Credentials
+
+from fake_gmail_api import FakeGmailServer
+from tools_send_email_gmail import (
+    build_raw_message,
+    get_gmail_service,
+    reset_gmail_service,
+    send_emails_gmail_batch,
+)
+
+
+def _messages(count):
+    return [
+        {"to": f"user{i}@example.com", "subject": f"Benchmark {i}", "body": f"Benchmark body {i}"}
+        for i in range(count)
+    ]
+
+
+def _run_per_call(server, creds, messages):
+    service = get_gmail_service(creds, api_endpoint=server.url)
+    sent = 0
+    for message in messages:
+        raw = build_raw_message(message["to"], message["subject"], message["body"])
+        try:
+            service.users().messages().send(userId="me", body={"raw": raw}).execute()
+            sent += 1
+        except Exception:
+            pass
+    return sent
+
+
+def _run_batch(server, creds, messages, batch_size):
+    results = send_emails_gmail_batch(
+        messages, batch_size=batch_size, backoff=0.0, creds=creds, api_endpoint=server.url
+    )
+    return sum(1 for r in results if r["status"] == "sent")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Gmail batch sending")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Simulated server round-trip delay in seconds")
+    parser.add_argument("--error-every", type=int, default=0,
+                        help="Inject a 503 on every Nth send")
+    args = parser.parse_args(argv)
+
+    creds = Credentials(token="bench-token")
+    messages = _messages(args.messages)
+
+    print("=" * 60)
+    print(f"📊 GMAIL BATCH BENCHMARK ({args.messages} messages, {args.latency * 1000:.0f} ms RTT)")
+    print("=" * 60)
+    with FakeGmailServer(latency=args.latency, error_every=args.error_every) as server:
+        for label, run in (
+            ("per-call send", lambda: _run_per_call(server, creds, messages)),
+            ("batch send", lambda: _run_batch(server, creds, messages, args.batch_size)),
+        ):
+            reset_gmail_service()
+            server.reset_stats()
+            started = time.perf_counter()
+            sent = run()
+            elapsed = time.perf_counter() - started
+            stats = server.stats
+            print(f"{label:<14} {sent / elapsed:9.1f} msg/sec  sent {sent}/{args.messages}  "
+                  f"{stats['requests']} HTTP requests  {stats['errors']} injected errors")
+
+
+if __name__ == "__main__":
+    main()
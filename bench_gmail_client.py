@@ -0,0 +1,66 @@
+"""
+Benchmark: per-send overhead of building the Gmail service every time
+versus reusing the cached keep-alive service.
+
+Runs entirely against fake_gmail_api.FakeGmailServer, no Google account needed.
+
+Usage:
+    python bench_gmail_client.py --sends 200
+"""
+
+import argparse
+import base64
+import time
+from email.mime.text import MIMEText
+
+from google.oauth2.credentials import Credentials
+
+from fake_gmail_api import FakeGmailServer
+from tools_send_email_gmail import build_gmail_service, get_gmail_service, reset_gmail_service
+
+
+def _raw_message(i):
+    msg = MIMEText(f"Benchmark body {i}")
+    msg["to"] = "bench@example.com"
+    msg["subject"] = f"Benchmark {i}"
+    return base64.urlsafe_b64encode(msg.as_bytes()).decode()
+
+
+def _run(server, creds, sends, cached):
+    server.reset_stats()
+    reset_gmail_service()
+    started = time.perf_counter()
+    for i in range(sends):
+        if cached:
+            service = get_gmail_service(creds, api_endpoint=server.url)
+        else:
+            service = build_gmail_service(creds, api_endpoint=server.url)
+        service.users().messages().send(userId="me", body={"raw": _raw_message(i)}).execute()
+    elapsed = time.perf_counter() - started
+    return elapsed, server.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Gmail service reuse")
+    parser.add_argument("--sends", type=int, default=200, help="Messages per run")
+    args = parser.parse_args(argv)
+
+    creds = Credentials(token="bench-token")
+
+    with FakeGmailServer() as server:
+        print("=" * 60)
+        print(f"📊 GMAIL CLIENT BENCHMARK ({args.sends} sends)")
+        print("=" * 60)
+        results = {}
+        for label, cached in (("build per send", False), ("cached service", True)):
+            elapsed, stats = _run(server, creds, args.sends, cached)
+            per_send = elapsed / args.sends * 1000
+            results[label] = per_send
+            print(f"{label:<16} {per_send:8.3f} ms/send  "
+                  f"{stats['connections']:4d} connections  {stats['requests']:4d} requests")
+        saved = results["build per send"] - results["cached service"]
+        print(f"Saved per send: {saved:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: mail merge (one draft, rendered per row) vs. drafting every
+recipient separately with campaign_runner.
+
+Uses the deterministic fake model with a per-call latency standing in for
+llama.cpp, so it needs no model file. Reports model calls and emails per
+minute for
+  - campaign_runner on a sample of rows (extrapolated),
+  - mail merge writing JSONL only,
+  - mail merge also queueing every email in an outbox (not sent),
+and checks that each merged email carries its own row's name and fields
+and that sentinels the model invents are left as written. A crash is
+simulated by cutting the output off mid-line after its rows were queued;
+the restarted merge must leave valid JSONL and queue nothing twice.
+
+Usage:
+    python bench_mail_merge.py
+    python bench_mail_merge.py --rows 100000 --latency 1.0
+"""
+
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+from fake_model import FakeModel
+
+REQUEST = "Tell {receiver_name} that the {plan} plan renews on {date} at the new price"
+PLANS = ("Basic", "Pro", "Team", "Enterprise")
+
+
+def _write_recipients(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["email", "plan", "date", "request"])
+        for i in range(rows):
+            writer.writerow([f"user{i}.last@example.com", PLANS[i % len(PLANS)], f"May {i % 28 + 1}",
+                             f"Tell the customer that the {PLANS[i % len(PLANS)]} plan renews on May {i % 28 + 1}"])
+
+
+def _check_output(path, rows):
+    """Every row rendered once, greeting its own receiver with its own fields"""
+    seen = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            i = record["row"]
+            if (record["receiver"] != f"user{i}.last@example.com"
+                    or not record["body"].startswith(f"Dear User{i},")
+                    or PLANS[i % len(PLANS)] not in record["subject"] + record["body"]):
+                return False
+            seen += 1
+    return seen == rows
+
+
+def _check_sentinels():
+    """Sentinels the model made up (never issued) stay as written instead of failing"""
+    from mail_merge import MergeTemplate, _restore_fields
+
+    names = ["receiver_name", "plan"]
+    body = _restore_fields("Dear Mergefield0,\n\nYour Mergefield1 plan {renews}; see Mergefield3.", names)
+    rendered = MergeTemplate("Subject", body).render({"receiver_name": "Ann", "plan": "Pro"})[1]
+    return rendered == "Dear Ann,\n\nYour Pro plan {renews}; see Mergefield3."
+
+
+def _check_resume(tmp, template, rows=1000):
+    """Restart after a crash that queued every row but left the output cut off mid-line"""
+    from mail_merge import run_merge
+    from outbox import Outbox
+
+    recipients = os.path.join(tmp, "resume.csv")
+    output = os.path.join(tmp, "resume.jsonl")
+    _write_recipients(recipients, rows)
+    outbox = Outbox(os.path.join(tmp, "resume.sqlite3"))
+    run_merge(recipients, output, template, outbox=outbox, batch_size=100, progress_every=0)
+    with open(output, "rb") as f:
+        data = f.read()
+    cut = data.index(b"\n", len(data) // 2) + 40  # a few rows lost, the next one half written
+    with open(output, "wb") as f:
+        f.write(data[:cut])
+    stats = run_merge(recipients, output, template, outbox=outbox, batch_size=100, progress_every=0)
+    queued = outbox.counts().get("pending", 0)
+    outbox.close()
+    return stats["rendered"] > 0 and queued == rows and _check_output(output, rows)
+
+
+def main(argv=None):
+    from agents_email_agent import EmailAgent
+    from campaign_runner import run_campaign
+    from mail_merge import _columns, draft_template, run_merge
+    from outbox import Outbox
+
+    parser = argparse.ArgumentParser(description="Benchmark mail merge against per-recipient drafting")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--sample", type=int, default=20, help="Rows drafted per recipient for the baseline")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per fake model call")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print(f"📊 MAIL MERGE BENCHMARK ({args.rows} recipients, {args.latency:.2f} s per model call)")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        recipients = os.path.join(tmp, "recipients.csv")
+        sample = os.path.join(tmp, "sample.csv")
+        _write_recipients(recipients, args.rows)
+        _write_recipients(sample, args.sample)
+
+        model = FakeModel(latency=args.latency)
+        stats = run_campaign(sample, os.path.join(tmp, "drafts.jsonl"), agent=EmailAgent(model=model),
+                             progress_every=0)
+        per_row = stats["elapsed_sec"] / args.sample
+        print(f"per recipient     {60 / per_row:12,.0f} emails/min  {model.calls / args.sample:.0f} model calls "
+              f"per email  ({args.rows * per_row / 60:.0f} min for {args.rows:,})")
+
+        ok = True
+        for label, use_outbox in (("merge → JSONL", False), ("merge → outbox", True)):
+            model = FakeModel(latency=args.latency)
+            output = os.path.join(tmp, f"merged-{use_outbox}.jsonl")
+            outbox = Outbox(os.path.join(tmp, "outbox.sqlite3")) if use_outbox else None
+            started = time.perf_counter()
+            template = draft_template(EmailAgent(model=model), REQUEST, _columns(recipients))
+            drafted = time.perf_counter()
+            stats = run_merge(recipients, output, template, outbox=outbox, progress_every=0)
+            elapsed = time.perf_counter() - started
+            if outbox is not None:
+                queued = outbox.counts().get("pending", 0)
+                outbox.close()
+                ok = ok and queued == args.rows
+            intact = _check_output(output, args.rows)
+            ok = ok and intact and stats["rendered"] == args.rows
+            print(f"{label:<17} {args.rows / elapsed * 60:12,.0f} emails/min  {model.calls} model calls total  "
+                  f"(draft {drafted - started:.2f} s, render {stats['rows_per_sec']:,.0f} rows/sec)"
+                  f"{'' if intact else '  ✗ wrong output'}")
+        resumed = _check_resume(tmp, template)
+    print(f"crash + restart    {'✓ valid JSONL, nothing queued twice' if resumed else '✗ duplicates or broken JSONL'}")
+    ok = ok and resumed
+    sentinels = _check_sentinels()
+    print(f"unknown merge field sentinels  {'✓ kept as written' if sentinels else '✗ not kept'}")
+    ok = ok and sentinels
+    print("✓ Every merged email matches its row" if ok else "⚠ Mail merge check failed")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+"""
+Benchmark: generation throughput of one in-process model vs. a pool of
+model worker processes, for the same number of concurrent requests.
+
+Every configuration uses the same total number of threads (split between
+its workers), so the comparison shows what parallel contexts buy over one
+context using all cores. Needs the real GGUF model (EMAIL_AGENT_MODEL_PATH).
+
+Usage:
+    python bench_model_pool.py --workers 1 2 4 --requests 16 --max-tokens 64
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from autotune import sample_prompts
+from campaign_runner import percentile
+
+
+def _run(model, prompts, requests, concurrency, max_tokens):
+    """Run requests generations from concurrency threads; returns (elapsed, latencies, tokens)"""
+    latencies = []
+    tokens = []
+    next_request = iter(range(requests))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(next_request, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            pieces = list(model.generate_stream(prompts[i % len(prompts)], max_tokens=max_tokens))
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                tokens.append(len(pieces))
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, sum(tokens)
+
+
+def main(argv=None):
+    from agents_email_agent import MODEL_PATH, LazyLlama, LocalModelWrapper
+    from model_pool import PooledModelWrapper
+
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark the model worker pool")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous requests")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=cpus, help="Total threads per configuration")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(MODEL_PATH):
+        print(f"✗ Model not found: {MODEL_PATH}")
+        return 1
+
+    prompts = sample_prompts()
+    print("=" * 60)
+    print(f"📊 MODEL POOL BENCHMARK ({args.requests} requests, {args.concurrency} concurrent, "
+          f"{args.max_tokens} tokens, {args.threads} threads)")
+    print("=" * 60)
+    baseline = None
+    for workers in args.workers:
+        threads = max(1, args.threads // workers)
+        if workers == 1:
+            label = "in-process"
+            model = LocalModelWrapper(LazyLlama(n_threads=threads, n_threads_batch=threads))
+        else:
+            label = f"{workers} workers"
+            model = PooledModelWrapper(workers, threads_per_worker=threads)
+        try:
+            model.warm_up()
+            elapsed, latencies, tokens = _run(model, prompts, args.requests, args.concurrency, args.max_tokens)
+        finally:
+            if hasattr(model, "close"):
+                model.close()
+            elif hasattr(model.llm, "unload"):
+                model.llm.unload()
+        throughput = args.requests / elapsed
+        baseline = baseline or throughput
+        latencies_ms = [l * 1000 for l in latencies]
+        print(f"{label:<12} {throughput:6.2f} req/s  {tokens / elapsed:7.1f} tok/s  "
+              f"p50 {percentile(latencies_ms, 50):8.0f} ms  p95 {percentile(latencies_ms, 95):8.0f} ms  "
+              f"({throughput / baseline:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+"""
+Benchmark: semantic draft cache lookups at scale, and hit rate on
+reworded requests.
+
+1. Fills a disk-backed cache with --entries random embeddings (4096 floats
+   each by default, the size of Mistral-7B's) and reports index size and
+   lookup latency, one request at a time and in batches.
+2. Stores one request of each pair in a fresh cache and looks the other up
+   for a different receiver. Reworded pairs should hit; pairs that differ
+   in substance (day, topic) should not. Uses a bag-of-words hashing
+   embedder, plus the GGUF embedder when a model file is available.
+
+Usage:
+    python bench_semantic_cache.py
+    python bench_semantic_cache.py --entries 100000 --dim 4096 --embed-model model.gguf
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from campaign_runner import percentile
+from semantic_cache import LlamaEmbedder, SemanticDraftCache
+
+# (stored request, reworded request): should be hits
+REWORDED = [
+    ("Remind {name} about the project meeting on Friday at 10am",
+     "Send {name} a reminder about Friday's 10am project meeting"),
+    ("Ask {name} for the Q4 report before the end of the week",
+     "Request the Q4 report from {name} by the end of this week"),
+    ("Tell {name} that the server maintenance is scheduled for Saturday night",
+     "Let {name} know the server maintenance is planned for Saturday night"),
+    ("Thank {name} for presenting at the quarterly all-hands meeting",
+     "Send {name} a thank you for presenting at the quarterly all-hands"),
+    ("Invite {name} to the team lunch tomorrow at noon",
+     "Invite {name} to tomorrow's team lunch at noon"),
+    ("Ask {name} to review the pull request for the login page",
+     "Ask {name} to please review the login page pull request"),
+]
+# (stored request, different request): should be misses
+DIFFERENT = [
+    ("Remind {name} about the project meeting on Friday at 10am",
+     "Remind {name} about the budget review on Monday at 3pm"),
+    ("Ask {name} for the Q4 report before the end of the week",
+     "Ask {name} to book a flight to Berlin for the conference"),
+    ("Tell {name} that the server maintenance is scheduled for Saturday night",
+     "Tell {name} that I will be on vacation next week"),
+    ("Invite {name} to the team lunch tomorrow at noon",
+     "Cancel the contract renewal with {name}'s company"),
+]
+
+
+class HashingEmbedder:
+    """Bag-of-words embedding: a fixed pseudo-random unit vector per word, summed and normalized"""
+
+    model_id = "hashing"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self._vectors = {}
+
+    def _word(self, word):
+        import numpy as np
+
+        if word not in self._vectors:
+            seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+            self._vectors[word] = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return self._vectors[word]
+
+    def __call__(self, texts):
+        import numpy as np
+
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                out[i] += self._word(word)
+            norm = np.linalg.norm(out[i])
+            if norm:
+                out[i] /= norm
+        return out
+
+
+class _QueryEmbedder:
+    """Returns the next precomputed query vectors (isolates search cost from embedding)"""
+
+    model_id = "bench"
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.position = 0
+
+    def __call__(self, texts):
+        batch = self.vectors[self.position:self.position + len(texts)]
+        self.position += len(texts)
+        return batch
+
+
+def _random_unit(rng, rows, dim):
+    import numpy as np
+
+    vectors = rng.standard_normal((rows, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def bench_scale(args, tmp):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    path = os.path.join(tmp, "scale")
+    queries = _random_unit(rng, args.queries + args.queries * args.batch, args.dim)
+    embedder = _QueryEmbedder(queries)
+    cache = SemanticDraftCache(embedder, path, threshold=args.threshold, max_entries=args.entries)
+
+    started = time.perf_counter()
+    chunk = 10000
+    for start in range(0, args.entries, chunk):
+        rows = min(chunk, args.entries - start)
+        items = [(f"request {start + i}", f"user{start + i}@example.com", "User", "Subject", "Dear User,\n\nBody")
+                 for i in range(rows)]
+        cache.add_many(items, embeddings=_random_unit(rng, rows, args.dim))
+    fill = time.perf_counter() - started
+    size = os.path.getsize(path + ".f32") + os.path.getsize(path + ".sqlite3")
+
+    single = []
+    for _ in range(args.queries):
+        started = time.perf_counter()
+        cache.lookup("query", "someone@example.com", "Someone")
+        single.append((time.perf_counter() - started) * 1000)
+    batched = []
+    for _ in range(args.queries):
+        items = [("query", "someone@example.com", "Someone")] * args.batch
+        started = time.perf_counter()
+        cache.lookup_many(items)
+        batched.append((time.perf_counter() - started) * 1000 / args.batch)
+    entries = len(cache)
+    cache.close()
+
+    print(f"entries           {entries:10,d}  ({args.dim} dims, filled in {fill:.1f} s)")
+    print(f"index size        {size / 1e6:10.1f} MB on disk")
+    print(f"lookup            p50 {percentile(single, 50):7.2f} ms  p99 {percentile(single, 99):7.2f} ms")
+    print(f"lookup x{args.batch:<3d}      p50 {percentile(batched, 50):7.2f} ms  "
+          f"p99 {percentile(batched, 99):7.2f} ms per request (batched search)")
+
+
+def bench_hit_rate(label, embed, threshold):
+    """Returns (hit rate on reworded pairs, false hit rate on different pairs)"""
+    rates = []
+    for pairs in (REWORDED, DIFFERENT):
+        cache = SemanticDraftCache(embed, None, threshold=threshold)
+        cache.add_many([(stored.format(name="John"), "john@example.com", "John",
+                         "Subject", f"Dear John,\n\nDraft {i}.\n\nBest regards")
+                        for i, (stored, _) in enumerate(pairs)])
+        results = cache.lookup_many([(other.format(name="Sarah"), "sarah@example.com", "Sarah")
+                                     for _, other in pairs])
+        hits = 0
+        for i, result in enumerate(results):
+            # A hit must return this pair's draft, re-personalized for Sarah
+            if result is not None and result[1] == f"Dear Sarah,\n\nDraft {i}.\n\nBest regards":
+                hits += 1
+        rates.append(hits / len(pairs))
+    print(f"{label:<17} reworded hits {rates[0]:5.0%}   false hits {rates[1]:5.0%}   (threshold {threshold})")
+    return rates
+
+
+def check_embeds_per_miss():
+    """A miss followed by storing its draft embeds the request once, not twice"""
+    texts = []
+
+    class CountingEmbedder(HashingEmbedder):
+        def __call__(self, batch):
+            texts.extend(batch)
+            return super().__call__(batch)
+
+    cache = SemanticDraftCache(CountingEmbedder(), None)
+    for i in range(10):
+        request = f"Ask John about item {i}"
+        cache.lookup(request, "john@example.com", "John")
+        cache.add(request, "john@example.com", "John", "Subject", "Dear John,\n\nBody")
+    per_miss = len(texts) / 10
+    print(f"embeddings        {per_miss:8.1f} per miss + store")
+    return per_miss == 1
+
+
+def main(argv=None):
+    from agents_email_agent import EMBED_MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Benchmark the semantic draft cache")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=4096, help="Embedding size (Mistral-7B: 4096)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--hash-threshold", type=float, default=0.7,
+                        help="Threshold for the bag-of-words embedder (its similarities run lower)")
+    parser.add_argument("--embed-model", default=EMBED_MODEL_PATH, help="GGUF model for the embedding hit-rate run")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("📊 SEMANTIC DRAFT CACHE BENCHMARK")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_scale(args, tmp)
+    ok = check_embeds_per_miss()
+    bench_hit_rate("bag-of-words", HashingEmbedder(), args.hash_threshold)
+    if args.embed_model and os.path.exists(args.embed_model):
+        embedder = LlamaEmbedder(args.embed_model)
+        embedder(["warm up"])
+        started = time.perf_counter()
+        embedder([stored.format(name="John") for stored, _ in REWORDED])
+        per_request = (time.perf_counter() - started) * 1000 / len(REWORDED)
+        bench_hit_rate(os.path.basename(args.embed_model)[:17], embedder, args.threshold)
+        print(f"embedding         {per_request:8.1f} ms per request (batched)")
+    else:
+        print(f"(no GGUF model at {args.embed_model}: skipped the llama.cpp embedding run)")
+    if not ok:
+        print("⚠ A missed request was embedded again when its draft was stored")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,70 @@
+"""
+Benchmark: model calls and wall time per email for the single-pass
+(grammar-constrained) draft versus the step-by-step subject/body path.
+
+Needs the GGUF model (EMAIL_AGENT_MODEL_PATH or MODEL_PATH).
+
+Usage:
+    python bench_single_pass.py --emails 10
+"""
+
+import argparse
+import time
+
+from agents_email_agent import EmailAgent, local_model
+
+REQUESTS = [
+    ("john.smith@example.com", "Remind John about the project meeting on Friday at 10am"),
+    ("sarah@company.com", "Ask Sarah for the Q4 report before the end of the week"),
+    ("mike@team.com", "Thank Mike for his help with the product launch"),
+    ("support@service.com", "Report that I cannot log in to my account since yesterday"),
+    ("anna.lee@example.org", "Invite Anna to the team lunch next Tuesday"),
+]
+
+
+class CountingModel:
+    """Pass-through model that counts generate/generate_json calls"""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def generate(self, prompt, max_tokens=512):
+        self.calls += 1
+        return self.model.generate(prompt, max_tokens=max_tokens)
+
+    def generate_json(self, prompt, grammar, max_tokens=512):
+        self.calls += 1
+        return self.model.generate_json(prompt, grammar, max_tokens=max_tokens)
+
+
+def _run(single_pass, emails):
+    model = CountingModel(local_model)
+    agent = EmailAgent(model=model, single_pass=single_pass)
+    started = time.perf_counter()
+    for i in range(emails):
+        receiver, request = REQUESTS[i % len(REQUESTS)]
+        agent._reset()
+        agent.current_receiver = receiver
+        agent.original_request = request
+        agent.draft_email()
+    elapsed = time.perf_counter() - started
+    return model.calls / emails, elapsed / emails
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark single-pass drafting")
+    parser.add_argument("--emails", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    local_model.warm_up()
+    print("=" * 60)
+    print(f"📊 SINGLE-PASS BENCHMARK ({args.emails} emails)")
+    print("=" * 60)
+    for label, single_pass in (("step-by-step", False), ("single-pass", True)):
+        calls, seconds = _run(single_pass, args.emails)
+        print(f"{label:<13} {calls:5.2f} model calls/email  {seconds:7.2f} s/email")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark: body generation with plain decoding vs. speculative decoding
+(prompt lookup, and optionally a small GGUF draft model) on a recorded set
+of requests.
+
+Runs at temperature 0 so every method must produce exactly the same
+bodies; reports tokens/sec, per-body latency and the draft acceptance
+rate. Needs the real GGUF model (EMAIL_AGENT_MODEL_PATH).
+
+Usage:
+    python bench_spec_decoding.py
+    python bench_spec_decoding.py --requests recorded.jsonl --draft-model tiny.gguf
+"""
+
+import argparse
+import json
+import os
+import time
+
+from campaign_runner import percentile
+
+# Recorded requests: {"to", "request", "subject"} per line in --requests files
+RECORDED_REQUESTS = [
+    {"to": "john.smith@example.com", "subject": "Project Meeting on Friday",
+     "request": "Remind John about the project meeting on Friday at 10am in room 4B"},
+    {"to": "sarah@company.com", "subject": "Q4 Report Before Board Meeting",
+     "request": "Ask Sarah for the Q4 report before the end of the week and mention that "
+                "the board meeting was moved to Monday morning"},
+    {"to": "support@service.com", "subject": "Cannot Log In to My Account",
+     "request": "Report that I cannot log in to my account since yesterday and that the "
+                "password reset email never arrives"},
+    {"to": "mike@team.com", "subject": "Lunch Tomorrow",
+     "request": "Remind Mike about tomorrow's team lunch at noon at the Italian place"},
+    {"to": "anna.lee@partner.org", "subject": "Contract Renewal Documents",
+     "request": "Tell Anna that the contract renewal documents are attached and ask her "
+                "to sign and return them by the 15th"},
+    {"to": "hr@company.com", "subject": "Vacation Request for August",
+     "request": "Request vacation from August 5 to August 16 and mention that Tom will "
+                "cover my projects while I am away"},
+]
+
+
+def load_requests(path):
+    if not path:
+        return RECORDED_REQUESTS
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def body_prompts(requests):
+    """The agent's body prompt for each recorded request"""
+    from agents_email_agent import BODY_PROMPT_PREFIX
+
+    prompts = []
+    for item in requests:
+        name = item["to"].split("@")[0].split(".")[0].title()
+        prompts.append(BODY_PROMPT_PREFIX + f"REQUEST: {item['request']}\nSUBJECT: {item['subject']}\n"
+                       f"RECEIVER: {name}\nGREETING: Dear {name},\n\nEMAIL:")
+    return prompts
+
+
+def _run(method, prompts, args):
+    from agents_email_agent import LazyLlama, LocalModelWrapper
+    from draft_models import SpeculativeDecoding
+
+    speculative = None
+    if method != "off":
+        speculative = SpeculativeDecoding({"body": method}, args.draft_model, args.draft_tokens)
+    model = LocalModelWrapper(LazyLlama(idle_timeout=0, draft_model=speculative), speculative=speculative)
+    model.temperature = 0.0  # identical output for every method
+    model.warm_up()
+    bodies, latencies, tokens = [], [], 0
+    for prompt in prompts:
+        started = time.perf_counter()
+        bodies.append(model.generate(prompt, max_tokens=args.max_tokens, use_cache=False))
+        latencies.append(time.perf_counter() - started)
+        tokens += model.last_call_metrics["tokens"]
+    stats = speculative.stats() if speculative is not None else {}
+    model.llm.unload()
+    return bodies, latencies, tokens, stats
+
+
+def main(argv=None):
+    from agents_email_agent import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding of email bodies")
+    parser.add_argument("--requests", help="JSONL file of recorded requests (to, request, subject)")
+    parser.add_argument("--draft-model", help="Small GGUF draft model (same vocabulary) to also try")
+    parser.add_argument("--draft-tokens", type=int, default=10, help="Tokens proposed per draft")
+    parser.add_argument("--max-tokens", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(MODEL_PATH):
+        print(f"✗ Model not found: {MODEL_PATH}")
+        return 1
+
+    prompts = body_prompts(load_requests(args.requests))
+    methods = ["off", "prompt-lookup"] + (["model"] if args.draft_model else [])
+    print("=" * 60)
+    print(f"📊 SPECULATIVE DECODING BENCHMARK ({len(prompts)} bodies, {args.draft_tokens} draft tokens)")
+    print("=" * 60)
+    baseline = None
+    for method in methods:
+        bodies, latencies, tokens, stats = _run(method, prompts, args)
+        elapsed = sum(latencies)
+        tps = tokens / elapsed if elapsed else 0.0
+        if baseline is None:
+            baseline = (bodies, tps)
+        latencies_ms = [l * 1000 for l in latencies]
+        acceptance = f"  accepted {stats['spec_acceptance_rate']:.0%}" if stats else ""
+        same = "" if bodies == baseline[0] else "  ⚠ output differs from plain decoding"
+        print(f"{method:<14} {tps:7.1f} tok/s  p50 {percentile(latencies_ms, 50):7.0f} ms  "
+              f"p95 {percentile(latencies_ms, 95):7.0f} ms  ({tps / baseline[1]:.2f}x){acceptance}{same}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+"""
+Benchmark: how long users wait after "regenerate", with and without
+speculative pre-generation of alternative bodies.
+
+Uses the fake model behind a lock (one llama.cpp context generates one
+thing at a time) and a simulated reading time between previews.
+
+Usage:
+    python bench_speculation.py --rounds 20 --latency 0.5 --think 1.0
+"""
+
+import argparse
+import threading
+import time
+
+from campaign_runner import percentile
+from agents_email_agent import EmailAgent
+from fake_model import FakeModel
+
+
+class SerialModel:
+    """FakeModel that, like a single llama.cpp context, runs one call at a time"""
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, max_tokens=512):
+        with self._lock:
+            return self.model.generate(prompt, max_tokens=max_tokens)
+
+
+def _run(speculative_bodies, args):
+    model = SerialModel(FakeModel(latency=args.latency))
+    agent = EmailAgent(model=model, speculative_bodies=speculative_bodies, send_func=lambda *a: "sent")
+    waits = []
+    for i in range(args.rounds):
+        agent.process_step(f"Email user{i}@example.com about the quarterly report")
+        for _ in range(args.regenerations):
+            time.sleep(args.think)  # user reads the preview
+            started = time.perf_counter()
+            agent.handle_confirmation("regenerate")
+            waits.append(time.perf_counter() - started)
+        agent.handle_confirmation("yes")
+    return waits, agent.speculation_stats.as_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark speculative regenerate")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--regenerations", type=int, default=3, help="regenerate requests per email")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per generation")
+    parser.add_argument("--think", type=float, default=1.0, help="Simulated reading time per preview")
+    parser.add_argument("--speculative", type=int, default=2, help="Bodies pre-generated per preview")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print(f"📊 REGENERATE BENCHMARK ({args.rounds} emails x {args.regenerations} regenerations, "
+          f"{args.latency:.2f} s/generation, {args.think:.2f} s reading)")
+    print("=" * 60)
+    for label, count in (("on demand", 0), (f"speculative x{args.speculative}", args.speculative)):
+        waits, stats = _run(count, args)
+        waits_ms = [w * 1000 for w in waits]
+        print(f"{label:<16} wait p50 {percentile(waits_ms, 50):7.1f} ms  "
+              f"p95 {percentile(waits_ms, 95):7.1f} ms  "
+              f"hit rate {stats['regenerate_hit_rate']:.0%} "
+              f"({stats['regenerate_hits']} ready, {stats['regenerate_partial_hits']} in progress, "
+              f"{stats['regenerate_misses']} missed)")
+
+
+if __name__ == "__main__":
+    main()
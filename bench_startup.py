@@ -0,0 +1,107 @@
+"""
+Startup regression check for the CLI.
+
+Runs `python -X importtime -c "import test_email_agent"` in fresh
+interpreters and fails (exit code 1) when
+  - importing the CLI takes longer than the budget (median of several runs),
+  - a heavy library (llama_cpp, smolagents, the Google client stack, ...)
+    is imported at startup instead of on first use, or
+  - `test_email_agent.py --dry-run` takes longer than its budget to start
+    and quit.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --import-budget-ms 150 --runs 7
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Imported on first use only (model load, first send, smolagents tool)
+DEFERRED_MODULES = (
+    "llama_cpp", "numpy", "smolagents", "googleapiclient", "google.auth", "google.oauth2",
+    "google_auth_oauthlib", "google_auth_httplib2", "httplib2", "requests",
+)
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(module="test_email_agent"):
+    """
+    Import module in a fresh interpreter under -X importtime.
+
+    Returns:
+        (total_ms, {module: self_ms}) for everything imported on the way
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    self_ms = {}
+    total_ms = 0.0
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        self_ms[name] = int(self_us) / 1000
+        if name == module and len(indent) == 1:  # top level
+            total_ms = int(cumulative_us) / 1000
+    return total_ms, self_ms
+
+
+def dry_run_seconds():
+    """Wall time for `test_email_agent.py --dry-run` to start and quit"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "test_email_agent.py", "--dry-run"], cwd=ROOT, input="quit\n",
+                   capture_output=True, text=True, check=True)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check CLI startup time against a budget")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=250.0,
+                        help="Median time to import test_email_agent")
+    parser.add_argument("--dry-run-budget-ms", type=float, default=600.0,
+                        help="Median time to start and quit `test_email_agent.py --dry-run`")
+    args = parser.parse_args(argv)
+
+    totals, profile = [], {}
+    for _ in range(args.runs):
+        total_ms, profile = import_profile()
+        totals.append(total_ms)
+    dry_runs = [dry_run_seconds() * 1000 for _ in range(args.runs)]
+    import_ms = statistics.median(totals)
+    dry_run_ms = statistics.median(dry_runs)
+
+    print("=" * 60)
+    print(f"📊 STARTUP CHECK ({args.runs} runs)")
+    print("=" * 60)
+    print(f"import test_email_agent   {import_ms:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    print(f"--dry-run start + quit    {dry_run_ms:8.1f} ms  (budget {args.dry_run_budget_ms:.0f} ms)")
+    print("Slowest imports (self time):")
+    for name, ms in sorted(profile.items(), key=lambda item: item[1], reverse=True)[:8]:
+        print(f"  {name:<36} {ms:7.1f} ms")
+
+    eager = sorted(name for name in profile
+                   if any(name == m or name.startswith(m + ".") for m in DEFERRED_MODULES))
+    ok = True
+    if eager:
+        ok = False
+        print(f"⚠ Imported at startup (should be deferred): {', '.join(eager[:10])}")
+    if import_ms > args.import_budget_ms or dry_run_ms > args.dry_run_budget_ms:
+        ok = False
+        print("⚠ Startup is over budget")
+    if ok:
+        print("✓ Startup within budget")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
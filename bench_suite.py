@@ -0,0 +1,160 @@
+"""
+Deterministic offline benchmark suite.
+
+Runs EmailAgent against fake_model.FakeModel and sends through the real
+Gmail client code against fake_gmail_api.FakeGmailServer, so no GGUF file
+or Google account is needed. Measures throughput and latency percentiles
+and writes them to a JSON file that can be compared between commits.
+
+Usage:
+    python bench_suite.py --output bench_results.json
+    python bench_suite.py --output new.json --compare bench_results.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+from google.oauth2.credentials import Credentials
+
+from agents_email_agent import EmailAgent
+from campaign_runner import percentile
+from fake_gmail_api import FakeGmailServer
+from fake_model import FakeModel
+from tools_send_email_gmail import get_gmail_service, send_message
+
+REQUESTS = [
+    "Send an email to john.smith@example.com about the project meeting on Friday",
+    "Email sarah@company.com regarding the Q4 report deadline",
+    "Write to support@service.com about my account login issue",
+    "Remind mike@team.com about tomorrow's lunch",
+]
+
+BODY_SAMPLE = (
+    "Subject: Project meeting\n\nDear John,\n\nI wanted to confirm our project meeting "
+    "scheduled for tomorrow [Time]. Please let me know if the time still works for you.\n\n"
+    "Best regards\n[Your Name]\nYour Job Title\nEmail: me@example.com\nPhone: 555-0100\n"
+)
+
+
+def _measure(func, iterations, warmup=20):
+    """Time iterations calls of func(i); return throughput and percentiles"""
+    for i in range(warmup):
+        func(i)
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / elapsed, 1),
+        "mean_us": round(sum(samples) / len(samples) * 1e6, 2),
+        "p50_us": round(percentile(samples, 50) * 1e6, 2),
+        "p95_us": round(percentile(samples, 95) * 1e6, 2),
+        "p99_us": round(percentile(samples, 99) * 1e6, 2),
+    }
+
+
+def bench_process_step(iterations):
+    agent = EmailAgent(model=FakeModel())
+
+    def step(i):
+        agent._reset()
+        agent.process_step(REQUESTS[i % len(REQUESTS)])
+    return _measure(step, iterations)
+
+
+def bench_subject_fallback(iterations):
+    # Both the JSON prompt and the first fallback fail: three model calls
+    agent = EmailAgent(model=FakeModel(subject_failures=2))
+    return _measure(lambda i: agent._generate_subject(REQUESTS[i % len(REQUESTS)]), iterations)
+
+
+def bench_clean_email_body(iterations):
+    agent = EmailAgent(model=FakeModel())
+    return _measure(lambda i: agent._clean_email_body(BODY_SAMPLE, "John"), iterations)
+
+
+def bench_handle_confirmation(iterations, server):
+    service = get_gmail_service(Credentials(token="bench-token"), api_endpoint=server.url)
+
+    def send(to, subject, body):
+        return f"✓ Email sent successfully to {to} (Message ID: {send_message(service, to, subject, body)})"
+
+    agent = EmailAgent(model=FakeModel(), send_func=send)
+    draft = EmailAgent(model=FakeModel())
+    draft.process_step(REQUESTS[0])
+    state = draft.export_state()
+
+    def confirm(i):
+        agent.import_state(state)
+        agent.handle_confirmation("yes")
+    return _measure(confirm, iterations)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_suite(iterations):
+    with FakeGmailServer() as server:
+        results = {
+            "process_step": bench_process_step(iterations),
+            "subject_fallback_chain": bench_subject_fallback(iterations),
+            "clean_email_body": bench_clean_email_body(iterations * 10),
+            "handle_confirmation": bench_handle_confirmation(max(1, iterations // 5), server),
+        }
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def print_report(report, baseline=None):
+    print("=" * 72)
+    print(f"📊 BENCHMARK SUITE (commit {report['commit']})")
+    print("=" * 72)
+    print(f"{'benchmark':<24} {'ops/sec':>10} {'p50 µs':>10} {'p95 µs':>10} {'p99 µs':>10}  change")
+    for name, stats in report["results"].items():
+        change = ""
+        old = (baseline or {}).get("results", {}).get(name)
+        if old:
+            delta = (stats["ops_per_sec"] - old["ops_per_sec"]) / old["ops_per_sec"] * 100
+            change = f"{delta:+.1f}% ops/sec"
+        print(f"{name:<24} {stats['ops_per_sec']:>10} {stats['p50_us']:>10} "
+              f"{stats['p95_us']:>10} {stats['p99_us']:>10}  {change}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline EmailAgent benchmark suite")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write results to")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.iterations)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"\n✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
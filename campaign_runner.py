@@ -0,0 +1,232 @@
+"""
+Bulk Campaign Runner
+Drafts emails for every row of a JSONL/CSV request file without the
+interactive loop, streaming results to a JSONL output file.
+
+Usage:
+    python campaign_runner.py requests.csv drafts.jsonl
+
+Each input row needs a recipient ("receiver", "to" or "email") and an
+instruction ("request", "instruction" or "prompt"). Rows already present
+in the output file are skipped, so a crashed run can simply be restarted.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+RECEIVER_FIELDS = ("receiver", "to", "email")
+REQUEST_FIELDS = ("request", "instruction", "prompt")
+
+
+# ============================================================
+# Input / output helpers
+# ============================================================
+
+def _pick(row, fields):
+    """Return the first non-empty value among the given field names"""
+    for field in fields:
+        value = row.get(field)
+        if value:
+            return str(value).strip()
+    return None
+
+
+def read_rows(path):
+    """Yield (row_number, receiver, request) from a .jsonl or .csv file"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row_number, row in enumerate(csv.DictReader(f)):
+                yield row_number, _pick(row, RECEIVER_FIELDS), _pick(row, REQUEST_FIELDS)
+    else:
+        with open(path, encoding="utf-8") as f:
+            row_number = 0
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                row = json.loads(line)
+                yield row_number, _pick(row, RECEIVER_FIELDS), _pick(row, REQUEST_FIELDS)
+                row_number += 1
+
+
+def load_finished_rows(path):
+    """Return the row numbers already written to the output file"""
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["row"])
+            except (ValueError, KeyError):
+                continue
+    return finished
+
+
+def truncate_partial_line(path, block_size=65536):
+    """
+    Cut a truncated last line (left by a crash mid-write) off the file, so
+    the next appended record starts on a line of its own.
+
+    Returns:
+        Number of bytes removed
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r+b") as f:
+        size = end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+    return size - end
+
+
+def open_output(path):
+    """
+    Open a resumable JSONL output file for appending.
+
+    Returns:
+        (row numbers already written, file opened in append mode); a
+        truncated last line is removed first and its row is redone
+    """
+    truncate_partial_line(path)
+    return load_finished_rows(path), open(path, "a", encoding="utf-8")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+# ============================================================
+# Campaign runner
+# ============================================================
+
+def draft_row(agent, receiver, request):
+    """Draft subject and body for one row using the agent's generators"""
+    agent._reset()
+    agent.current_receiver = receiver
+    agent.original_request = request
+    return agent.draft_email()
+
+
+def run_campaign(input_path, output_path, agent=None, progress_every=100):
+    """
+    Draft every row of input_path and append results to output_path.
+
+    Args:
+        input_path: JSONL or CSV file of requests
+        output_path: JSONL file results are streamed to (one line per row)
+        agent: EmailAgent to use (a default one is created if omitted)
+        progress_every: Print a progress line every N drafted rows
+
+    Returns:
+        dict with row counts, rows/sec and per-row latency percentiles
+    """
+    if agent is None:
+        from agents_email_agent import EmailAgent
+        agent = EmailAgent()
+
+    finished, out = open_output(output_path)
+    if finished:
+        print(f"→ Resuming: {len(finished)} rows already drafted in {output_path}")
+
+    latencies = []
+    drafted = skipped = failed = 0
+    started = time.perf_counter()
+
+    with out:
+        for row_number, receiver, request in read_rows(input_path):
+            if row_number in finished:
+                skipped += 1
+                continue
+
+            record = {"row": row_number, "receiver": receiver, "request": request}
+            row_started = time.perf_counter()
+            if not receiver or not request:
+                record.update(status="error", error="missing receiver or request")
+                failed += 1
+            else:
+                try:
+                    subject, body = draft_row(agent, receiver, request)
+                    record.update(status="drafted", subject=subject, body=body)
+                    drafted += 1
+                except Exception as e:
+                    record.update(status="error", error=str(e))
+                    failed += 1
+            latency = time.perf_counter() - row_started
+            latencies.append(latency)
+            record["latency_ms"] = round(latency * 1000, 2)
+
+            # One flushed line per row: a crash loses at most the row in flight
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+            done = drafted + failed
+            if progress_every and done % progress_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"→ {done} rows ({done / elapsed:.2f} rows/sec)")
+
+    elapsed = time.perf_counter() - started
+    processed = drafted + failed
+    return {
+        "drafted": drafted,
+        "failed": failed,
+        "skipped": skipped,
+        "elapsed_sec": round(elapsed, 3),
+        "rows_per_sec": round(processed / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms_p50": round(percentile(latencies, 50) * 1000, 2),
+        "latency_ms_p95": round(percentile(latencies, 95) * 1000, 2),
+        "latency_ms_max": round(max(latencies, default=0.0) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draft emails in bulk from a JSONL/CSV file")
+    parser.add_argument("input", help="JSONL or CSV file with receiver + request per row")
+    parser.add_argument("output", help="JSONL file to stream drafts to (resumable)")
+    parser.add_argument("--progress-every", type=int, default=100,
+                        help="Print progress every N rows (0 to disable)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"✗ Input file not found: {args.input}")
+        return 1
+
+    from agents_email_agent import EmailAgent
+    agent = EmailAgent()
+    stats = run_campaign(args.input, args.output, agent=agent, progress_every=args.progress_every)
+
+    print("=" * 60)
+    print("📊 CAMPAIGN SUMMARY")
+    print("=" * 60)
+    print(f"Drafted: {stats['drafted']}  Failed: {stats['failed']}  Skipped: {stats['skipped']}")
+    print(f"Throughput: {stats['rows_per_sec']} rows/sec")
+    print(f"Latency: p50 {stats['latency_ms_p50']} ms, p95 {stats['latency_ms_p95']} ms, "
+          f"max {stats['latency_ms_max']} ms")
+    if hasattr(agent.model, "stats"):
+        for key, value in agent.model.stats().items():
+            print(f"{key}: {value}")
+    if agent.semantic_cache is not None:
+        for key, value in agent.semantic_cache.stats().items():
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
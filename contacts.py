@@ -0,0 +1,516 @@
+"""
+Local contact directory for resolving recipients without asking.
+
+Contacts are loaded from a CSV file (email, name, aliases, organization,
+department columns; Google/Outlook export headers work too) or a vCard
+(.vcf) file and indexed by every token of their names, aliases,
+organization and email domain. resolve() finds the contact a request like
+"email Sarah from finance about the budget" refers to with a few dict and
+set operations; search() does prefix (autocomplete) lookups over a sorted
+token list. The source file is re-checked every few seconds: rows appended
+to a CSV are parsed on their own, any other change is diffed against the
+loaded contacts, and only what changed is re-indexed.
+
+Usage:
+    contacts = ContactDirectory("contacts.csv")
+    contact, candidates = contacts.resolve("email Sarah from finance about the budget")
+"""
+
+import bisect
+import csv
+import functools
+import io
+import itertools
+import os
+import re
+import threading
+import time
+import unicodedata
+
+# Words of a request that are never treated as (part of) a name
+STOPWORDS = frozenset("""
+a about after all also an and any are as ask at be before by can cc could dear do email for forward
+from get have he her him his i in is it know let mail may me message my need of on or our please re
+regarding remind reply say send she should so tell than that the their them they this to up us we
+what when will with write would you your
+""".split())
+# Email domain labels that say nothing about the organization
+_GENERIC_DOMAIN_LABELS = frozenset("com org net edu gov io co uk de fr mail email gmail googlemail "
+                                   "yahoo hotmail outlook live icloud me proton protonmail".split())
+# Words after which a name refers to the recipient ("email Price", "tell Friday")
+RECIPIENT_CUES = frozenset("""
+ask cc email forward invite mail message notify ping remind reply tell thank to write
+""".split())
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def tokens(text):
+    """Lowercase, accent-free word tokens of text"""
+    if not text:
+        return []
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _WORD_RE.findall(text)
+
+
+@functools.lru_cache(maxsize=4096)
+def _domain_tokens(domain):
+    """Organization words of an email domain (most contacts share a few domains)"""
+    return tuple(label for label in tokens(domain) if label not in _GENERIC_DOMAIN_LABELS)
+
+
+class Contact:
+    __slots__ = ("email", "name", "aliases", "organization", "_name_tokens", "_given_tokens", "_org_tokens")
+
+    def __init__(self, email, name="", aliases=(), organization=""):
+        self.email = email
+        self.name = name
+        self.aliases = tuple(aliases)
+        self.organization = organization
+        self._name_tokens = None
+        self._given_tokens = None
+        self._org_tokens = None
+
+    @property
+    def first_name(self):
+        return self.name.split()[0] if self.name else ""
+
+    def _record(self):
+        return self.name, self.aliases, self.organization
+
+    def name_tokens(self):
+        """Tokens of the name and aliases"""
+        if self._name_tokens is None:
+            found = set(tokens(self.name))
+            for alias in self.aliases:
+                found.update(tokens(alias))
+            self._name_tokens = frozenset(found)
+        return self._name_tokens
+
+    def given_tokens(self):
+        """Tokens of the first name and aliases: the words that name this contact on their own"""
+        if self._given_tokens is None:
+            found = set(tokens(self.first_name))
+            for alias in self.aliases:
+                found.update(tokens(alias))
+            self._given_tokens = frozenset(found)
+        return self._given_tokens
+
+    def org_tokens(self):
+        """Tokens of the organization/department and of the email domain"""
+        if self._org_tokens is None:
+            found = set(tokens(self.organization))
+            found.update(_domain_tokens(self.email.rpartition("@")[2].lower()))
+            self._org_tokens = frozenset(found)
+        return self._org_tokens
+
+    def __str__(self):
+        return f"{self.name} <{self.email}>" if self.name else self.email
+
+    def __repr__(self):
+        return f"Contact({self.email!r}, {self.name!r})"
+
+
+# ============================================================
+# Source file parsing
+# ============================================================
+
+def _pick(fieldnames, *candidates):
+    """First column whose normalized header is one of candidates"""
+    normalized = {" ".join(tokens(name)): name for name in fieldnames or ()}
+    for candidate in candidates:
+        if candidate in normalized:
+            return normalized[candidate]
+    return None
+
+
+class _CsvColumns:
+    def __init__(self, fieldnames):
+        self.fieldnames = fieldnames
+        self.email = _pick(fieldnames, "email", "e mail", "email address", "e mail address", "e mail 1 value", "mail")
+        self.name = _pick(fieldnames, "name", "full name", "display name")
+        self.first = _pick(fieldnames, "first name", "given name")
+        self.last = _pick(fieldnames, "last name", "family name", "surname")
+        self.aliases = _pick(fieldnames, "aliases", "alias", "nickname", "nicknames")
+        self.organization = _pick(fieldnames, "organization", "organisation", "company", "org",
+                                  "organization name", "organization 1 name")
+        self.department = _pick(fieldnames, "department", "organization department",
+                                "organization 1 department", "team")
+        if self.email is None:
+            raise ValueError(f"No email column in contacts header: {fieldnames}")
+
+    def row(self, values):
+        """Contact of one CSV row (a list of values), or None without an address"""
+        return self.contact(dict(zip(self.fieldnames, values)))
+
+    def contact(self, row):
+        email = (row.get(self.email) or "").strip()
+        if "@" not in email:
+            return None
+        name = (row.get(self.name) or "").strip() if self.name else ""
+        if not name:
+            name = " ".join(part for part in ((row.get(self.first) or "").strip() if self.first else "",
+                                              (row.get(self.last) or "").strip() if self.last else "") if part)
+        aliases = re.split(r"[;,|]", row.get(self.aliases) or "") if self.aliases else ()
+        organization = " ".join(part for part in ((row.get(self.organization) or "").strip() if self.organization else "",
+                                                  (row.get(self.department) or "").strip() if self.department else "")
+                                if part)
+        return Contact(email, name, (a.strip() for a in aliases if a.strip()), organization)
+
+
+def parse_vcards(text):
+    """Yield a Contact per email address of every vCard in text"""
+    text = re.sub(r"\r?\n[ \t]", "", text)  # unfold continuation lines
+    card = None
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        key = key.split(";")[0].rpartition(".")[2].upper()  # drop parameters and item groups
+        if key == "BEGIN":
+            card = {"emails": [], "aliases": []}
+        elif card is None:
+            continue
+        elif key == "END":
+            name = card.get("FN") or " ".join(reversed([p for p in card.get("N", "").split(";")[:2] if p]))
+            for email in card["emails"]:
+                yield Contact(email, name, card["aliases"], card.get("ORG", ""))
+            card = None
+        elif key == "EMAIL":
+            card["emails"].append(value.strip())
+        elif key == "NICKNAME":
+            card["aliases"].extend(a.strip() for a in value.split(",") if a.strip())
+        elif key == "ORG":
+            card["ORG"] = " ".join(p.strip() for p in value.split(";") if p.strip())
+        elif key in ("FN", "N"):
+            card[key] = value.strip()
+
+
+def _has_prefix(contact, prefix):
+    return (any(t.startswith(prefix) for t in contact.name_tokens())
+            or any(t.startswith(prefix) for t in contact.org_tokens()))
+
+
+# ============================================================
+# Directory
+# ============================================================
+
+class ContactDirectory:
+    def __init__(self, path=None, check_interval=2.0):
+        """
+        Args:
+            path: CSV or .vcf file (None for an empty directory filled with add())
+            check_interval: Seconds between checks of the file for changes
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._contacts = {}     # lowercase email -> Contact
+        self._names = {}        # token -> set of emails (names and aliases)
+        self._given = {}        # token -> set of emails (first names and aliases)
+        self._orgs = {}         # token -> set of emails (organization, department, domain)
+        self._sorted = []       # every indexed token, for prefix search
+        self._lock = threading.RLock()
+        self._signature = None  # (mtime_ns, size) of the loaded file
+        # CSV sources: raw line -> email it defines (None when rows span lines),
+        # header line, and the end of the last complete line parsed
+        self._lines = None
+        self._header = None
+        self._columns = None
+        self._offset = 0
+        self._tail = b""        # bytes just before _offset, to recognise appends
+        self._next_check = 0.0
+        self.reloads = 0
+        self.last_reload_ms = 0.0
+        if path is not None:
+            self.refresh(force=True)
+
+    def __len__(self):
+        return len(self._contacts)
+
+    # ---- index maintenance ----
+
+    def _index(self, index, token, email):
+        postings = index.get(token)
+        if postings is None:
+            index[token] = {email}
+            position = bisect.bisect_left(self._sorted, token)
+            if position == len(self._sorted) or self._sorted[position] != token:
+                self._sorted.insert(position, token)
+        else:
+            postings.add(email)
+
+    def _unindex(self, index, token, email):
+        postings = index.get(token)
+        if postings is None:
+            return
+        postings.discard(email)
+        if not postings:
+            del index[token]
+            if token not in self._names and token not in self._orgs:
+                position = bisect.bisect_left(self._sorted, token)
+                if position < len(self._sorted) and self._sorted[position] == token:
+                    del self._sorted[position]
+
+    def add(self, contact):
+        """Add or replace a contact (keyed by email address); False if unchanged"""
+        key = contact.email.lower()
+        with self._lock:
+            old = self._contacts.get(key)
+            if old is not None:
+                if old._record() == contact._record():
+                    return False
+                self.remove(key)
+            self._contacts[key] = contact
+            for token in contact.name_tokens():
+                self._index(self._names, token, key)
+            for token in contact.given_tokens():
+                self._index(self._given, token, key)
+            for token in contact.org_tokens():
+                self._index(self._orgs, token, key)
+        return True
+
+    def remove(self, email):
+        key = email.lower()
+        with self._lock:
+            contact = self._contacts.pop(key, None)
+            if contact is None:
+                return False
+            for token in contact.name_tokens():
+                self._unindex(self._names, token, key)
+            for token in contact.given_tokens():
+                self._unindex(self._given, token, key)
+            for token in contact.org_tokens():
+                self._unindex(self._orgs, token, key)
+        return True
+
+    def _bulk_load(self, contacts):
+        """Build the index from scratch (much faster than add() per contact)"""
+        self._contacts, self._names, self._given, self._orgs = {}, {}, {}, {}
+        for contact in contacts:
+            self._contacts[contact.email.lower()] = contact
+        for key, contact in self._contacts.items():
+            for token in contact.name_tokens():
+                self._names.setdefault(token, set()).add(key)
+            for token in contact.given_tokens():
+                self._given.setdefault(token, set()).add(key)
+            for token in contact.org_tokens():
+                self._orgs.setdefault(token, set()).add(key)
+        self._sorted = sorted(self._names.keys() | self._orgs.keys())
+
+    def _replace_all(self, contacts, rebuild):
+        """Make the directory hold exactly contacts, re-indexing only the differences"""
+        if rebuild or not self._contacts:
+            self._bulk_load(contacts)
+            return len(self._contacts)
+        new = {contact.email.lower(): contact for contact in contacts}
+        changed = sum(self.remove(key) for key in [key for key in self._contacts if key not in new])
+        return changed + sum(self.add(contact) for contact in new.values())
+
+    # ---- loading and incremental reload ----
+
+    def refresh(self, force=False):
+        """
+        Reload the source file if it changed since the last load.
+
+        Returns:
+            Number of contacts added, changed or removed
+        """
+        if self.path is None:
+            return 0
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return 0
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature and not force:
+                return 0
+            started = time.perf_counter()
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if self.path.lower().endswith((".vcf", ".vcard")):
+                contacts = parse_vcards(data.decode("utf-8-sig", errors="replace"))
+                changed = self._replace_all(contacts, force)
+            else:
+                changed = self._refresh_csv(data, force)
+            self._signature = signature
+            self.reloads += 1
+            self.last_reload_ms = round((time.perf_counter() - started) * 1000, 2)
+            return changed
+
+    def _parse_lines(self, lines):
+        """[(line, Contact or None)] for CSV lines holding one row each"""
+        rows = csv.reader(line.decode("utf-8", errors="replace") for line in lines)
+        return [(line, self._columns.row(values)) for line, values in zip(lines, rows)]
+
+    def _refresh_csv(self, data, force):
+        end = data.rfind(b"\n") + 1  # a partly written last line is read next time
+        if (not force and self._lines is not None and self._offset < end
+                and data[self._offset - len(self._tail):self._offset] == self._tail):
+            # Rows were appended: parse just those
+            changed = self._apply_lines(data[self._offset:end].splitlines())
+        else:
+            changed = self._diff_lines(data[:end].splitlines(), force)
+        self._offset = end
+        self._tail = data[max(0, end - 64):end]
+        return changed
+
+    def _apply_lines(self, lines):
+        if any(line.count(b'"') % 2 for line in lines):
+            self._lines = None  # quoted line breaks: rows no longer map to lines
+            with open(self.path, "rb") as f:
+                data = f.read()
+            return self._diff_lines(data.splitlines(), True)
+        changed = 0
+        for line, contact in self._parse_lines(lines):
+            self._lines[line] = contact.email.lower() if contact else None
+            if contact is not None:
+                changed += self.add(contact)
+        return changed
+
+    def _diff_lines(self, lines, force):
+        """Re-index only the rows whose line was added or removed since the last load"""
+        header, rows = (lines[0], lines[1:]) if lines else (b"", [])
+        if header.startswith(b"\xef\xbb\xbf"):
+            header = header[3:]
+        if header != self._header:
+            self._header = header
+            self._columns = _CsvColumns(next(csv.reader([header.decode("utf-8", errors="replace")]), []))
+            force = True
+        if any(line.count(b'"') % 2 for line in rows):
+            # Quoted line breaks: parse the whole file and diff contacts instead
+            self._lines = None
+            text = b"\n".join(lines).decode("utf-8-sig", errors="replace")
+            reader = csv.reader(io.StringIO(text))
+            next(reader, None)
+            return self._replace_all((c for c in map(self._columns.row, reader) if c is not None), force)
+        if force or self._lines is None:
+            parsed = self._parse_lines(rows)
+            self._lines = {line: contact.email.lower() if contact else None for line, contact in parsed}
+            return self._replace_all((contact for _, contact in parsed if contact is not None), True)
+
+        current = set(rows)
+        parsed = self._parse_lines([line for line in dict.fromkeys(rows) if line not in self._lines])
+        kept = {contact.email.lower() for _, contact in parsed if contact is not None}
+        changed = 0
+        for line in [line for line in self._lines if line not in current]:
+            email = self._lines.pop(line)
+            if email is not None and email not in kept:
+                changed += self.remove(email)
+        for line, contact in parsed:
+            self._lines[line] = contact.email.lower() if contact else None
+            if contact is not None:
+                changed += self.add(contact)
+        return changed
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self.path is not None and now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self.refresh()
+
+    # ---- lookups ----
+
+    def get(self, email):
+        """Contact for an email address, or None"""
+        self._maybe_refresh()
+        return self._contacts.get(email.lower()) if email else None
+
+    def resolve(self, text, limit=5, reply=False):
+        """
+        Find the contact text refers to by name or alias, narrowed down by
+        organization/department/domain words ("Sarah from finance").
+
+        A contact is only named by its full name, its first name or an
+        alias, or by any name word right after a recipient cue ("email
+        Price"): "send the price list" does not name Grace Price.
+
+        Args:
+            text: Request (or reply) naming the contact
+            limit: Maximum candidates returned
+            reply: text answers "who is it for?", so every name word names someone
+
+        Returns:
+            (contact, candidates): the contact if the match is unambiguous
+            (else None), and up to limit candidates when it is ambiguous
+        """
+        self._maybe_refresh()
+        all_words = tokens(text)
+        words = [w for w in dict.fromkeys(all_words) if len(w) > 1 and w not in STOPWORDS]
+        cued = {word for cue, word in zip(all_words, all_words[1:]) if cue in RECIPIENT_CUES}
+        with self._lock:
+            postings = sorted((self._names[w] for w in words if w in self._names), key=len)
+            if not postings:
+                return None, []
+            # Contacts matching the most name words ("Sarah Lee" beats "Sarah"). Only
+            # contacts of the smaller posting lists can match more than one word.
+            counts = {}
+            for i, emails in enumerate(postings[:-1]):
+                for email in emails:
+                    if email not in counts:
+                        counts[email] = sum(email in other for other in postings[i:])
+            best = max(counts.values(), default=1)
+            if best > 1:
+                matches = {email for email, count in counts.items() if count == best}
+            elif reply:
+                matches = postings[0] if len(postings) == 1 else set().union(*postings)
+            else:
+                # A lone surname ("the Friday meeting") names nobody
+                matches = set().union(*(self._names[w] if w in cued else self._given.get(w, ())
+                                        for w in words if w in self._names))
+                if not matches:
+                    return None, []
+            # Narrow by any other word naming their organization or domain
+            for word in words:
+                if len(matches) == 1:
+                    break
+                narrowed = matches & self._orgs.get(word, set())
+                if narrowed:
+                    matches = narrowed
+            if len(matches) == 1:
+                return self._contacts[next(iter(matches))], []
+            candidates = [self._contacts[email] for email in itertools.islice(matches, 1000)]
+            candidates.sort(key=lambda c: (c.name.lower(), c.email))
+            return None, candidates[:limit]
+
+    def search(self, query, limit=10):
+        """
+        Prefix search: contacts having a token starting with every word of
+        query, e.g. "sar fin" -> Sarah Lee (Finance).
+        """
+        self._maybe_refresh()
+        prefixes = list(dict.fromkeys(tokens(query)))
+        if not prefixes:
+            return []
+        with self._lock:
+            # Walk the tokens of the most selective prefix; check the others per contact
+            ranges = []
+            for prefix in prefixes:
+                start = bisect.bisect_left(self._sorted, prefix)
+                end = bisect.bisect_left(self._sorted, prefix + "\uffff", start)
+                ranges.append((end - start, start, end, prefix))
+            ranges.sort()
+            _, start, end, _ = ranges[0]
+            others = [prefix for _, _, _, prefix in ranges[1:]]
+            seen = set()
+            results = []
+            for token in self._sorted[start:end]:
+                for index in (self._names, self._orgs):
+                    for email in index.get(token, ()):
+                        if email in seen:
+                            continue
+                        seen.add(email)
+                        contact = self._contacts[email]
+                        if others and not all(_has_prefix(contact, prefix) for prefix in others):
+                            continue
+                        results.append(contact)
+                        if len(results) >= limit:
+                            return results
+            return results
+
+    def stats(self):
+        return {
+            "contacts": len(self._contacts),
+            "contact_tokens": len(self._sorted),
+            "contact_reloads": self.reloads,
+            "contact_last_reload_ms": self.last_reload_ms,
+        }
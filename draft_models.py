@@ -0,0 +1,197 @@
+"""
+Speculative decoding for llama.cpp, chosen per task.
+
+Email bodies repeat much of their prompt almost word for word (the request,
+the receiver's name, the subject). A draft model proposes the next few
+tokens and llama.cpp verifies them in one batch, keeping the ones the main
+model would have sampled anyway, so the output is unchanged but fewer
+sequential decode steps are needed. Two drafters are available:
+
+    prompt-lookup   continue an earlier occurrence of the last n-gram
+                    (llama-cpp-python's LlamaPromptLookupDecoding; free)
+    model           greedy tokens from a small GGUF model that shares the
+                    main model's vocabulary
+
+SpeculativeDecoding is passed to Llama(draft_model=...) once and switched
+per call by task ("subject", "body", "draft"); tasks set to "off" decode
+normally. It counts proposed and accepted tokens for every call.
+"""
+
+import logging
+
+logger = logging.getLogger("email_agent.decoding")
+
+METHODS = ("off", "prompt-lookup", "model")
+
+
+def parse_task_methods(spec):
+    """
+    Parse "body=prompt-lookup,draft=model" into {"body": "prompt-lookup", ...}.
+    A bare method ("prompt-lookup") applies to the body task, the one that
+    echoes its prompt the most; grammar-constrained single-pass drafts
+    reject more drafted tokens, so they have to be enabled explicitly.
+    """
+    methods = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        task, _, method = item.rpartition("=")
+        method = method.strip()
+        if method not in METHODS:
+            raise ValueError(f"Unknown speculative decoding method {method!r} (use one of {', '.join(METHODS)})")
+        methods[task.strip() or "body"] = method
+    return {task: method for task, method in methods.items() if method != "off"}
+
+
+class GGUFDraftModel:
+    """Greedy drafts from a small GGUF model (it must use the main model's vocabulary)"""
+
+    def __init__(self, model_path, num_pred_tokens=8, **params):
+        self.model_path = model_path
+        self.num_pred_tokens = num_pred_tokens
+        self.params = {"n_ctx": 4096, "verbose": False, **params}
+        self._llm = None
+
+    def _load(self):
+        if self._llm is None:
+            from llama_cpp import Llama
+
+            self._llm = Llama(model_path=self.model_path, **self.params)
+        return self._llm
+
+    def __call__(self, input_ids, **kwargs):
+        import llama_cpp
+        import numpy as np
+
+        llm = self._load()
+        ids = input_ids.tolist()
+        if len(ids) + self.num_pred_tokens > llm.n_ctx():
+            return np.array([], dtype=np.intc)
+        # Keep the drafter's KV cache for the part of the sequence it has seen
+        cached = llm.input_ids[:llm.n_tokens].tolist()
+        shared = 0
+        limit = min(len(cached), len(ids) - 1)
+        while shared < limit and cached[shared] == ids[shared]:
+            shared += 1
+        llm.n_tokens = shared
+        llm.eval(ids[shared:])
+
+        n_vocab = llm.n_vocab()
+        eos = llm.token_eos()
+        draft = []
+        for _ in range(self.num_pred_tokens):
+            logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(llm.ctx, -1), shape=(n_vocab,))
+            token = int(np.argmax(logits))
+            if token == eos:
+                break
+            draft.append(token)
+            llm.eval([token])
+        return np.array(draft, dtype=np.intc)
+
+
+class SpeculativeDecoding:
+    """
+    Draft model handed to llama.cpp that only drafts while a task using it
+    runs, and measures how many drafted tokens the main model accepted.
+    """
+
+    def __init__(self, task_methods, draft_model_path=None, num_pred_tokens=10):
+        """
+        Args:
+            task_methods: {task: "prompt-lookup" | "model"}; other tasks decode normally
+            draft_model_path: Small GGUF model for the "model" method
+            num_pred_tokens: Tokens proposed per draft
+        """
+        if "model" in task_methods.values() and not draft_model_path:
+            raise ValueError("Speculative decoding method 'model' needs a draft model path")
+        self.task_methods = dict(task_methods)
+        self.draft_model_path = draft_model_path
+        self.num_pred_tokens = num_pred_tokens
+        self._drafters = {}
+        self._active = None
+        self._method = None
+        self._pending = None  # (position, proposed tokens) awaiting verification
+        self._proposed = self._accepted = 0
+        self.totals = {}      # method -> [calls, proposed, accepted]
+
+    @classmethod
+    def from_config(cls, spec, draft_model_path=None, num_pred_tokens=10):
+        """Return a SpeculativeDecoding for spec, or None if no task uses one"""
+        task_methods = parse_task_methods(spec)
+        if not task_methods:
+            return None
+        return cls(task_methods, draft_model_path, num_pred_tokens)
+
+    def _drafter(self, method):
+        drafter = self._drafters.get(method)
+        if drafter is None:
+            if method == "prompt-lookup":
+                from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+                drafter = LlamaPromptLookupDecoding(num_pred_tokens=self.num_pred_tokens)
+            else:
+                drafter = GGUFDraftModel(self.draft_model_path, num_pred_tokens=self.num_pred_tokens)
+            self._drafters[method] = drafter
+        return drafter
+
+    def begin(self, task):
+        """Switch drafting on for task (if it uses it); returns the method or None"""
+        self._method = self.task_methods.get(task)
+        self._active = self._drafter(self._method) if self._method else None
+        self._pending = None
+        self._proposed = self._accepted = 0
+        return self._method
+
+    def _settle(self, input_ids):
+        """Count how much of the previous draft the main model kept"""
+        if self._pending is None:
+            return
+        position, proposal = self._pending
+        self._pending = None
+        actual = input_ids[position:position + len(proposal)]
+        accepted = 0
+        for drafted, kept in zip(proposal, actual):
+            if drafted != kept:
+                break
+            accepted += 1
+        self._proposed += len(proposal)
+        self._accepted += accepted
+
+    def __call__(self, input_ids, **kwargs):
+        import numpy as np
+
+        if self._active is None:
+            return np.array([], dtype=np.intc)
+        self._settle(input_ids)
+        proposal = self._active(input_ids)
+        if len(proposal):
+            self._pending = (len(input_ids), proposal.tolist())
+        return proposal
+
+    def end(self):
+        """
+        Switch drafting off again.
+
+        Returns:
+            (method, proposed, accepted) for the call, or None if it did not draft
+        """
+        method = self._method
+        self._active = self._method = self._pending = None  # the last draft was never verified
+        if method is None:
+            return None
+        totals = self.totals.setdefault(method, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += self._proposed
+        totals[2] += self._accepted
+        return method, self._proposed, self._accepted
+
+    def stats(self):
+        proposed = sum(t[1] for t in self.totals.values())
+        accepted = sum(t[2] for t in self.totals.values())
+        return {
+            "spec_calls": sum(t[0] for t in self.totals.values()),
+            "spec_tokens_proposed": proposed,
+            "spec_tokens_accepted": accepted,
+            "spec_acceptance_rate": round(accepted / proposed, 3) if proposed else 0.0,
+        }
@@ -0,0 +1,301 @@
+"""
+Local fake of the Gmail REST API for benchmarks and offline testing.
+Serves users.messages.send and the multipart batch endpoint over
+HTTP/1.1 keep-alive on 127.0.0.1, counts requests and TCP connections so
+client reuse can be verified, and can inject 503 (or 429) errors for
+retry tests. A fake OAuth token endpoint (server.token_uri) hands out
+short-lived access tokens, and sends made with one of them after it
+expired are rejected with 401. Messages can also be sent through the
+resumable media upload protocol; uploads are hashed (and optionally saved
+to upload_dir) chunk by chunk, and chunk failures can be injected to
+exercise resuming.
+
+Usage:
+    with FakeGmailServer() as server:
+        service = build_gmail_service(creds, api_endpoint=server.url)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_ERROR_REASONS = {429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class _FakeGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections open between requests
+    disable_nagle_algorithm = True  # avoid delayed-ACK stalls on reused connections
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # client went away mid-request (e.g. a killed process)
+
+    def log_message(self, format, *args):
+        """Silence per-request logging"""
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_message(self):
+        """Return (status, payload) for one messages.send call"""
+        token = self.headers.get("Authorization", "").partition(" ")[2]
+        with self.server.lock:
+            self.server.stats["send_calls"] += 1
+            expires = self.server.issued_tokens.get(token)
+            if expires is not None and time.monotonic() >= expires:
+                self.server.stats["expired_tokens"] += 1
+                return 401, {"error": {"code": 401, "message": "Invalid Credentials"}}
+            error_every = self.server.error_every
+            if error_every and self.server.stats["send_calls"] % error_every == 0:
+                self.server.stats["errors"] += 1
+                status = self.server.error_status
+                return status, {"error": {"code": status, "message": _ERROR_REASONS.get(status, "Error")}}
+            self.server.stats["sent"] += 1
+            return 200, {"id": f"fake-{self.server.stats['sent']:08d}", "labelIds": ["SENT"]}
+
+    def _handle_batch(self, body):
+        """Answer a multipart/mixed batch of messages.send sub-requests"""
+        match = re.search(r'boundary="?([^";]+)"?', self.headers.get("Content-Type", ""))
+        if not match:
+            self._send_json(400, {"error": {"code": 400, "message": "Missing boundary"}})
+            return
+        with self.server.lock:
+            self.server.stats["batches"] += 1
+
+        out_boundary = "batch_fake_gmail"
+        parts = []
+        for part in body.decode("utf-8").split("--" + match.group(1))[1:]:
+            if part.startswith("--"):
+                break
+            content_id = re.search(r"Content-ID:\s*<(.+?)>", part, re.IGNORECASE)
+            status, payload = self._send_message()
+            reason = "OK" if status == 200 else _ERROR_REASONS.get(status, "Error")
+            payload = json.dumps(payload)
+            parts.append(
+                f"--{out_boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.group(1) if content_id else ''}>\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n"
+                f"{payload}\r\n"
+            )
+        data = ("".join(parts) + f"--{out_boundary}--\r\n").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={out_boundary}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _issue_token(self):
+        """Answer an OAuth refresh_token grant with a new short-lived access token"""
+        with self.server.lock:
+            self.server.stats["token_refreshes"] += 1
+            token = f"fake-access-{self.server.stats['token_refreshes']:06d}"
+            lifetime = self.server.token_lifetime
+            self.server.issued_tokens[token] = time.monotonic() + lifetime
+        self._send_json(200, {"access_token": token, "expires_in": lifetime, "token_type": "Bearer",
+                              "scope": "https://www.googleapis.com/auth/gmail.send"})
+
+    def _start_upload(self, path):
+        """Open a resumable upload session and answer with its Location"""
+        with self.server.lock:
+            self.server.stats["upload_sessions"] += 1
+            upload_id = f"upload-{self.server.stats['upload_sessions']:06d}"
+            sink = None
+            if self.server.upload_dir:
+                sink = open(os.path.join(self.server.upload_dir, f"{upload_id}.eml"), "wb")
+            self.server.uploads[upload_id] = {"received": 0, "sha256": hashlib.sha256(), "sink": sink}
+        self.send_response(200)
+        self.send_header("Location", f"http://{self.headers['Host']}{path}?uploadType=resumable&upload_id={upload_id}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _upload_chunk(self, query):
+        """Store one Content-Range chunk of a resumable upload"""
+        upload = self.server.uploads.get(query.get("upload_id", [""])[0])
+        if upload is None:
+            self._send_json(404, {"error": {"code": 404, "message": "Unknown upload"}})
+            return
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)|bytes \*/(\d+)", self.headers.get("Content-Range", ""))
+        length = int(self.headers.get("Content-Length", 0))
+        if match and match.group(1) is not None:
+            start, end, total = int(match.group(1)), int(match.group(2)), match.group(3)
+            with self.server.lock:
+                self.server.stats["upload_chunks"] += 1
+                every = self.server.chunk_error_every
+                fail = every and self.server.stats["upload_chunks"] % every == 0
+            if fail or start != upload["received"]:
+                self.rfile.read(length)
+                if fail:
+                    with self.server.lock:
+                        self.server.stats["errors"] += 1
+                    self._send_json(503, {"error": {"code": 503, "message": "Service Unavailable"}})
+                    return
+            else:
+                remaining = end - start + 1
+                while remaining:
+                    data = self.rfile.read(min(remaining, 64 * 1024))
+                    if not data:
+                        break
+                    upload["sha256"].update(data)
+                    if upload["sink"] is not None:
+                        upload["sink"].write(data)
+                    upload["received"] += len(data)
+                    remaining -= len(data)
+            done = total != "*" and upload["received"] == int(total)
+        else:
+            # "bytes */total": the client asks how much arrived after an error
+            self.rfile.read(length)
+            done = bool(match) and upload["received"] == int(match.group(4))
+        if done:
+            self._finish_upload(upload)
+            return
+        self.send_response(308)
+        if upload["received"]:
+            self.send_header("Range", f"bytes=0-{upload['received'] - 1}")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _finish_upload(self, upload):
+        if upload["sink"] is not None:
+            upload["sink"].close()
+            upload["sink"] = None
+        status, payload = self._send_message()
+        if status == 200 and "size" not in upload:
+            with self.server.lock:
+                self.server.stats["uploads"] += 1
+                self.server.completed_uploads.append(
+                    {"id": payload["id"], "size": upload["received"], "sha256": upload["sha256"].hexdigest()}
+                )
+            upload["size"] = upload["received"]
+        self._send_json(status, payload)
+
+    def do_PUT(self):
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+        self._upload_chunk(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path.startswith(("/upload/", "/resumable/upload/")):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)  # the (empty) message metadata
+            with self.server.lock:
+                self.server.stats["requests"] += 1
+            self._start_upload(parsed.path)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        path = urlparse(self.path).path
+        if path.endswith("/messages/send"):
+            self._send_json(*self._send_message())
+        elif path.startswith("/batch/"):
+            self._handle_batch(body)
+        elif path == "/token":
+            self._issue_token()
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+
+
+class FakeGmailServer:
+    """Threaded local HTTP server that imitates the Gmail send endpoint"""
+
+    handler_class = _FakeGmailHandler
+
+    def __init__(self, latency=0.0, error_every=0, error_status=503, token_lifetime=3600,
+                 upload_dir=None, chunk_error_every=0):
+        """
+        Args:
+            latency: Seconds of artificial server-side delay per request
+            error_every: Fail every Nth send (including batch parts)
+            error_status: HTTP status of injected failures (503 or 429)
+            token_lifetime: expires_in (seconds) of tokens from the token endpoint
+            upload_dir: Directory to save uploaded messages in (<upload id>.eml)
+            chunk_error_every: Fail every Nth upload chunk with 503
+        """
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.latency = latency
+        self.httpd.error_every = error_every
+        self.httpd.error_status = error_status
+        self.httpd.token_lifetime = token_lifetime
+        self.httpd.issued_tokens = {}  # access token -> monotonic expiry
+        self.httpd.upload_dir = upload_dir
+        self.httpd.chunk_error_every = chunk_error_every
+        self.httpd.uploads = {}  # upload id -> session state
+        self.httpd.completed_uploads = []  # {"id", "size", "sha256"} per uploaded message
+        self.httpd.stats = {
+            "connections": 0, "requests": 0, "batches": 0,
+            "send_calls": 0, "sent": 0, "errors": 0,
+            "token_refreshes": 0, "expired_tokens": 0,
+            "upload_sessions": 0, "upload_chunks": 0, "uploads": 0,
+        }
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def token_uri(self):
+        """OAuth token endpoint to put in token.json"""
+        return f"{self.url}/token"
+
+    @property
+    def stats(self):
+        with self.httpd.lock:
+            return dict(self.httpd.stats)
+
+    @property
+    def completed_uploads(self):
+        with self.httpd.lock:
+            return list(self.httpd.completed_uploads)
+
+    def reset_stats(self):
+        with self.httpd.lock:
+            for key in self.httpd.stats:
+                self.httpd.stats[key] = 0
+            self.httpd.completed_uploads.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
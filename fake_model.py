@@ -0,0 +1,45 @@
+"""
+Deterministic stand-in for LocalModelWrapper, for benchmarks and offline
+testing. Answers subject prompts with JSON and body prompts with a short
+email; an optional sleep simulates inference time (and releases the GIL
+like llama.cpp does).
+"""
+
+import re
+import time
+
+
+class FakeModel:
+    def __init__(self, latency=0.0, subject_failures=0):
+        """
+        Args:
+            latency: Seconds to sleep per generate call
+            subject_failures: How many subject attempts (JSON prompt, then the
+                two fallbacks) return nothing, to exercise the fallback chain
+        """
+        self.latency = latency
+        self.subject_failures = subject_failures
+        self.calls = 0
+
+    def _topic(self, prompt):
+        match = re.search(r"(?:REQUEST|Request|for):\s*(.+)", prompt)
+        topic = match.group(1) if match else "your request"
+        return " ".join(topic.split()[:6]).strip(" .")
+
+    def generate(self, prompt: str, max_tokens=512) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        topic = self._topic(prompt)
+        if "JSON" in prompt and "Request:" in prompt:
+            if self.subject_failures > 0:
+                return ""
+            return '{"subject": "%s"}' % topic.title().replace('"', "")
+        if "subject for" in prompt:
+            return "" if self.subject_failures > 1 else topic.title()
+        if "topic for" in prompt:
+            return "" if self.subject_failures > 2 else topic.title()
+        name = re.search(r"RECEIVER:\s*(\S+)", prompt)
+        name = name.group(1) if name else "there"
+        return (f"Dear {name},\n\nI am writing regarding {topic}. "
+                f"Please let me know if you have any questions.\n\nBest regards")
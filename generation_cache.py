@@ -0,0 +1,171 @@
+"""
+Persistent memoization of model generations.
+
+An in-memory LRU sits in front of a SQLite store. Keys cover everything
+that determines the output: the model file fingerprint, the normalized
+prompt, max_tokens, temperature, top_p, the stop list and any grammar.
+The SQLite store is size-bounded and evicts least-recently-used entries.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_FINGERPRINT_CHUNK = 1024 * 1024  # bytes hashed from each end of the model file
+_fingerprints = {}
+
+
+def model_fingerprint(model_path):
+    """
+    Cheap, stable hash of a (multi-GB) model file: size plus the first and
+    last megabyte. Cached per (path, size, mtime).
+    """
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return f"missing:{model_path}"
+    cache_key = (model_path, stat.st_size, stat.st_mtime)
+    if cache_key not in _fingerprints:
+        digest = hashlib.sha256(str(stat.st_size).encode())
+        with open(model_path, "rb") as f:
+            digest.update(f.read(_FINGERPRINT_CHUNK))
+            if stat.st_size > _FINGERPRINT_CHUNK:
+                f.seek(max(_FINGERPRINT_CHUNK, stat.st_size - _FINGERPRINT_CHUNK))
+                digest.update(f.read(_FINGERPRINT_CHUNK))
+        _fingerprints[cache_key] = digest.hexdigest()
+    return _fingerprints[cache_key]
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so trivially different prompts share a key"""
+    return " ".join(prompt.split())
+
+
+class GenerationCache:
+    def __init__(self, db_path=None, max_memory_entries=1024, max_disk_bytes=64 * 1024 * 1024,
+                 cache_sampled=True):
+        """
+        Args:
+            db_path: SQLite file for the persistent layer (None = memory only)
+            max_memory_entries: Size of the in-memory LRU
+            max_disk_bytes: Total stored text size before LRU eviction on disk
+            cache_sampled: Also cache outputs sampled with temperature > 0;
+                set False to only memoize deterministic (greedy) generations
+        """
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_sampled = cache_sampled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._db = None
+        self._disk_bytes = 0
+
+    def _connect(self):
+        """Open the SQLite store on first use (not at import/construction)"""
+        if self._db is None and self.db_path:
+            self._open_db()
+        return self._db
+
+    def _open_db(self):
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS generations_lru ON generations(last_used)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+
+    def cacheable(self, temperature):
+        return self.cache_sampled or temperature == 0
+
+    def make_key(self, model_id, prompt, max_tokens, temperature, top_p, stop=None, grammar=None):
+        payload = json.dumps(
+            [model_id, normalize_prompt(prompt), max_tokens, temperature, top_p,
+             list(stop or []), grammar],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached text for key, or None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            if self._connect() is not None:
+                row = self._db.execute("SELECT value FROM generations WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE generations SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            if self._connect() is None:
+                return
+            size = len(value.encode("utf-8"))
+            old = self._db.execute("SELECT size FROM generations WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO generations (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._evict_disk()
+            self._db.commit()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM generations ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._disk_bytes -= size
+                self.evictions += 1
+                if self._disk_bytes <= self.max_disk_bytes:
+                    return
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "cache_memory_hits": self.memory_hits,
+            "cache_disk_hits": self.disk_hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "cache_evictions": self.evictions,
+            "cache_disk_bytes": self._disk_bytes,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,349 @@
+"""
+Mail Merge
+Generates ONE draft for an announcement and renders it for every row of a
+JSONL/CSV file, instead of running the model once per recipient.
+
+Usage:
+    python mail_merge.py recipients.csv merged.jsonl --request "Tell {receiver_name} their {plan} plan renews on {date}"
+    python mail_merge.py recipients.csv merged.jsonl --template launch.json --send
+
+The draft is generated with merge fields in place of the receiver's name
+and of every {column} named in the request, cleaned like any other body,
+and compiled once into a template. {receiver_name} is the receiver's first
+name (contact directory, else the address, as in the interactive agent)
+unless the file has a receiver_name column; every other placeholder must
+be a column. Save the template with --save-template to review or edit it
+before sending. Rows already in the output file are skipped, so an
+interrupted run can simply be restarted.
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from string import Formatter
+
+from campaign_runner import RECEIVER_FIELDS, _pick, open_output
+
+RECEIVER_NAME_FIELD = "receiver_name"
+
+# Stands in for merge field N while the model writes the draft: a single
+# word, so the greeting rules in clean_email_body() treat it as a name
+_SENTINEL = "Mergefield{}"
+_SENTINEL_PATTERN = re.compile(r"\bMergefield(\d+)\b", re.IGNORECASE)
+
+
+# ============================================================
+# Template
+# ============================================================
+
+def _compile(text):
+    """
+    Turn "Dear {receiver_name}, ..." into a positional format function.
+
+    Returns:
+        (format function, field names in argument order)
+    """
+    pieces, fields = [], []
+    for literal, field, spec, conversion in Formatter().parse(text):
+        pieces.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        # Plain names only: templates may come from model output, and
+        # "{0.__class__}" style lookups must not reach str.format
+        if not field.isidentifier():
+            raise ValueError(f"Invalid merge field {{{field}}} (use a column name)")
+        pieces.append("{%d%s%s}" % (len(fields), f"!{conversion}" if conversion else "",
+                                    f":{spec}" if spec else ""))
+        fields.append(field)
+    return "".join(pieces).format, tuple(fields)
+
+
+class MergeTemplate:
+    """Subject and body with {field} placeholders, compiled once for rendering"""
+
+    def __init__(self, subject, body):
+        self.subject = subject
+        self.body = body
+        self._subject, self._subject_fields = _compile(subject)
+        self._body, self._body_fields = _compile(body)
+        self.fields = tuple(dict.fromkeys(self._subject_fields + self._body_fields))
+
+    def render(self, values):
+        """
+        Fill the template in for one recipient.
+
+        Args:
+            values: {field: value}; missing or None values render as ""
+
+        Returns:
+            (subject, body)
+        """
+        subject = self._subject(*[_value(values, field) for field in self._subject_fields])
+        body = self._body(*[_value(values, field) for field in self._body_fields])
+        return subject, body
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["subject"], data["body"])
+
+    def save(self, path, request=None):
+        data = {"request": request, "subject": self.subject, "body": self.body}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+
+def _value(values, field):
+    value = values.get(field)
+    return "" if value is None else value
+
+
+def _restore_fields(text, names):
+    """Replace the sentinels in generated text with {field} placeholders"""
+    def field(match):
+        # The model may invent "Mergefield7": leave numbers that were never issued as written
+        number = int(match.group(1))
+        return "{%s}" % names[number] if number < len(names) else match.group(0)
+
+    text = text.replace("{", "{{").replace("}", "}}")
+    return _SENTINEL_PATTERN.sub(field, text)
+
+
+def draft_template(agent, request, columns=()):
+    """
+    Generate the merge template for request with a single draft.
+
+    Args:
+        agent: EmailAgent whose model writes the draft
+        request: Instruction; may name columns as {column} placeholders
+        columns: Field names available in every row
+
+    Returns:
+        MergeTemplate (its body greets {receiver_name})
+    """
+    requested = [field for _, field, _, _ in Formatter().parse(request) if field is not None]
+    unknown = [field for field in requested if field != RECEIVER_NAME_FIELD and field not in columns]
+    if unknown:
+        raise ValueError(f"Request uses fields that are not columns: {', '.join(unknown)}")
+    names = list(dict.fromkeys([RECEIVER_NAME_FIELD] + requested))
+    sentinels = {name: _SENTINEL.format(i) for i, name in enumerate(names)}
+
+    agent._reset()
+    agent.original_request = request.format_map(sentinels)
+    try:
+        subject, body = agent.draft_email(receiver_name=sentinels[RECEIVER_NAME_FIELD])
+    finally:
+        agent._reset()
+    return MergeTemplate(_restore_fields(subject, names), _restore_fields(body, names))
+
+
+# ============================================================
+# Rendering
+# ============================================================
+
+def read_records(path):
+    """Yield (row_number, row dict) from a .jsonl or .csv file"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from enumerate(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            row_number = 0
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                yield row_number, json.loads(line)
+                row_number += 1
+
+
+def render_rows(template, records, contacts=None):
+    """
+    Render the template for each (row_number, row) in records.
+
+    Yields:
+        Result dicts: {"row", "receiver", "status": "rendered", "subject", "body"}
+        or {"row", "receiver", "status": "error", "error"}
+    """
+    from agents_email_agent import receiver_first_name
+
+    wants_name = RECEIVER_NAME_FIELD in template.fields
+    for row_number, row in records:
+        receiver = _pick(row, RECEIVER_FIELDS)
+        if not receiver or "@" not in receiver:
+            yield {"row": row_number, "receiver": receiver, "status": "error", "error": "missing receiver"}
+            continue
+        if wants_name and not row.get(RECEIVER_NAME_FIELD):
+            row = dict(row)
+            row[RECEIVER_NAME_FIELD] = receiver_first_name(receiver, contacts)
+        subject, body = template.render(row)
+        yield {"row": row_number, "receiver": receiver, "status": "rendered", "subject": subject, "body": body}
+
+
+def run_merge(input_path, output_path, template, contacts=None, outbox=None, batch_size=500,
+              progress_every=10000):
+    """
+    Render template for every row of input_path and append results to output_path.
+
+    Args:
+        input_path: JSONL or CSV file of recipients (one row each)
+        output_path: JSONL file results are streamed to (one line per row)
+        template: MergeTemplate to render
+        contacts: Optional ContactDirectory for receiver names
+        outbox: Optional Outbox; rendered emails are queued there in batches
+        batch_size: Rows written (and queued) per batch
+        progress_every: Print a progress line every N rows
+
+    Returns:
+        dict with row counts and rows/sec
+    """
+    finished, out = open_output(output_path)
+    if finished:
+        print(f"→ Resuming: {len(finished)} rows already merged in {output_path}")
+
+    records = ((n, row) for n, row in read_records(input_path) if n not in finished)
+    rendered = failed = 0
+    next_progress = progress_every
+    started = time.perf_counter()
+    key_prefix = f"merge:{os.path.abspath(output_path)}:"
+
+    with out:
+        def flush(batch):
+            if outbox is not None:
+                ready = [r for r in batch if r["status"] == "rendered"]
+                ids = outbox.enqueue_many(((r["receiver"], r["subject"], r["body"]) for r in ready),
+                                          keys=[key_prefix + str(r["row"]) for r in ready])
+                for record, outbox_id in zip(ready, ids):
+                    record.update(status="queued", outbox_id=outbox_id)
+            # Written after queueing: if a crash comes in between, the restart renders this
+            # batch again, but the outbox keys (output file, row) keep it from being queued twice
+            out.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+            out.flush()
+
+        batch = []
+        for record in render_rows(template, records, contacts):
+            if record["status"] == "error":
+                failed += 1
+            else:
+                rendered += 1
+            batch.append(record)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+            if progress_every and rendered + failed >= next_progress:
+                next_progress += progress_every
+                elapsed = time.perf_counter() - started
+                print(f"→ {rendered + failed} rows ({(rendered + failed) / elapsed:.0f} rows/sec)")
+        if batch:
+            flush(batch)
+
+    elapsed = time.perf_counter() - started
+    processed = rendered + failed
+    return {
+        "rendered": rendered,
+        "queued": rendered if outbox is not None else 0,
+        "failed": failed,
+        "skipped": len(finished),
+        "elapsed_sec": round(elapsed, 3),
+        "rows_per_sec": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def _columns(input_path):
+    """Field names of the first row"""
+    first = next(read_records(input_path), None)
+    return list(first[1]) if first else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render one generated draft for every row of a JSONL/CSV file")
+    parser.add_argument("input", help="JSONL or CSV file with a receiver (and any merge fields) per row")
+    parser.add_argument("output", help="JSONL file to stream rendered emails to (resumable)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--request", help="Instruction for the draft; {column} placeholders are merged per row")
+    source.add_argument("--template", help="Template JSON saved by --save-template (no model call)")
+    parser.add_argument("--save-template", help="Write the generated template to this JSON file")
+    parser.add_argument("--send", action="store_true",
+                        help="Queue every email in the outbox and send them (rate-limited)")
+    parser.add_argument("--progress-every", type=int, default=10000,
+                        help="Print progress every N rows (0 to disable)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        print(f"✗ Input file not found: {args.input}")
+        return 1
+
+    from agents_email_agent import CONTACTS_PATH, OUTBOX_PATH
+
+    contacts = None
+    if CONTACTS_PATH:
+        from contacts import ContactDirectory
+
+        contacts = ContactDirectory(CONTACTS_PATH)
+
+    columns = _columns(args.input)
+    if args.template:
+        template = MergeTemplate.load(args.template)
+    else:
+        from agents_email_agent import EmailAgent
+
+        try:
+            template = draft_template(EmailAgent(contacts=contacts), args.request, columns)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return 1
+        missing = [f for _, f, _, _ in Formatter().parse(args.request)
+                   if f is not None and f not in template.fields]
+        if RECEIVER_NAME_FIELD not in template.fields:
+            missing.append(RECEIVER_NAME_FIELD)
+        if missing:
+            print(f"⚠ The draft does not use {', '.join('{%s}' % f for f in dict.fromkeys(missing))}; "
+                  f"review it with --save-template")
+    if args.save_template:
+        template.save(args.save_template, request=args.request)
+        print(f"✓ Template saved to {args.save_template}")
+    unknown = [f for f in template.fields if f != RECEIVER_NAME_FIELD and f not in columns]
+    if unknown:
+        print(f"✗ Template uses fields that are not columns of {args.input}: {', '.join(unknown)}")
+        return 1
+
+    print("=" * 60)
+    print("📧 MERGE TEMPLATE")
+    print("=" * 60)
+    print(f"Subject: {template.subject}\n\n{template.body}")
+
+    outbox = None
+    if args.send:
+        from outbox import Outbox
+
+        outbox = Outbox(OUTBOX_PATH)
+    stats = run_merge(args.input, args.output, template, contacts=contacts, outbox=outbox,
+                      progress_every=args.progress_every)
+
+    print("=" * 60)
+    print("📊 MAIL MERGE SUMMARY")
+    print("=" * 60)
+    print(f"Rendered: {stats['rendered']}  Failed: {stats['failed']}  Skipped: {stats['skipped']}")
+    print(f"Throughput: {stats['rows_per_sec']} rows/sec")
+    if outbox is not None:
+        print(f"📮 {stats['queued']} emails queued in {OUTBOX_PATH}; sending (Ctrl+C leaves the rest queued)...")
+        outbox.start()
+        try:
+            outbox.wait_idle()
+        except KeyboardInterrupt:
+            pass
+        counts = outbox.counts()
+        outbox.close()
+        print(f"Sent: {counts.get('sent', 0)}  Failed: {counts.get('failed', 0)}  "
+              f"Still queued: {counts.get('pending', 0) + counts.get('sending', 0)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Lightweight metrics: counters and histograms with a Prometheus text
+exporter and optional structured (JSON) log lines.
+
+Disabled unless EMAIL_AGENT_METRICS=1 (or configure(enabled=True)); when
+disabled every call returns after a single flag check.
+
+    EMAIL_AGENT_METRICS=1          record metrics
+    EMAIL_AGENT_METRICS_PORT=9100  serve them at http://127.0.0.1:9100/metrics
+    EMAIL_AGENT_METRICS_LOG=1      also emit one JSON log line per observation
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("email_agent.metrics")
+
+# Seconds; covers sub-millisecond cleaning up to multi-minute CPU generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+COUNT_BUCKETS = (1, 2, 3, 4, 5)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)  # tokens/sec
+
+
+class _State:
+    enabled = False
+    log = False
+
+
+_state = _State()
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_buckets = {}     # name -> bucket bounds
+_help = {}
+
+
+def enabled():
+    return _state.enabled
+
+
+def configure(enabled=True, log=False, port=None):
+    """Turn metrics on/off, optionally with JSON log lines and an HTTP endpoint"""
+    _state.enabled = enabled
+    _state.log = log
+    if log and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    if enabled and port:
+        return start_http_server(port)
+    return None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _log(kind, name, value, labels):
+    logger.info(json.dumps({"ts": round(time.time(), 3), "type": kind, "metric": name,
+                            "value": value, **labels}))
+
+
+def inc(name, amount=1, **labels):
+    """Add amount to a counter"""
+    if not _state.enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    if _state.log:
+        _log("counter", name, amount, labels)
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record one histogram observation"""
+    if not _state.enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        bounds = _buckets.setdefault(name, buckets)
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [0] * (len(bounds) + 2)
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+    if _state.log:
+        _log("histogram", name, value, labels)
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager observing the elapsed seconds into histogram name"""
+    if not _state.enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(stage):
+    """Decorator recording email_agent_stage_seconds{stage=...} per call"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe("email_agent_stage_seconds", time.perf_counter() - started, stage=stage)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                if name in _help:
+                    lines.append(f"# HELP {name} {_help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), entry in histograms:
+            if name not in seen:
+                seen.add(name)
+                if name in _help:
+                    lines.append(f"# HELP {name} {_help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(_buckets[name], entry):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {entry[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {entry[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {entry[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics in a background thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"📈 Metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+describe("email_agent_stage_seconds", "Time spent in each EmailAgent stage")
+describe("email_agent_subject_attempts", "Model calls needed to produce a subject")
+describe("email_agent_subject_fallbacks_total", "Subjects produced by a fallback prompt")
+describe("email_agent_draft_failures_total", "Single-pass drafts that fell back to subject + body")
+describe("model_prompt_eval_seconds", "Time to first token (prompt evaluation)")
+describe("model_eval_seconds", "Time from first to last token (token generation)")
+describe("model_generation_seconds", "Total time of a model call")
+describe("model_prompt_tokens", "Prompt tokens per model call")
+describe("model_completion_tokens", "Completion tokens per model call")
+describe("model_prompt_tokens_total", "Prompt tokens evaluated")
+describe("model_completion_tokens_total", "Completion tokens generated")
+describe("model_generation_cache_lookups_total", "Generation cache lookups by outcome")
+describe("gmail_send_seconds", "Latency of Gmail messages.send calls")
+describe("gmail_sends_total", "Gmail send attempts by status")
+
+if os.environ.get("EMAIL_AGENT_METRICS", "0") == "1":
+    import multiprocessing
+
+    configure(
+        enabled=True,
+        log=os.environ.get("EMAIL_AGENT_METRICS_LOG", "0") == "1",
+        # Child processes (e.g. model workers) must not bind the same port
+        port=int(os.environ["EMAIL_AGENT_METRICS_PORT"])
+        if os.environ.get("EMAIL_AGENT_METRICS_PORT") and multiprocessing.parent_process() is None else None,
+    )
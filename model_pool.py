@@ -0,0 +1,358 @@
+"""
+Multi-process model worker pool.
+
+One llama.cpp context generates one sequence at a time, and adding threads
+to it stops helping long before a large machine runs out of cores. This
+pool runs N worker processes, each with its own Llama on its own slice of
+cores. They all mmap the same GGUF file, so the OS page cache holds the
+weights once.
+
+PooledModelWrapper is a drop-in LocalModelWrapper: the generation cache,
+metrics and JSON/grammar handling stay in the calling process, and only
+generate_stream() is routed to the least-loaded worker. Crashed workers
+are restarted; calls that had not produced any output yet are retried on
+another worker.
+
+Usage:
+    EMAIL_AGENT_MODEL_WORKERS=4 python test_email_agent.py
+    model = PooledModelWrapper(workers=4)
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import metrics
+from agents_email_agent import (
+    BODY_PROMPT_PREFIX,
+    DRAFT_PROMPT_PREFIX,
+    MODEL_PARAMS,
+    MODEL_PATH,
+    PREFIX_CACHE_ENABLED,
+    SPEC_DECODING,
+    SPEC_DRAFT_MODEL_PATH,
+    SPEC_DRAFT_TOKENS,
+    SUBJECT_PROMPT_PREFIX,
+    LazyLlama,
+    LocalModelWrapper,
+)
+
+MAX_JOB_ATTEMPTS = 2  # a job is retried once if its worker dies before answering
+
+
+class ModelWorkerCrashed(RuntimeError):
+    pass
+
+
+# ============================================================
+# Worker process
+# ============================================================
+
+class _RemoteCancel:
+    """
+    Cancel flag for the job a worker is running. llama.cpp checks it after
+    every token (stopping criteria), so it reads pending messages from the
+    parent and keeps anything that is not a cancel for later.
+    """
+
+    def __init__(self, conn, backlog):
+        self.conn = conn
+        self.backlog = backlog
+        self.job_id = None
+        self.cancelled = False
+
+    def reset(self, job_id):
+        self.job_id = job_id
+        self.cancelled = False
+
+    def is_set(self):
+        while not self.cancelled and self.conn.poll():
+            message = self.conn.recv()
+            if message[0] == "cancel" and message[1] == self.job_id:
+                self.cancelled = True
+            else:
+                self.backlog.append(message)
+        return self.cancelled
+
+
+def _worker_main(conn, model_path, params, cores):
+    """Serve generate_stream jobs from conn until told to stop"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+    from draft_models import SpeculativeDecoding
+    from prefix_cache import PrefixStateCache
+
+    speculative = SpeculativeDecoding.from_config(SPEC_DECODING, SPEC_DRAFT_MODEL_PATH, SPEC_DRAFT_TOKENS)
+    model = LocalModelWrapper(
+        LazyLlama(model_path, idle_timeout=0, draft_model=speculative, **params),
+        # In-memory prefix states only: workers must not race on one cache dir
+        prefix_cache=PrefixStateCache(
+            [SUBJECT_PROMPT_PREFIX, BODY_PROMPT_PREFIX, DRAFT_PROMPT_PREFIX]
+        ) if PREFIX_CACHE_ENABLED else None,
+        speculative=speculative,
+    )
+    backlog = deque()  # messages read while checking for cancellations
+    cancel = _RemoteCancel(conn, backlog)
+    while True:
+        try:
+            message = backlog.popleft() if backlog else conn.recv()
+        except (EOFError, OSError):
+            return
+        kind, job_id = message[0], message[1]
+        if kind == "stop":
+            return
+        if kind == "cancel":
+            continue  # that job already finished
+        if kind == "warm_up":
+            model.warm_up()
+            conn.send(("done", job_id, None))
+            continue
+
+        prompt, max_tokens, grammar, temperature, top_p, stop = message[2:]
+        model.temperature, model.top_p, model.stop = temperature, top_p, stop
+        cancel.reset(job_id)
+        try:
+            for piece in model.generate_stream(prompt, max_tokens=max_tokens, grammar=grammar, cancel=cancel):
+                conn.send(("piece", job_id, piece))
+            conn.send(("done", job_id, model.last_call_metrics))
+        except Exception as e:
+            conn.send(("error", job_id, f"{type(e).__name__}: {e}"))
+
+
+# ============================================================
+# Dispatcher
+# ============================================================
+
+class _Job:
+    __slots__ = ("job_id", "message", "results", "worker", "attempts", "started")
+
+    def __init__(self, job_id, message):
+        self.job_id = job_id
+        self.message = message
+        self.results = queue.Queue()
+        self.worker = None
+        self.attempts = 0
+        self.started = False  # True once output has been handed to the caller
+
+
+class _Worker:
+    def __init__(self, index, cores):
+        self.index = index
+        self.cores = cores
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.jobs = {}
+        self.completed = 0
+
+
+class PooledModelWrapper(LocalModelWrapper):
+    def __init__(self, workers=2, model_path=None, threads_per_worker=None, generation_cache=None,
+                 pin_cores=True, **params):
+        """
+        Args:
+            workers: Number of model processes
+            model_path: GGUF file (defaults to MODEL_PATH)
+            threads_per_worker: Threads per process (default: CPU count / workers)
+            generation_cache: Optional GenerationCache, shared by all workers
+            pin_cores: Pin each worker to its own slice of cores (Linux)
+            **params: Extra Llama parameters for every worker
+        """
+        model_path = model_path or MODEL_PATH
+        # The parent only needs the vocabulary (token counting, cache keys)
+        super().__init__(LazyLlama(model_path, vocab_only=True), generation_cache=generation_cache)
+        cpus = os.cpu_count() or 1
+        self.workers = workers
+        self.model_path = model_path
+        self.threads_per_worker = threads_per_worker or max(1, cpus // workers)
+        self.params = {
+            **MODEL_PARAMS, **params,
+            "n_threads": self.threads_per_worker,
+            "n_threads_batch": self.threads_per_worker,
+            "use_mmap": True,  # share the weights through the page cache
+        }
+        self._workers = []
+        for i in range(workers):
+            first = i * self.threads_per_worker
+            cores = list(range(first, first + self.threads_per_worker)) if pin_cores and first < cpus else None
+            self._workers.append(_Worker(i, cores))
+        self._context = multiprocessing.get_context("spawn")
+        self._pool_lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._started = False
+        self._closing = False
+        self.restarts = 0
+
+    # ---- worker lifecycle ----
+
+    def _start_worker(self, worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.model_path, self.params, worker.cores),
+            daemon=True,
+            name=f"model-worker-{worker.index}",
+        )
+        worker.process.start()
+        child_conn.close()  # so the parent sees EOF when the worker dies
+        worker.conn = parent_conn
+        threading.Thread(target=self._reader, args=(worker, parent_conn), daemon=True,
+                         name=f"model-worker-{worker.index}-reader").start()
+
+    def _ensure_started(self):
+        if not self._started:
+            for worker in self._workers:
+                self._start_worker(worker)
+            self._started = True
+
+    def _reader(self, worker, conn):
+        """Route a worker's replies to the waiting jobs"""
+        while True:
+            try:
+                kind, job_id, payload = conn.recv()
+            except (EOFError, OSError):
+                self._on_worker_exit(worker, conn)
+                return
+            with self._pool_lock:
+                job = worker.jobs.get(job_id)
+                if job is not None and kind in ("done", "error"):
+                    del worker.jobs[job_id]
+                    worker.completed += 1
+            if job is not None:
+                job.results.put((kind, payload))
+
+    def _on_worker_exit(self, worker, conn):
+        with self._pool_lock:
+            if self._closing or worker.conn is not conn:
+                return
+            orphans = list(worker.jobs.values())
+            worker.jobs.clear()
+            worker.process.join(1)
+            print(f"⚠ Model worker {worker.index} exited (code {worker.process.exitcode}); restarting")
+            self.restarts += 1
+            metrics.inc("model_worker_restarts_total")
+            self._start_worker(worker)
+        for job in orphans:
+            if not job.started and job.attempts < MAX_JOB_ATTEMPTS:
+                self._dispatch(job)
+            else:
+                job.results.put(("crashed", f"model worker {worker.index} crashed"))
+
+    def _dispatch(self, job):
+        """Send job to the worker with the fewest jobs in flight"""
+        with self._pool_lock:
+            self._ensure_started()
+            worker = min(self._workers, key=lambda w: (len(w.jobs), w.index))
+            worker.jobs[job.job_id] = job
+            job.worker = worker
+            job.attempts += 1
+        try:
+            with worker.send_lock:
+                worker.conn.send(job.message)
+        except (OSError, ValueError):
+            pass  # the worker just died: its reader re-dispatches the job
+
+    def _cancel(self, job):
+        worker = job.worker
+        try:
+            with worker.send_lock:
+                worker.conn.send(("cancel", job.job_id))
+        except (OSError, ValueError):
+            pass
+
+    # ---- model interface ----
+
+    def generate_stream(self, prompt: str, max_tokens=512, grammar=None, cancel=None):
+        """Yield text pieces generated by the least-loaded worker process"""
+        job = _Job(next(self._job_ids), None)
+        job.message = ("generate", job.job_id, prompt, max_tokens, grammar,
+                       self.temperature, self.top_p, list(self.stop))
+        started = time.perf_counter()
+        first_token_at = None
+        tokens = 0
+        finished = False
+        self._dispatch(job)
+        cancel_sent = False
+        try:
+            while True:
+                if cancel is not None and not cancel_sent and cancel.is_set():
+                    self._cancel(job)
+                    cancel_sent = True
+                try:
+                    # Wake up now and then to forward a cancel set while nothing arrives
+                    kind, payload = job.results.get(timeout=None if cancel is None or cancel_sent else 0.05)
+                except queue.Empty:
+                    continue
+                if kind == "piece":
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    tokens += 1
+                    job.started = True
+                    yield payload
+                elif kind == "done":
+                    finished = True
+                    self.call_metrics.append({**(payload or {}), "worker": job.worker.index})
+                    if metrics.enabled():
+                        self._export_call_metrics(prompt, None, tokens, started, first_token_at,
+                                                  time.perf_counter())
+                    if payload and "spec_method" in payload:
+                        self._export_draft_metrics(payload)
+                    return
+                else:
+                    finished = True
+                    raise (ModelWorkerCrashed if kind == "crashed" else RuntimeError)(payload)
+        finally:
+            if not finished:
+                # Caller stopped reading (or was cancelled): stop the worker too
+                self._cancel(job)
+
+    def warm_up(self):
+        """Start every worker and load its model"""
+        jobs = []
+        with self._pool_lock:
+            self._ensure_started()
+        for worker in self._workers:
+            job = _Job(next(self._job_ids), None)
+            job.message = ("warm_up", job.job_id)
+            with self._pool_lock:
+                worker.jobs[job.job_id] = job
+                job.worker = worker
+            with worker.send_lock:
+                worker.conn.send(job.message)
+            jobs.append(job)
+        for job in jobs:
+            job.results.get()
+        return self
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(
+            pool_workers=self.workers,
+            pool_threads_per_worker=self.threads_per_worker,
+            pool_restarts=self.restarts,
+            pool_completed=[w.completed for w in self._workers],
+        )
+        return stats
+
+    def close(self):
+        """Stop all worker processes"""
+        with self._pool_lock:
+            self._closing = True
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            try:
+                with worker.send_lock:
+                    worker.conn.send(("stop", None))
+            except (OSError, ValueError):
+                pass
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.process.terminate()
@@ -0,0 +1,326 @@
+"""
+Durable outbox for confirmed emails.
+
+Emails are written to a SQLite (WAL) table before anything is sent, then
+drained by worker threads under a token-bucket rate limit. Failures with
+429/5xx (or transport errors) are retried with exponential backoff and
+full jitter; rows left "sending" by a crash are re-queued on start, so
+delivery is at-least-once across restarts.
+
+Usage:
+    outbox = Outbox("outbox.sqlite3").start()
+    outbox.enqueue("john@example.com", "Subject", "Body")
+    ...
+    outbox.stop()
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+import metrics
+from tools_send_email_gmail import (
+    RETRYABLE_STATUSES,
+    get_auth_manager,
+    get_gmail_service,
+    send_message,
+)
+
+# Gmail allows 250 quota units per user per second and messages.send
+# costs 100, i.e. 2.5 sends/sec sustained with short bursts
+GMAIL_SENDS_PER_SECOND = 2.5
+GMAIL_SEND_BURST = 5
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        """Block until a token is available; returns False if stop_event is set"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
+
+
+class Outbox:
+    def __init__(self, db_path="outbox.sqlite3", workers=4, rate=GMAIL_SENDS_PER_SECOND,
+                 burst=GMAIL_SEND_BURST, max_attempts=8, base_delay=1.0, max_delay=300.0,
+                 creds=None, api_endpoint=None, send_func=None):
+        """
+        Args:
+            db_path: SQLite file holding the queue
+            workers: Sender threads
+            rate: Sends per second allowed by the token bucket
+            burst: Token bucket capacity
+            max_attempts: Attempts before a message is marked failed
+            base_delay: First retry delay in seconds (doubled per attempt, jittered)
+            max_delay: Upper bound of a retry delay
+            creds: Credentials to use (defaults to the auth manager's)
+            api_endpoint: Optional API root override (e.g. a local fake server)
+            send_func: Optional callable(to, subject, body[, attachments]) -> message
+                ID that replaces the Gmail call; raise to signal a failure
+        """
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.creds = creds
+        self.api_endpoint = api_endpoint
+        self.send_func = send_func
+        self.limiter = TokenBucket(rate, burst)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " to_addr TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL,"
+            " attachments TEXT,"  # JSON list of file paths, read when the message is sent
+            " status TEXT NOT NULL DEFAULT 'pending',"  # pending | sending | sent | failed
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL DEFAULT 0,"
+            " message_id TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL,"
+            " dedupe_key TEXT)"  # set by enqueue_many(keys=...): queued at most once
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}
+        if "attachments" not in columns:  # queue created before attachments were supported
+            self._db.execute("ALTER TABLE outbox ADD COLUMN attachments TEXT")
+        if "dedupe_key" not in columns:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN dedupe_key TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_attempt)")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_dedupe ON outbox(dedupe_key)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._threads = []
+        self.recovered = 0
+
+    # ---- queue ----
+
+    def enqueue(self, to, subject, body, attachments=None):
+        """
+        Persist one email for delivery and return its outbox ID.
+        Attachments are stored as paths; the files must still exist when it is sent.
+        """
+        now = time.time()
+        attachments = json.dumps(list(attachments)) if attachments else None
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (to_addr, subject, body, attachments, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (to, subject, body, attachments, now, now),
+            )
+            self._db.commit()
+            self._wakeup.notify()
+        metrics.inc("outbox_enqueued_total")
+        return cursor.lastrowid
+
+    def enqueue_many(self, messages, keys=None):
+        """
+        Persist many emails in one transaction (bulk sends, e.g. mail merge).
+
+        Args:
+            messages: Iterable of (to, subject, body) or (to, subject, body, attachments)
+            keys: Optional idempotency key per message; a message whose key was
+                queued before is not queued again and keeps its first outbox ID
+
+        Returns:
+            List of outbox IDs, in order
+        """
+        now = time.time()
+        rows = []
+        for message in messages:
+            to, subject, body, *rest = message
+            attachments = rest[0] if rest else None
+            rows.append((to, subject, body, json.dumps(list(attachments)) if attachments else None, now, now))
+        keys = [None] * len(rows) if keys is None else list(keys)
+        ids = []
+        added = 0
+        with self._lock:
+            for row, key in zip(rows, keys):
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO outbox (to_addr, subject, body, attachments, created, updated, dedupe_key)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*row, key),
+                )
+                if cursor.rowcount:
+                    ids.append(cursor.lastrowid)
+                    added += 1
+                else:
+                    ids.append(self._db.execute("SELECT id FROM outbox WHERE dedupe_key = ?", (key,)).fetchone()[0])
+            self._db.commit()
+            self._wakeup.notify_all()
+        metrics.inc("outbox_enqueued_total", added)
+        return ids
+
+    def _claim(self):
+        """Mark the oldest due message as sending; returns its row or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, to_addr, subject, body, attempts, attachments FROM outbox"
+                " WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE outbox SET status = 'sending', updated = ? WHERE id = ?", (time.time(), row[0])
+                )
+                self._db.commit()
+            return row
+
+    def _next_due_in(self):
+        """Seconds until the next pending message is due (None if there is none)"""
+        row = self._db.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _finish(self, row_id, status, message_id=None, error=None, attempts=None, next_attempt=0.0):
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, message_id = ?, error = ?,"
+                " attempts = COALESCE(?, attempts), next_attempt = ?, updated = ? WHERE id = ?",
+                (status, message_id, error, attempts, next_attempt, time.time(), row_id),
+            )
+            self._db.commit()
+            if status == "pending":
+                self._wakeup.notify()
+        metrics.inc("outbox_sends_total", status=status if status != "pending" else "retry")
+
+    def _recover(self):
+        """Re-queue messages a previous process claimed but never finished"""
+        with self._lock:
+            self.recovered = self._db.execute(
+                "UPDATE outbox SET status = 'pending', next_attempt = 0 WHERE status = 'sending'"
+            ).rowcount
+            self._db.commit()
+        if self.recovered:
+            print(f"→ Outbox: re-queued {self.recovered} interrupted send(s)")
+
+    def retry_delay(self, attempts):
+        """Full-jitter exponential backoff for the given attempt number"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempts - 1))))
+
+    # ---- workers ----
+
+    def _send(self, to, subject, body, attachments=None):
+        if self.send_func is not None:
+            return self.send_func(to, subject, body, *([attachments] if attachments else []))
+        creds = self.creds or get_auth_manager().get_credentials()
+        return send_message(get_gmail_service(creds, self.api_endpoint), to, subject, body, attachments)
+
+    def _worker(self):
+        while not self._stop.is_set():
+            row = self._claim()
+            if row is None:
+                with self._lock:
+                    if self._stop.is_set():
+                        return
+                    due_in = self._next_due_in()
+                    self._wakeup.wait(1.0 if due_in is None else min(due_in, 1.0))
+                continue
+            if not self.limiter.acquire(self._stop):
+                # Shutting down: hand the claimed row back
+                self._finish(row[0], "pending", attempts=row[4])
+                return
+            self._deliver(row)
+
+    def _deliver(self, row):
+        row_id, to, subject, body, attempts, attachments = row
+        attempts += 1
+        try:
+            message_id = self._send(to, subject, body, json.loads(attachments) if attachments else None)
+        except Exception as e:
+            resp = getattr(e, "resp", None)
+            if isinstance(e, HttpError):
+                retryable = resp.status in RETRYABLE_STATUSES
+            else:
+                # Missing or oversized attachments will not fix themselves
+                retryable = not isinstance(e, (ValueError, FileNotFoundError))
+            if retryable and attempts < self.max_attempts:
+                delay = self.retry_delay(attempts)
+                # Honour the server's Retry-After (seconds) when it asks for longer
+                retry_after = resp.get("retry-after") if isinstance(e, HttpError) else None
+                if retry_after and str(retry_after).isdigit():
+                    delay = max(delay, float(retry_after))
+                self._finish(row_id, "pending", error=str(e), attempts=attempts,
+                             next_attempt=time.time() + delay)
+            else:
+                self._finish(row_id, "failed", error=str(e), attempts=attempts)
+            return
+        self._finish(row_id, "sent", message_id=message_id, attempts=attempts)
+
+    def start(self):
+        """Re-queue interrupted sends and start the worker threads"""
+        self._recover()
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True, name=f"outbox-{i}")
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop the workers; unsent messages stay queued for the next start()"""
+        self._stop.set()
+        with self._lock:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wait_idle(self, timeout=None):
+        """Block until nothing is pending or sending; returns True if drained"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            counts = self.counts()
+            if not counts.get("pending") and not counts.get("sending"):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def close(self):
+        self.stop()
+        self._db.close()
+
+    # ---- inspection ----
+
+    def counts(self):
+        """Number of messages per status"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+    def get(self, outbox_id):
+        """Return one message's delivery record as a dict (or None)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, to_addr, subject, status, attempts, message_id, error FROM outbox WHERE id = ?",
+                (outbox_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "to", "subject", "status", "attempts", "message_id", "error"), row))
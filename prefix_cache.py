@@ -0,0 +1,131 @@
+"""
+Prompt-prefix KV-state cache for llama.cpp.
+
+The subject and body prompts start with long constant instruction blocks.
+This cache evaluates each registered prefix once, keeps the resulting KV
+state (in memory and optionally on disk), and restores it before a prompt
+that starts with that prefix, so llama.cpp only evaluates the per-request
+suffix.
+"""
+
+import hashlib
+import os
+import pickle
+import time
+
+
+class PrefixStateCache:
+    def __init__(self, prefixes=(), cache_dir=None):
+        """
+        Args:
+            prefixes: Constant prompt prefixes worth caching
+            cache_dir: Optional directory to persist evaluated states in
+        """
+        self.prefixes = list(prefixes)
+        self.cache_dir = cache_dir
+        self._states = {}   # prefix -> (tokens, LlamaState, prompt-eval ms per token)
+        self.hits = 0
+        self.misses = 0
+        self.prefix_tokens_reused = 0
+        self.prompt_eval_ms_saved = 0.0
+
+    def register(self, prefix):
+        if prefix not in self.prefixes:
+            self.prefixes.append(prefix)
+
+    def match(self, prompt):
+        """Return the longest registered prefix the prompt starts with"""
+        best = None
+        for prefix in self.prefixes:
+            if prompt.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return best
+
+    def _disk_path(self, llm, prefix):
+        key = f"{getattr(llm, 'model_path', '')}\n{prefix}".encode("utf-8")
+        return os.path.join(self.cache_dir, hashlib.sha256(key).hexdigest()[:32] + ".state")
+
+    def _load_from_disk(self, llm, prefix):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(llm, prefix)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"⚠ Ignoring unreadable prefix state {path}: {e}")
+            return None
+
+    def _save_to_disk(self, llm, prefix, entry):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._disk_path(llm, prefix)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _record_hit(self, llm, tokens, prompt, ms_per_token):
+        # llama.cpp only reuses the tokens the prompt's own tokenization shares
+        # with the prefix (a trailing space can merge into the next word)
+        prompt_tokens = llm.tokenize(prompt.encode("utf-8"), special=True)
+        reused = 0
+        for cached, token in zip(tokens, prompt_tokens):
+            if cached != token:
+                break
+            reused += 1
+        self.hits += 1
+        self.prefix_tokens_reused += reused
+        self.prompt_eval_ms_saved += reused * ms_per_token
+
+    def prepare(self, llm, prompt):
+        """
+        Make sure llm's KV cache holds the evaluated prefix of prompt.
+        Must be called with exclusive access to llm, right before llm(prompt).
+        """
+        prefix = self.match(prompt)
+        if prefix is None:
+            return
+
+        entry = self._states.get(prefix)
+        if entry is None:
+            entry = self._load_from_disk(llm, prefix)
+            if entry is not None:
+                self._states[prefix] = entry
+
+        if entry is not None:
+            tokens, state, ms_per_token = entry
+            n_tokens = len(tokens)
+            # Already resident (e.g. the previous call used the same prefix)
+            if not (llm.n_tokens >= n_tokens and list(llm.input_ids[:n_tokens]) == tokens):
+                llm.load_state(state)
+            self._record_hit(llm, tokens, prompt, ms_per_token)
+            return
+
+        # Miss: evaluate the prefix once and snapshot the KV state
+        self.misses += 1
+        tokens = llm.tokenize(prefix.encode("utf-8"), special=True)
+        started = time.perf_counter()
+        llm.reset()
+        llm.eval(tokens)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        entry = (list(tokens), llm.save_state(), elapsed_ms / max(1, len(tokens)))
+        self._states[prefix] = entry
+        self._save_to_disk(llm, prefix, entry)
+
+    def clear(self):
+        """Forget in-memory states (e.g. after the model is unloaded)"""
+        self._states.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "prefix_hits": self.hits,
+            "prefix_misses": self.misses,
+            "prefix_hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "prefix_tokens_reused": self.prefix_tokens_reused,
+            "prompt_eval_ms_saved": round(self.prompt_eval_ms_saved, 1),
+        }
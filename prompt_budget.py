@@ -0,0 +1,160 @@
+"""
+Token-budget-aware prompt building.
+
+Prompt templates are written indented in the source for readability;
+dedent_template() strips that indentation once at import so llama.cpp does
+not evaluate it on every call. PromptBudget measures prompts with the
+model's own tokenizer (llm.tokenize), cuts oversized requests down to a
+token budget (keeping their beginning and end) and caps max_tokens to
+what is left of the context window.
+"""
+
+import textwrap
+
+import metrics
+
+CHARS_PER_TOKEN = 4     # estimate used when the model exposes no tokenizer
+CONTEXT_MARGIN = 8      # tokens kept free at the end of the context window
+MIN_OUTPUT_TOKENS = 16  # never ask for fewer tokens than this
+TRUNCATION_MARK = " [...] "
+
+# Dedented template -> original indented source, for the tokens-saved report
+_template_sources = {}
+
+
+def dedent_template(text):
+    """Remove the source indentation (and leading newline) of a prompt template"""
+    dedented = textwrap.dedent(text).lstrip("\n")
+    _template_sources[dedented] = text
+    return dedented
+
+
+class PromptBudget:
+    def __init__(self, model, n_ctx=4096, request_tokens=512):
+        """
+        Args:
+            model: Model wrapper; its .llm (if any) provides tokenize/detokenize
+            n_ctx: Context window size the model was loaded with
+            request_tokens: Maximum tokens of user request text per prompt
+        """
+        self.model = model
+        self.n_ctx = n_ctx
+        self.request_tokens = request_tokens
+        self._fitted = {}          # last requests -> (fitted text, tokens removed)
+        self._template_saved = {}  # dedented template -> tokens its indentation cost
+        self.calls = 0
+        self.truncated = 0
+        self.tokens_saved = 0
+        self.last_saved = 0
+        self.last_prompt_tokens = 0
+
+    # ---- tokenizer access (resolved per call: loading the model is lazy) ----
+
+    def _llm(self):
+        llm = getattr(self.model, "llm", None)
+        return llm if hasattr(llm, "tokenize") else None
+
+    def tokenize(self, text):
+        llm = self._llm()
+        if llm is None:
+            return None
+        return llm.tokenize(text.encode("utf-8"), add_bos=False)
+
+    def count(self, text):
+        """Number of tokens in text (estimated without a tokenizer)"""
+        tokens = self.tokenize(text)
+        if tokens is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(tokens)
+
+    def _detokenize(self, tokens):
+        return self._llm().detokenize(tokens).decode("utf-8", errors="ignore")
+
+    # ---- request truncation ----
+
+    def fit_request(self, request):
+        """
+        Return request cut to request_tokens, keeping its first two thirds
+        and its last third of the budget around a "[...]" marker.
+        """
+        cached = self._fitted.get(request)
+        if cached is None:
+            cached = self._fit(request)
+            if len(self._fitted) >= 16:
+                self._fitted.clear()
+            self._fitted[request] = cached
+        return cached[0]
+
+    def _fit(self, request):
+        budget = self.request_tokens
+        tokens = self.tokenize(request)
+        if tokens is None:
+            # No tokenizer: fall back to a character budget
+            limit = budget * CHARS_PER_TOKEN
+            if len(request) <= limit:
+                return request, 0
+            head = limit * 2 // 3
+            fitted = request[:head].rstrip() + TRUNCATION_MARK + request[-(limit - head):].lstrip()
+            return fitted, (len(request) - limit) // CHARS_PER_TOKEN
+        if len(tokens) <= budget:
+            return request, 0
+        head = budget * 2 // 3
+        fitted = (self._detokenize(tokens[:head]).strip() + TRUNCATION_MARK
+                  + self._detokenize(tokens[-(budget - head):]).lstrip())
+        return fitted, len(tokens) - budget
+
+    # ---- per-call accounting ----
+
+    def _indentation_cost(self, prompt):
+        """Tokens the indented source of the template prompt starts with would have added"""
+        for template, source in _template_sources.items():
+            if prompt.startswith(template):
+                if template not in self._template_saved:
+                    self._template_saved[template] = max(0, self.count(source) - self.count(template))
+                return self._template_saved[template]
+        return 0
+
+    def max_tokens(self, prompt, requested, request=None, record=True):
+        """
+        Cap max_tokens to the context left after prompt, and record the
+        tokens this call saved (template indentation + request truncation).
+
+        Args:
+            prompt: Final prompt text
+            requested: max_tokens the caller would like
+            request: Original (untruncated) request text used in prompt, if any
+            record: False to only compute the cap (no per-call accounting)
+        """
+        prompt_tokens = self.count(prompt)
+        if record:
+            self._record(prompt, prompt_tokens, request)
+
+        available = self.n_ctx - prompt_tokens - CONTEXT_MARGIN
+        if available < MIN_OUTPUT_TOKENS:
+            raise ValueError(
+                f"Prompt uses {prompt_tokens} of {self.n_ctx} context tokens; "
+                f"lower the request budget (EMAIL_AGENT_REQUEST_TOKENS)"
+            )
+        return min(requested, available)
+
+    def _record(self, prompt, prompt_tokens, request):
+        saved = self._indentation_cost(prompt)
+        if request is not None:
+            fitted = self._fitted.get(request)
+            if fitted is not None and fitted[1]:
+                saved += fitted[1]
+                self.truncated += 1
+        self.calls += 1
+        self.tokens_saved += saved
+        self.last_saved = saved
+        self.last_prompt_tokens = prompt_tokens
+        metrics.inc("prompt_tokens_saved_total", saved)
+        metrics.observe("prompt_tokens", prompt_tokens, buckets=metrics.TOKEN_BUCKETS)
+
+    def stats(self):
+        return {
+            "prompt_calls": self.calls,
+            "prompt_tokens_saved": self.tokens_saved,
+            "prompt_avg_tokens_saved": round(self.tokens_saved / self.calls, 1) if self.calls else 0.0,
+            "prompt_calls_truncated": self.truncated,
+        }
@@ -0,0 +1,325 @@
+"""
+Semantic cache of finished drafts.
+
+Requests that only differ in wording ("remind John about the Friday
+meeting" / "send John a reminder about Friday's meeting") reuse an earlier
+subject and body instead of generating new ones. Each request is embedded
+with the receiver's address and name neutralized. The embeddings are rows
+of a memory-mapped float32 matrix, searched with blocked matrix products;
+the best match at or above the similarity threshold is a hit. Drafts are
+stored as templates with the receiver's name (and address) as merge
+fields, so a hit is re-personalized for the new receiver.
+
+Embeddings come from a GGUF model through llama.cpp (Llama.embed) in a
+context of its own: embedding mode resets the KV cache, which would throw
+away the generation model's cached prompt prefixes.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from generation_cache import model_fingerprint
+
+_SEARCH_BLOCK = 16384  # matrix rows scored per matrix product
+_NEUTRAL_RECEIVER = "the receiver"
+_MISSED_QUERIES = 256  # embeddings of missed lookups kept for the add() that follows
+
+
+class LlamaEmbedder:
+    """Mean-pooled, L2-normalized sentence embeddings from a GGUF model (loaded on first use)"""
+
+    def __init__(self, model_path, n_ctx=512, n_threads=None, **params):
+        self.model_path = model_path
+        self.params = {"n_ctx": n_ctx, "verbose": False, **params}
+        if n_threads:
+            self.params["n_threads"] = n_threads
+        self._llm = None
+        self._lock = threading.Lock()
+
+    @property
+    def model_id(self):
+        return model_fingerprint(self.model_path)
+
+    def _load(self):
+        if self._llm is None:
+            import llama_cpp
+
+            self._llm = llama_cpp.Llama(model_path=self.model_path, embedding=True,
+                                        pooling_type=llama_cpp.LLAMA_POOLING_TYPE_MEAN, **self.params)
+        return self._llm
+
+    def __call__(self, texts):
+        """Embed texts in one batch; returns a float32 array of shape (len(texts), dim)"""
+        import numpy as np
+
+        with self._lock:
+            vectors = self._load().embed(list(texts), normalize=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def neutral_request(request, receiver=None, receiver_name=None):
+    """The request with the receiver's address and name replaced, so it matches across receivers"""
+    if receiver:
+        request = re.sub(re.escape(receiver), _NEUTRAL_RECEIVER, request, flags=re.IGNORECASE)
+    if receiver_name:
+        request = re.sub(rf"\b{re.escape(receiver_name)}\b", _NEUTRAL_RECEIVER, request, flags=re.IGNORECASE)
+    return " ".join(request.split())
+
+
+def _to_template(text, receiver, receiver_name):
+    """Draft text -> MergeTemplate text with {receiver} / {receiver_name} fields"""
+    text = text.replace("{", "{{").replace("}", "}}")
+    if receiver:
+        text = re.sub(re.escape(receiver), "{receiver}", text, flags=re.IGNORECASE)
+    if receiver_name:
+        text = re.sub(rf"\b{re.escape(receiver_name)}\b", "{receiver_name}", text)
+    return text
+
+
+class SemanticDraftCache:
+    def __init__(self, embed, path=None, threshold=0.95, max_entries=100_000):
+        """
+        Args:
+            embed: Callable(list of texts) -> float32 array (n, dim) of unit vectors,
+                e.g. LlamaEmbedder; a model_id attribute ties stored entries to it
+            path: File prefix for <path>.sqlite3 (drafts) and <path>.f32 (embeddings);
+                None keeps everything in memory
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Entries kept; the oldest is overwritten when full
+        """
+        self.embed = embed
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = None
+        self._matrix = None   # (capacity, dim) float32, rows [0, count) in use
+        self._count = 0
+        self._next_slot = 0
+        self._dim = None
+        self._drafts = {}     # slot -> (subject template, body template) when path is None
+        self._missed = OrderedDict()  # neutral request -> embedding, so add() need not embed again
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    # ---- storage ----
+
+    def _open(self, dim):
+        """Open (or create) the stores for embeddings of size dim"""
+        if self._dim is not None:
+            if dim != self._dim:
+                raise ValueError(f"Embedding size changed from {self._dim} to {dim}")
+            return
+        self._dim = dim
+        if self.path is None:
+            self._resize(1024)
+            return
+        model_id = getattr(self.embed, "model_id", None)
+        self._db = sqlite3.connect(self.path + ".sqlite3", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS drafts ("
+            " slot INTEGER PRIMARY KEY, request TEXT NOT NULL,"
+            " subject TEXT NOT NULL, body TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if meta.get("model") != str(model_id) or meta.get("dim") != str(dim):
+            # Embeddings from another model are not comparable: start over
+            self._db.execute("DELETE FROM drafts")
+            self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                 [("model", str(model_id)), ("dim", str(dim)), ("next_slot", "0")])
+            self._db.commit()
+            if os.path.exists(self.path + ".f32"):
+                os.remove(self.path + ".f32")
+            meta["next_slot"] = "0"
+        self._count = min(self.max_entries,
+                          self._db.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM drafts").fetchone()[0])
+        self._next_slot = int(meta.get("next_slot", self._count)) % self.max_entries
+        self._resize(max(1024, self._count))
+
+    def _resize(self, rows):
+        """Make room for at least rows embeddings (capacity doubles, up to max_entries)"""
+        import numpy as np
+
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if rows <= capacity:
+            return
+        capacity = min(self.max_entries, max(rows, capacity * 2))
+        if self.path is None:
+            matrix = np.zeros((capacity, self._dim), dtype=np.float32)
+            if self._matrix is not None:
+                matrix[:len(self._matrix)] = self._matrix
+            self._matrix = matrix
+            return
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        filename = self.path + ".f32"
+        with open(filename, "ab") as f:
+            size = capacity * self._dim * 4
+            if f.tell() < size:
+                f.truncate(size)
+        self._matrix = np.memmap(filename, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    # ---- search ----
+
+    def _search(self, queries):
+        """Best (slot, similarity) for each row of queries, by blocked matrix products"""
+        import numpy as np
+
+        best_slot = np.full(len(queries), -1)
+        best_score = np.full(len(queries), -np.inf, dtype=np.float32)
+        columns = np.arange(len(queries))
+        for start in range(0, self._count, _SEARCH_BLOCK):
+            scores = self._matrix[start:min(start + _SEARCH_BLOCK, self._count)] @ queries.T
+            rows = scores.argmax(axis=0)
+            top = scores[rows, columns]
+            better = top > best_score
+            best_score[better] = top[better]
+            best_slot[better] = rows[better] + start
+        return best_slot, best_score
+
+    def _draft(self, slot):
+        """(subject template, body template) stored in slot, or None"""
+        if self._db is None:
+            return self._drafts.get(slot)
+        return self._db.execute("SELECT subject, body FROM drafts WHERE slot = ?", (slot,)).fetchone()
+
+    def lookup_many(self, items):
+        """
+        Look several requests up with one embedding batch and one search.
+
+        Args:
+            items: (request, receiver, receiver_name) tuples
+
+        Returns:
+            For each item, (subject, body, similarity) for the new receiver, or None
+        """
+        from mail_merge import MergeTemplate
+
+        if not items:
+            return []
+        started = time.perf_counter()
+        texts = [neutral_request(*item) for item in items]
+        queries = self.embed(texts)
+        results = [None] * len(items)
+        with self._lock:
+            self._open(queries.shape[1])
+            if self._count:
+                slots, scores = self._search(queries)
+                for i, (slot, score) in enumerate(zip(slots, scores)):
+                    draft = self._draft(int(slot)) if score >= self.threshold else None
+                    if draft is not None:
+                        subject, body = MergeTemplate(*draft).render(
+                            {"receiver": items[i][1], "receiver_name": items[i][2]})
+                        results[i] = (subject, body, float(score))
+            for text, query, result in zip(texts, queries, results):
+                if result is None:
+                    self._missed[text] = query
+                    self._missed.move_to_end(text)
+            while len(self._missed) > _MISSED_QUERIES:
+                self._missed.popitem(last=False)
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(items) - hits
+            elapsed = time.perf_counter() - started
+            self.lookup_seconds += elapsed
+        metrics.observe("semantic_cache_lookup_seconds", elapsed)
+        metrics.inc("semantic_cache_lookups_total", hits, result="hit")
+        metrics.inc("semantic_cache_lookups_total", len(items) - hits, result="miss")
+        return results
+
+    def lookup(self, request, receiver=None, receiver_name=None):
+        """(subject, body, similarity) of a cached draft for a request worded like this one, or None"""
+        return self.lookup_many([(request, receiver, receiver_name)])[0]
+
+    # ---- updates ----
+
+    def add_many(self, items, embeddings=None):
+        """
+        Store finished drafts.
+
+        Args:
+            items: (request, receiver, receiver_name, subject, body) tuples
+            embeddings: Precomputed embeddings of the neutral requests (else
+                reused from a missed lookup of the same request, or embedded here)
+        """
+        if not items:
+            return
+        if embeddings is None:
+            embeddings = self._embeddings([neutral_request(request, receiver, name)
+                                           for request, receiver, name, _, _ in items])
+        now = time.time()
+        with self._lock:
+            self._open(embeddings.shape[1])
+            if self._db is not None and self._count == self.max_entries:
+                # Drop the drafts about to be overwritten before their embeddings
+                # change, so a crash in between cannot pair a vector with the wrong draft
+                slots = [(self._next_slot + i) % self.max_entries for i in range(len(items))]
+                self._db.executemany("DELETE FROM drafts WHERE slot = ?", [(slot,) for slot in slots])
+                self._db.commit()
+            rows = []
+            for (request, receiver, name, subject, body), vector in zip(items, embeddings):
+                slot = self._next_slot
+                self._resize(slot + 1)
+                self._matrix[slot] = vector
+                self._next_slot = (slot + 1) % self.max_entries
+                self._count = max(self._count, slot + 1)
+                template = (_to_template(subject, receiver, name), _to_template(body, receiver, name))
+                if self._db is None:
+                    self._drafts[slot] = template
+                else:
+                    rows.append((slot, neutral_request(request, receiver, name), *template, now))
+            if self._db is not None:
+                self._matrix.flush()
+                self._db.executemany("INSERT OR REPLACE INTO drafts VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('next_slot', ?)", (str(self._next_slot),))
+                self._db.commit()
+
+    def _embeddings(self, texts):
+        """Embeddings of texts, taking those of recently missed lookups instead of embedding again"""
+        import numpy as np
+
+        with self._lock:
+            known = [self._missed.pop(text, None) for text in texts]
+        missing = [i for i, vector in enumerate(known) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self.embed([texts[i] for i in missing])):
+                known[i] = vector
+        return np.stack(known)
+
+    def add(self, request, receiver, receiver_name, subject, body):
+        self.add_many([(request, receiver, receiver_name, subject, body)])
+
+    # ---- inspection ----
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "semantic_hits": self.hits,
+            "semantic_misses": self.misses,
+            "semantic_hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "semantic_lookup_ms_avg": round(self.lookup_seconds / lookups * 1000, 2) if lookups else 0.0,
+            "semantic_entries": self._count,
+            "semantic_index_bytes": self._count * (self._dim or 0) * 4,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._matrix is not None and self._db is not None:
+                self._matrix.flush()
+            self._matrix = None
+            self._dim = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None
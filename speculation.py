@@ -0,0 +1,115 @@
+"""
+Background pre-generation of alternative email bodies.
+
+While a preview is on screen the model is idle, so a BodySpeculator keeps
+up to N alternative bodies ready. "regenerate" then takes one at once (or
+waits only for the one already in progress), and the remaining work is
+cancelled at the next token when the email is sent or discarded.
+"""
+
+import threading
+from collections import deque
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside a background generation to stop it at the next token"""
+
+
+class BodySpeculator:
+    def __init__(self, generate, count=2):
+        """
+        Args:
+            generate: Callable(cancelled: threading.Event) -> candidate; should
+                raise SpeculationCancelled soon after the event is set
+            count: Candidates to keep ready
+        """
+        self.generate = generate
+        self.count = count
+        self.cancelled = threading.Event()
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._thread = threading.Thread(target=self._worker, daemon=True, name="speculator")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while len(self._ready) >= self.count and not self.cancelled.is_set():
+                    self._cond.wait()
+                if self.cancelled.is_set():
+                    return
+                self._busy = True
+            try:
+                candidate = self.generate(self.cancelled)
+            except SpeculationCancelled:
+                candidate = None
+            except Exception as e:
+                print(f"⚠ Background generation failed: {e}")
+                candidate = None
+            with self._cond:
+                self._busy = False
+                if candidate is not None and not self.cancelled.is_set():
+                    self._ready.append(candidate)
+                self._cond.notify_all()
+                if candidate is None:
+                    return
+
+    def take(self):
+        """
+        Pop a ready candidate, waiting for the one in progress if none is ready.
+
+        Returns:
+            (candidate or None, waited) where waited is True when the caller
+            had to wait for an in-progress generation
+        """
+        with self._cond:
+            waited = not self._ready and self._busy
+            while not self._ready and self._busy:
+                self._cond.wait()
+            candidate = self._ready.popleft() if self._ready else None
+            self._cond.notify_all()  # let the worker refill
+            return candidate, waited
+
+    def cancel(self):
+        """Stop background work and drop unused candidates"""
+        with self._cond:
+            self.cancelled.set()
+            self._ready.clear()
+            self._cond.notify_all()
+
+    @property
+    def ready(self):
+        return len(self._ready)
+
+
+class SpeculationStats:
+    """Hit rate and user-visible wait of "regenerate" requests"""
+
+    def __init__(self):
+        self.hits = 0      # candidate was already finished
+        self.partial = 0   # waited for the candidate being generated
+        self.misses = 0    # no candidate: generated from scratch
+        self.total_wait = 0.0
+        self.last_wait = 0.0
+
+    def record(self, outcome, wait):
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        self.total_wait += wait
+        self.last_wait = wait
+
+    def as_dict(self):
+        requests = self.hits + self.partial + self.misses
+        return {
+            "regenerate_requests": requests,
+            "regenerate_hits": self.hits,
+            "regenerate_partial_hits": self.partial,
+            "regenerate_misses": self.misses,
+            "regenerate_hit_rate": round((self.hits + self.partial) / requests, 3) if requests else 0.0,
+            "regenerate_avg_wait_ms": round(self.total_wait / requests * 1000, 1) if requests else 0.0,
+            "regenerate_last_wait_ms": round(self.last_wait * 1000, 1),
+        }
+
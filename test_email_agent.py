@@ -1,131 +1,236 @@
-"""
-Email Agent Test with Automatic Authentication
-Improved version with better formatting and user experience
-"""
-
-from agents_email_agent import EmailAgent
-from tools_send_email_gmail import send_email_gmail, setup_gmail_auth
-
-def print_separator(char="=", length=60):
-    """Print a separator line"""
-    print(char * length)
-
-def print_email_preview(preview):
-    """Print a nicely formatted email preview"""
-    print_separator()
-    print("📧 EMAIL PREVIEW")
-    print_separator()
-    print(f"To: {preview['receiver']}")
-    print(f"Subject: {preview['subject']}")
-    print()
-    print(preview['body'])
-    print_separator()
-
-def main():
-    print()
-    print_separator()
-    print("🤖 EMAIL AGENT - Starting...")
-    print_separator()
-    print()
-    
-    # Check authentication status
-    print("→ Checking Gmail authentication...")
-    try:
-        if not setup_gmail_auth():
-            print("\n✗ Authentication setup failed.")
-            print("   Make sure credentials.json is in the current directory.")
-            print("   Get it from: https://console.cloud.google.com")
-            return
-    except Exception as e:
-        print(f"\n⚠ Authentication check failed: {e}")
-        print("→ Will attempt authentication on first email send...\n")
-    
-    print()
-    print_separator()
-    print("✅ Ready to send emails!")
-    print_separator()
-    print()
-    
-    agent = EmailAgent()
-    
-    print("Email Agent started. Type 'quit' or 'exit' to close.\n")
-    print("💡 Examples:")
-    print("   • Send an email to john@example.com about project updates")
-    print("   • Email sarah@company.com regarding tomorrow's meeting")
-    print("   • Write to support@service.com about account issue")
-    print()
-    
-    while True:
-        try:
-            user_input = input("\n💬 You: ").strip()
-            
-            if user_input.lower() in ['quit', 'exit', 'q']:
-                print("\n👋 Goodbye!\n")
-                break
-            
-            if not user_input:
-                continue
-            
-            response = agent.process_step(user_input)
-            
-            if response["status"] == "need_receiver":
-                print(f"\n🤖 Agent: {response['question']}")
-                
-            elif response["status"] == "need_clarification":
-                print(f"\n🤖 Agent: {response['question']}")
-                
-            elif response["status"] == "confirmation":
-                print()
-                print_email_preview(response['email_preview'])
-                
-                # Store the body for regeneration
-                agent.current_body = response['email_preview']['body']
-                
-                # Get confirmation
-                print(f"\n🤖 Agent: {response['question']}")
-                confirm = input("Your choice: ").strip().lower()
-                
-                result = agent.handle_confirmation(confirm)
-                
-                if result["status"] == "sent":
-                    print(f"\n✅ {result['message']}")
-                    
-                elif result["status"] == "confirmation":
-                    # Show regenerated email
-                    print("\n🔄 Regenerated email:")
-                    print_email_preview(result['email_preview'])
-                    
-                    # Store updated body
-                    agent.current_body = result['email_preview']['body']
-                    
-                    # Ask again
-                    print(f"\n🤖 Agent: {result['question']}")
-                    confirm = input("Your choice: ").strip().lower()
-                    
-                    final = agent.handle_confirmation(confirm)
-                    
-                    if final["status"] == "sent":
-                        print(f"\n✅ {final['message']}")
-                    elif final["status"] == "cancelled":
-                        print(f"\n❌ {final['message']}")
-                    else:
-                        print(f"\n→ {final['message']}")
-                        
-                elif result["status"] == "cancelled":
-                    print(f"\n❌ {result['message']}")
-                else:
-                    print(f"\n→ {result['message']}")
-            
-            elif response["status"] == "error":
-                print(f"\n❌ Error: {response['message']}")
-                
-        except KeyboardInterrupt:
-            print("\n\n👋 Interrupted. Goodbye!\n")
-            break
-        except Exception as e:
-            print(f"\n❌ Unexpected error: {e}")
-            import traceback
-            traceback.print_exc()
-
-if __name__ == "__main__":
+"""
+Email Agent Test with Automatic Authentication
+Improved version with better formatting and user experience
+
+Usage:
+    python test_email_agent.py             # draft and send through Gmail
+    python test_email_agent.py --dry-run   # draft only: no Gmail auth, nothing is sent
+"""
+
+import argparse
+
+from agents_email_agent import (
+    CONTACTS_PATH,
+    MODEL_WORKERS,
+    OUTBOX_ENABLED,
+    OUTBOX_PATH,
+    SPECULATIVE_BODIES,
+    EmailAgent,
+)
+from tools_send_email_gmail import preload_gmail_client, setup_gmail_auth
+
+def print_separator(char="=", length=60):
+    """Print a separator line"""
+    print(char * length)
+
+def print_email_preview(preview):
+    """Print a nicely formatted email preview"""
+    print_separator()
+    print("📧 EMAIL PREVIEW")
+    print_separator()
+    print(f"To: {preview['receiver']}")
+    print(f"Subject: {preview['subject']}")
+    print()
+    print(preview['body'])
+    for attachment in preview.get('attachments') or ():
+        size = attachment['size']
+        print(f"📎 {attachment['name']}" + (f" ({size / 1024:.0f} KB)" if size is not None else ""))
+    print_separator()
+
+class BodyStreamPrinter:
+    """Print the email body live while the model generates it"""
+
+    def __init__(self):
+        self.started = False
+
+    def __call__(self, text):
+        if not self.started:
+            print("\n✍️  Drafting...\n")
+            self.started = True
+        print(text, end="", flush=True)
+
+    def finish(self):
+        if self.started:
+            print()
+            self.started = False
+
+def print_generation_metrics(metrics):
+    """Print time-to-first-token and generation speed of the last body"""
+    if not metrics:
+        return
+    if metrics.get("speculative"):
+        print(f"⚡ Pre-generated while you read · waited {metrics['wait_ms']:.0f} ms")
+        return
+    if metrics.get("semantic_cache"):
+        print(f"♻️  Reused a draft for a similar request (similarity {metrics['similarity']:.2f}) "
+              f"· {metrics['wait_ms']:.0f} ms")
+        return
+    print(f"⏱  First token: {metrics['ttft_ms']:.0f} ms · "
+          f"{metrics['tokens_per_sec']:.1f} tokens/sec · "
+          f"total {metrics['total_ms'] / 1000:.1f} s")
+
+def dry_run_send(to, subject, body, attachments=()):
+    """Stand-in for the Gmail tool in --dry-run mode"""
+    attached = f" ({len(attachments)} attachment(s))" if attachments else ""
+    return f"✓ Dry run: email to {to}{attached} was not sent"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Interactive email agent")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Draft emails without Gmail: skip authentication and never send")
+    args = parser.parse_args(argv)
+    
+    print()
+    print_separator()
+    print("🤖 EMAIL AGENT - Starting...")
+    print_separator()
+    print()
+    
+    if args.dry_run:
+        print("→ Dry run: Gmail is not used, confirmed emails are only shown")
+    else:
+        # Check authentication status
+        print("→ Checking Gmail authentication...")
+        try:
+            if not setup_gmail_auth():
+                print("\n✗ Authentication setup failed.")
+                print("   Make sure credentials.json is in the current directory.")
+                print("   Get it from: https://console.cloud.google.com")
+                return
+        except Exception as e:
+            print(f"\n⚠ Authentication check failed: {e}")
+            print("→ Will attempt authentication on first email send...\n")
+        # Load the Gmail client libraries while the user types the first request
+        preload_gmail_client()
+    
+    print()
+    print_separator()
+    print("✅ Ready to draft emails!" if args.dry_run else "✅ Ready to send emails!")
+    print_separator()
+    print()
+    
+    outbox = None
+    if OUTBOX_ENABLED and not args.dry_run:
+        from outbox import Outbox
+
+        outbox = Outbox(OUTBOX_PATH).start()
+        print(f"📮 Outbox enabled ({OUTBOX_PATH}): confirmed emails are sent in the background\n")
+    
+    agent_kwargs = {}
+    if args.dry_run:
+        agent_kwargs["send_func"] = dry_run_send
+    if MODEL_WORKERS > 1:
+        # Speculative bodies then generate on other workers than the preview
+        from agents_email_agent import local_model
+        from model_pool import PooledModelWrapper
+
+        agent_kwargs["model"] = PooledModelWrapper(MODEL_WORKERS, generation_cache=local_model.generation_cache)
+        print(f"⚡ {MODEL_WORKERS} model workers\n")
+    if CONTACTS_PATH:
+        from contacts import ContactDirectory
+
+        agent_kwargs["contacts"] = ContactDirectory(CONTACTS_PATH)
+        print(f"📇 {len(agent_kwargs['contacts'])} contacts loaded from {CONTACTS_PATH}\n")
+    
+    agent = EmailAgent(outbox=outbox, speculative_bodies=SPECULATIVE_BODIES, **agent_kwargs)
+    stream_printer = BodyStreamPrinter()
+    agent.on_body_token = stream_printer
+    
+    print("Email Agent started. Type 'quit' or 'exit' to close.\n")
+    print("💡 Examples:")
+    print("   • Send an email to john@example.com about project updates")
+    print("   • Email sarah@company.com regarding tomorrow's meeting")
+    print("   • Write to support@service.com about account issue")
+    if "contacts" in agent_kwargs:
+        print("   • Email Sarah from finance about the budget")
+    print()
+    
+    while True:
+        try:
+            user_input = input("\n💬 You: ").strip()
+            
+            if user_input.lower() in ['quit', 'exit', 'q']:
+                print("\n👋 Goodbye!\n")
+                break
+            
+            if not user_input:
+                continue
+            
+            response = agent.process_step(user_input)
+            stream_printer.finish()
+            
+            if response["status"] == "need_receiver":
+                print(f"\n🤖 Agent: {response['question']}")
+                
+            elif response["status"] == "need_clarification":
+                print(f"\n🤖 Agent: {response['question']}")
+                
+            elif response["status"] == "confirmation":
+                print()
+                print_email_preview(response['email_preview'])
+                print_generation_metrics(agent.last_generation_metrics)
+                
+                # Store the body for regeneration
+                agent.current_body = response['email_preview']['body']
+                
+                # Ask until the email is sent or discarded (regenerate and attach ask again)
+                result = response
+                while result["status"] == "confirmation":
+                    print(f"\n🤖 Agent: {result['question']}")
+                    confirm = input("Your choice: ").strip()
+                    
+                    result = agent.handle_confirmation(confirm)
+                    stream_printer.finish()
+                    
+                    if result["status"] == "confirmation":
+                        if confirm.lower() in ("regenerate", "r"):
+                            # Show regenerated email
+                            print("\n🔄 Regenerated email:")
+                            print_email_preview(result['email_preview'])
+                            print_generation_metrics(agent.last_generation_metrics)
+                        else:
+                            print()
+                            print_email_preview(result['email_preview'])
+                
+                if result["status"] in ("sent", "queued"):
+                    print(f"\n✅ {result['message']}")
+                elif result["status"] == "cancelled":
+                    print(f"\n❌ {result['message']}")
+                else:
+                    print(f"\n→ {result['message']}")
+            
+            elif response["status"] == "error":
+                print(f"\n❌ Error: {response['message']}")
+                
+        except (KeyboardInterrupt, EOFError):
+            print("\n\n👋 Interrupted. Goodbye!\n")
+            break
+        except Exception as e:
+            print(f"\n❌ Unexpected error: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    prompt_stats = agent.prompts.stats()
+    if prompt_stats["prompt_tokens_saved"]:
+        print(f"📊 Prompts: {prompt_stats['prompt_tokens_saved']} tokens saved over "
+              f"{prompt_stats['prompt_calls']} model calls "
+              f"({prompt_stats['prompt_calls_truncated']} with a shortened request)")
+    model_stats = agent.model.stats() if hasattr(agent.model, "stats") else {}
+    if model_stats.get("spec_calls"):
+        print(f"📊 Speculative decoding: {model_stats['spec_acceptance_rate']:.0%} of "
+              f"{model_stats['spec_tokens_proposed']} drafted tokens accepted")
+    stats = agent.speculation_stats.as_dict()
+    if stats["regenerate_requests"]:
+        print(f"📊 Regenerate: {stats['regenerate_hit_rate']:.0%} served from pre-generated bodies, "
+              f"average wait {stats['regenerate_avg_wait_ms']:.0f} ms")
+    
+    if outbox is not None:
+        # Give queued emails a moment to go out; anything left is sent next start
+        if not outbox.wait_idle(timeout=10):
+            print(f"📮 {outbox.counts().get('pending', 0)} email(s) still queued; they will be sent next time.")
+        outbox.close()
+    if "model" in agent_kwargs:
+        agent_kwargs["model"].close()
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""
+Compiled post-processing rules for model output.
+
+clean_response() and clean_email_body() produce exactly the same output as
+the original regex chains in EmailAgent, with all patterns compiled once,
+neighbouring rules fused into shared passes, and the lazy "X.*?Y" rules
+(placeholders, "def f(...):", "Email/Phone/Website ...:...\\n") rewritten as
+linear scans. The regex versions rescan to the end of the line from every
+candidate start, which is quadratic on long lines where Y never appears.
+
+BodyStreamFilter applies the line-local rules to streamed tokens so a live
+preview never shows subject lines, placeholders or dividers.
+"""
+
+import re
+
+# ---- _clean_response rules ----
+_CODE_BLOCK = re.compile(r'```.*?```', re.DOTALL)
+_FUNCTION_DEF_START = re.compile(r'def\s+\w+\(')
+_COMMENT = re.compile(r'#.*')
+
+# ---- _clean_email_body rules ----
+_HEADER_LINE_START = re.compile(r'(?:Subject|Re):', re.IGNORECASE)
+_CONTACT_SECTION = re.compile(r'Your Contact Information', re.IGNORECASE)
+_LABEL_KEYWORDS = (
+    re.compile(r'Email', re.IGNORECASE),
+    re.compile(r'Phone', re.IGNORECASE),
+    re.compile(r'Website', re.IGNORECASE),
+)
+_JOB_TITLE_LINE = re.compile(r'^Your Job Title.*?\n', re.IGNORECASE | re.MULTILINE)
+_EXTRA_NEWLINES = re.compile(r'\n{3,}')
+_GREETING = re.compile(r'(Dear|Hello|Hi|Greetings)\s+\w+', re.IGNORECASE)
+_CLOSING = re.compile(r'(Best regards|Regards|Sincerely|Thank you|Best)\s*$', re.IGNORECASE | re.MULTILINE)
+_DIVIDER = re.compile(r'[-=_]{3,}$')
+
+
+def clean_response(text):
+    """Clean model response from code and explanations"""
+    if not text:
+        return ""
+    text = _CODE_BLOCK.sub('', text)
+    text = _strip_function_defs(text)
+    text = _COMMENT.sub('', text)
+    return ' '.join(text.split()).strip()
+
+
+def _strip_function_defs(text):
+    """Linear-time equivalent of re.sub(r'def\\s+\\w+\\(.*?\\):', '', text)"""
+    pieces = []
+    last = pos = 0
+    while True:
+        match = _FUNCTION_DEF_START.search(text, pos)
+        if match is None:
+            break
+        line_end = text.find('\n', match.end())
+        if line_end == -1:
+            line_end = len(text)
+        close = text.find('):', match.end(), line_end)
+        if close == -1:
+            # No later "def f(" on this line can find a "):" either
+            pos = line_end
+            continue
+        pieces.append(text[last:match.start()])
+        last = pos = close + 2
+    if not pieces:
+        return text
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def _strip_headers_and_placeholders(text):
+    """
+    One linear pass equivalent to removing, in order,
+    r'^Subject:.*?\\n', r'^Re:.*?\\n' (IGNORECASE | MULTILINE) and r'\\[.*?\\]'.
+    Whole-line removals never change other lines, so the rules can share a pass.
+    """
+    pieces = []
+    last = pos = 0
+    size = len(text)
+    while pos < size:
+        line_end = text.find('\n', pos)
+        if line_end != -1 and _HEADER_LINE_START.match(text, pos):
+            pieces.append(text[last:pos])
+            last = pos = line_end + 1
+            continue
+        if line_end == -1:
+            line_end = size
+        # [placeholders] never span lines; once a '[' has no ']' after it,
+        # none of the later ones on this line do either
+        start = text.find('[', pos, line_end)
+        while start != -1:
+            close = text.find(']', start + 1, line_end)
+            if close == -1:
+                break
+            pieces.append(text[last:start])
+            last = close + 1
+            start = text.find('[', last, line_end)
+        pos = line_end + 1
+    if not pieces:
+        return text
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def _cut_labeled_lines(text, keyword):
+    """
+    Linear-time equivalent of re.sub(keyword + r'.*?:.*?\\n', '', text, flags=re.I):
+    from the first keyword on a line that is followed by ':' on the same
+    line, drop the rest of that line including its newline.
+    """
+    pieces = []
+    last = pos = 0
+    while True:
+        match = keyword.search(text, pos)
+        if match is None:
+            break
+        newline = text.find('\n', match.end())
+        if newline == -1:
+            break  # the last line has no terminating newline: nothing more can match
+        if text.find(':', match.end(), newline) != -1:
+            pieces.append(text[last:match.start()])
+            last = newline + 1
+        # Later keywords on this line have no ':' after them either
+        pos = newline + 1
+    if not pieces:
+        return text
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def _truncate_contact_section(text):
+    """Equivalent of re.sub(r'Your Contact Information.*?$', '', text, flags=re.I | re.S)"""
+    match = _CONTACT_SECTION.search(text)
+    if match is None:
+        return text
+    # $ without MULTILINE matches before a final newline, which is kept
+    return text[:match.start()] + ('\n' if text.endswith('\n') else '')
+
+
+def clean_email_body(text, receiver_name):
+    """Enhanced cleaning to fix double greeting and extra content"""
+    if not text:
+        return ""
+
+    text = _strip_headers_and_placeholders(text)
+    text = _truncate_contact_section(text)
+    for keyword in _LABEL_KEYWORDS:
+        text = _cut_labeled_lines(text, keyword)
+    text = _JOB_TITLE_LINE.sub('', text)
+    text = _EXTRA_NEWLINES.sub('\n\n', text).strip()
+
+    # Only add greeting if it doesn't exist
+    if not _GREETING.match(text):
+        text = f"Dear {receiver_name},\n\n{text}"
+
+    # Only add closing if it doesn't exist
+    if not _CLOSING.search(text):
+        if not text.endswith(('.', '!', '?')):
+            text += '.'
+        text += "\n\nBest regards"
+
+    # One pass over lines: drop dividers, then consecutive duplicates
+    final_lines = []
+    prev_line = None
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if _DIVIDER.match(stripped):
+            continue
+        if stripped != prev_line:
+            final_lines.append(line)
+        prev_line = stripped
+    return '\n'.join(final_lines).strip()
+
+
+# ============================================================
+# Streaming filter for live previews
+# ============================================================
+_HELD_LINE_STARTS = ("subject:", "re:", "your job title")
+
+
+class BodyStreamFilter:
+    """
+    Apply the line-local body rules (Subject/Re/job-title lines, [placeholders],
+    divider lines, repeated lines) to streamed tokens and forward the rest.
+
+    Text is held back only while a line could still turn out to be removed,
+    so most tokens pass straight through. The final body is still produced by
+    clean_email_body(); this filter only keeps the live view tidy.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.line = ""            # current, incomplete line
+        self.emitted = 0          # characters of the cleaned current line already forwarded
+        self.prev_line = None     # stripped text of the last complete kept line
+
+    def _decided(self, line):
+        """True once the partial line can no longer be a removable/duplicate line"""
+        stripped = line.strip()
+        lower = line.lower()
+        if any(start.startswith(lower) or lower.startswith(start) for start in _HELD_LINE_STARTS):
+            return False
+        if not stripped or set(stripped) <= set("-=_"):
+            return False
+        if self.prev_line is not None and self.prev_line.startswith(stripped):
+            return False
+        return True
+
+    @staticmethod
+    def _visible(line):
+        """Line text with complete [placeholders] removed, cut at an open '['"""
+        line = _strip_headers_and_placeholders(line) if '[' in line else line
+        open_bracket = line.find('[')
+        return line if open_bracket == -1 else line[:open_bracket]
+
+    def _forward(self, text):
+        if text:
+            self.callback(text)
+
+    def feed(self, piece):
+        for chunk in piece.splitlines(keepends=True):
+            if chunk.endswith('\n'):
+                self._finish_line(self.line + chunk[:-1])
+            else:
+                self.line += chunk
+                if self._decided(self.line):
+                    visible = self._visible(self.line)
+                    self._forward(visible[self.emitted:])
+                    self.emitted = max(self.emitted, len(visible))
+
+    def _finish_line(self, line):
+        self.line = ""
+        emitted, self.emitted = self.emitted, 0
+        stripped = line.strip()
+        lower = line.lower()
+        if lower.startswith(_HELD_LINE_STARTS) or (stripped and _DIVIDER.match(stripped)):
+            return
+        if stripped == self.prev_line:
+            return
+        self.prev_line = stripped
+        visible = _strip_headers_and_placeholders(line) if '[' in line else line
+        self._forward(visible[emitted:] + '\n')
+
+    def flush(self):
+        """Forward whatever is left of the last line"""
+        if self.line:
+            line, emitted = self.line, self.emitted
+            self.line, self.emitted = "", 0
+            if line.strip() != self.prev_line:
+                self._forward(self._visible(line)[emitted:])
@@ -1,194 +1,477 @@
-"""
-Gmail send tool with built-in automatic token management.
-No separate auth_manager.py file needed!
-"""
-
-from smolagents import tool
-from googleapiclient.discovery import build
-from email.mime.text import MIMEText
-import base64
-import os
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-
-# Configuration
-CREDENTIALS_FILE = "credentials.json"
-TOKEN_FILE = "token.json"
-SENDER_EMAIL = "*********@gmail.com"  # Replace with your Gmail address
-SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
-
-# ============================================================
-# Built-in Auth Manager (no separate file needed)
-# ============================================================
-
-class GmailAuthManager:
-    def __init__(self, credentials_file, token_file):
-        self.credentials_file = credentials_file
-        self.token_file = token_file
-        self.creds = None
-    
-    def get_credentials(self):
-        """Get valid credentials, creating new ones if needed."""
-        # Check if token exists and load it
-        if os.path.exists(self.token_file):
-            try:
-                self.creds = Credentials.from_authorized_user_file(self.token_file, SCOPES)
-                print(f"✓ Loaded existing token from {self.token_file}")
-            except Exception as e:
-                print(f"⚠ Error loading token: {e}")
-                self.creds = None
-        
-        # If credentials don't exist or are invalid
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                # Token expired but can be refreshed
-                print("⟳ Refreshing expired token...")
-                try:
-                    self.creds.refresh(Request())
-                    print("✓ Token refreshed successfully")
-                except Exception as e:
-                    print(f"⚠ Token refresh failed: {e}")
-                    print("→ Generating new token...")
-                    self.creds = self._generate_new_token()
-            else:
-                # No valid credentials, need to generate new token
-                self.creds = self._generate_new_token()
-            
-            # Save the credentials for next time
-            self._save_token()
-        
-        return self.creds
-    
-    def _generate_new_token(self):
-        """Generate a new token via OAuth flow."""
-        if not os.path.exists(self.credentials_file):
-            raise FileNotFoundError(
-                f"\n{'='*60}\n"
-                f"ERROR: {self.credentials_file} not found!\n\n"
-                f"To fix this:\n"
-                f"1. Go to Google Cloud Console (console.cloud.google.com)\n"
-                f"2. Enable Gmail API for your project\n"
-                f"3. Create OAuth 2.0 credentials (Desktop app)\n"
-                f"4. Download the credentials JSON file\n"
-                f"5. Save it as '{self.credentials_file}' in this directory\n"
-                f"{'='*60}\n"
-            )
-        
-        print("\n" + "="*60)
-        print("🔐 FIRST TIME SETUP - Gmail OAuth Authorization")
-        print("="*60)
-        print(f"→ Opening browser for authorization...")
-        print(f"→ Please log in and grant access to send emails")
-        print(f"→ This only needs to be done once\n")
-        
-        try:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                self.credentials_file, 
-                SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-            print("\n✓ Authorization successful!")
-            return creds
-        except Exception as e:
-            print(f"\n✗ Authorization failed: {e}")
-            raise
-    
-    def _save_token(self):
-        """Save credentials to token file"""
-        try:
-            with open(self.token_file, 'w') as f:
-                f.write(self.creds.to_json())
-            print(f"✓ Token saved to {self.token_file}")
-        except Exception as e:
-            print(f"⚠ Failed to save token: {e}")
-    
-    def is_authenticated(self):
-        """Check if user is already authenticated"""
-        return os.path.exists(self.token_file)
-
-
-# Global instance
-_auth_manager = None
-
-def get_auth_manager():
-    """Get or create the global auth manager instance."""
-    global _auth_manager
-    if _auth_manager is None:
-        _auth_manager = GmailAuthManager(CREDENTIALS_FILE, TOKEN_FILE)
-    return _auth_manager
-
-
-# ============================================================
-# Email Sending Tool
-# ============================================================
-
-@tool
-def send_email_gmail(to: str, subject: str, body: str) -> str:
-    """
-    Sends an email using the Gmail API with automatic authentication.
-    On first run, will open browser for OAuth authorization.
-
-    Args:
-        to (str): The recipient's email address.
-        subject (str): The subject line of the email.
-        body (str): The plain text content of the email.
-
-    Returns:
-        str: A confirmation message containing the Gmail message ID.
-    """
-    try:
-        # Get auth manager and credentials (handles OAuth automatically)
-        auth_manager = get_auth_manager()
-        creds = auth_manager.get_credentials()
-        
-        # Build Gmail service
-        service = build("gmail", "v1", credentials=creds)
-        
-        # Create email message
-        msg = MIMEText(body)
-        msg["to"] = to
-        msg["from"] = SENDER_EMAIL
-        msg["subject"] = subject
-        
-        # Encode and send
-        raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-        result = service.users().messages().send(
-            userId="me", 
-            body={"raw": raw}
-        ).execute()
-        
-        return f"✓ Email sent successfully to {to} (Message ID: {result['id']})"
-        
-    except FileNotFoundError as e:
-        return str(e)
-    except Exception as e:
-        return f"✗ Failed to send email: {str(e)}"
-
-
-def setup_gmail_auth():
-    """
-    Convenience function to setup Gmail authentication.
-    
-    Returns:
-        bool: True if authentication successful, False otherwise
-    """
-    try:
-        auth_manager = get_auth_manager()
-        
-        if auth_manager.is_authenticated():
-            print("✓ Already authenticated")
-            # Verify token is still valid
-            creds = auth_manager.get_credentials()
-            print("✓ Token is valid")
-            return True
-        else:
-            print("→ Starting authentication process...")
-            creds = auth_manager.get_credentials()
-            print("✓ Authentication complete!")
-            return True
-            
-    except Exception as e:
-        print(f"✗ Authentication failed: {e}")
-
-        return False
+"""
+Gmail send tool with automatic token management (auth_manager.py).
+
+The Google client libraries (and smolagents) take most of a second to
+import, so they are imported on first use rather than with this module.
+"""
+
+import base64
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+
+import metrics
+# GmailAuthManager, SCOPES and TOKEN_REFRESH_MARGIN remain importable from this module
+from auth_manager import SCOPES, TOKEN_REFRESH_MARGIN, GmailAuthManager
+from auth_manager import get_auth_manager as _shared_auth_manager
+
+# Configuration
+CREDENTIALS_FILE = "credentials.json"
+TOKEN_FILE = "token.json"
+SENDER_EMAIL = "*********@gmail.com"  # Replace with your Gmail address
+HTTP_TIMEOUT = 60  # seconds per Gmail HTTP request
+GMAIL_BATCH_LIMIT = 100  # Gmail API maximum sub-requests per batch call
+GMAIL_BATCH_PATH = "batch/gmail/v1"
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes per resumable upload request (a multiple of 256 KB)
+GMAIL_UPLOAD_LIMIT = 35 * 1024 * 1024  # largest message (after encoding) Gmail accepts by upload
+UPLOAD_RETRIES = 3  # consecutive retries of an upload chunk on 5xx/429/connection errors
+
+# ============================================================
+# Auth Manager (shared with auth_manager.py)
+# ============================================================
+
+def get_auth_manager():
+    """Get or create the global auth manager instance."""
+    return _shared_auth_manager(CREDENTIALS_FILE, TOKEN_FILE)
+
+
+# ============================================================
+# Gmail Service Cache
+# ============================================================
+
+# httplib2 connections are not thread-safe, so each thread keeps its own
+# service object (and therefore its own keep-alive connection).
+_service_local = threading.local()
+
+
+@functools.lru_cache(maxsize=None)
+def _gmail_discovery_document():
+    """The gmail v1 discovery document bundled with google-api-python-client, parsed once"""
+    from googleapiclient import discovery_cache
+
+    return json.loads(discovery_cache.get_static_doc("gmail", "v1"))
+
+
+def build_gmail_service(creds, api_endpoint=None):
+    """
+    Build a Gmail service bound to a persistent keep-alive HTTP connection.
+    Uses the bundled (offline) discovery document, parsed once per process.
+
+    Args:
+        creds: Google OAuth credentials
+        api_endpoint: Optional API root override (e.g. a local fake server)
+
+    Returns:
+        Gmail v1 service resource
+    """
+    import google_auth_httplib2
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+
+    raw_http = httplib2.Http(timeout=HTTP_TIMEOUT)
+    # Resumable uploads answer 308 "Resume Incomplete", which is not a redirect here
+    raw_http.redirect_codes = raw_http.redirect_codes - {308}
+    http = google_auth_httplib2.AuthorizedHttp(creds, http=raw_http)
+    document = _gmail_discovery_document()
+    client_options = None
+    if api_endpoint:
+        client_options = {"api_endpoint": api_endpoint}
+        # Media upload URLs are built from the document's rootUrl, not client_options
+        document = dict(document, rootUrl=api_endpoint.rstrip("/") + "/")
+    return build_from_document(document, http=http, client_options=client_options)
+
+
+def get_gmail_service(creds=None, api_endpoint=None):
+    """
+    Return this thread's cached Gmail service, rebuilding it only when the
+    credentials object (or endpoint) changes. Token refreshes update the
+    credentials in place, so they do not cost a rebuild.
+    """
+    if creds is None:
+        creds = get_auth_manager().get_credentials()
+
+    cached = getattr(_service_local, "entry", None)
+    if cached is not None and cached[0] is creds and cached[1] == api_endpoint:
+        return cached[2]
+
+    service = build_gmail_service(creds, api_endpoint)
+    _service_local.entry = (creds, api_endpoint, service)
+    return service
+
+
+def reset_gmail_service():
+    """Drop this thread's cached Gmail service"""
+    _service_local.entry = None
+
+
+def preload_gmail_client():
+    """
+    Import the Google client libraries and parse the discovery document in
+    a background thread (e.g. while the user types), so the first send does
+    not pay for them. Returns the thread.
+    """
+    def load():
+        import google_auth_httplib2
+        import googleapiclient.discovery
+        import googleapiclient.errors
+
+        _gmail_discovery_document()
+
+    thread = threading.Thread(target=load, daemon=True, name="gmail-preload")
+    thread.start()
+    return thread
+
+
+# ============================================================
+# Email Sending Tool
+# ============================================================
+
+def build_raw_message(to, subject, body):
+    """Build the base64url-encoded MIME message expected by messages.send"""
+    from email.mime.text import MIMEText
+
+    msg = MIMEText(body)
+    msg["to"] = to
+    msg["from"] = SENDER_EMAIL
+    msg["subject"] = subject
+    return base64.urlsafe_b64encode(msg.as_bytes()).decode()
+
+
+# Raw bytes per read: exactly 1024 base64 lines of 76 characters
+_BASE64_BLOCK = 57 * 1024
+
+
+def _open_attachment(attachment):
+    """
+    Open one attachment for reading.
+
+    Args:
+        attachment: A path, a binary file object, or a (filename, path or file) pair
+
+    Returns:
+        (filename, binary file object, whether the caller must close it)
+    """
+    if isinstance(attachment, tuple):
+        filename, source = attachment
+    else:
+        filename, source = None, attachment
+    if isinstance(source, (str, bytes, os.PathLike)):
+        path = os.fsdecode(source)
+        return filename or os.path.basename(path), open(path, "rb"), True
+    return filename or os.path.basename(getattr(source, "name", "attachment")), source, False
+
+
+def attachment_size(attachment):
+    """Size in bytes of an attachment (None if it cannot be known without reading it)"""
+    source = attachment[1] if isinstance(attachment, tuple) else attachment
+    try:
+        if isinstance(source, (str, bytes, os.PathLike)):
+            return os.path.getsize(source)
+        return os.fstat(source.fileno()).st_size
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+def write_mime_message(out, to, subject, body, attachments):
+    """
+    Write a multipart/mixed message with attachments to a binary file.
+
+    Attachments are base64-encoded block by block while they are copied, so
+    memory use does not depend on their size.
+
+    Returns:
+        Bytes written
+    """
+    import mimetypes
+    import uuid
+    from email.message import EmailMessage
+    from email.policy import default
+
+    policy = default.clone(linesep="\n", max_line_length=998)
+    boundary = f"==============={uuid.uuid4().hex}=="
+    written = 0
+
+    def write(data):
+        nonlocal written
+        out.write(data)
+        written += len(data)
+
+    def header_block(message):
+        # Headers only: the body is written separately (as_bytes() would add an empty one)
+        return b"".join(policy.fold_binary(name, value) for name, value in message.items()) + b"\n"
+
+    head = EmailMessage(policy)
+    head["To"] = to
+    head["From"] = SENDER_EMAIL
+    head["Subject"] = subject
+    head["MIME-Version"] = "1.0"
+    head["Content-Type"] = f'multipart/mixed; boundary="{boundary}"'
+    write(header_block(head))
+
+    text = EmailMessage(policy)
+    text.set_content(body)
+    del text["MIME-Version"]
+    write(f"--{boundary}\n".encode() + text.as_bytes() + b"\n")
+
+    for attachment in attachments:
+        filename, f, owned = _open_attachment(attachment)
+        try:
+            mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            part = EmailMessage(policy)
+            part["Content-Type"] = mimetype
+            part.add_header("Content-Disposition", "attachment", filename=filename)
+            part["Content-Transfer-Encoding"] = "base64"
+            write(f"--{boundary}\n".encode() + header_block(part))
+            while True:
+                block = f.read(_BASE64_BLOCK)
+                if not block:
+                    break
+                write(base64.encodebytes(block))
+        finally:
+            if owned:
+                f.close()
+    write(f"--{boundary}--\n".encode())
+    return written
+
+
+def _upload_message(service, to, subject, body, attachments, chunk_size=UPLOAD_CHUNK_SIZE,
+                    max_size=GMAIL_UPLOAD_LIMIT, backoff=1.0):
+    """
+    Send a message with attachments through the resumable media upload
+    endpoint. The MIME message is spooled to a temporary file and uploaded
+    chunk_size bytes at a time, so peak memory stays at about one chunk
+    however large the attachments are (and an interrupted chunk resumes
+    instead of starting over).
+    """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseUpload
+
+    if max_size is not None:
+        # base64 grows attachments by 4/3; fail before encoding anything
+        raw = sum(attachment_size(a) or 0 for a in attachments)
+        if raw * 4 // 3 > max_size:
+            raise ValueError(f"Attachments too large: {raw / 1e6:.1f} MB "
+                             f"(Gmail accepts about {max_size * 3 // 4 / 1e6:.0f} MB)")
+
+    with tempfile.TemporaryFile() as spool:
+        write_mime_message(spool, to, subject, body, attachments)
+        spool.seek(0)
+        media = MediaIoBaseUpload(spool, mimetype="message/rfc822", chunksize=chunk_size, resumable=True)
+        request = service.users().messages().send(userId="me", media_body=media)
+        response = None
+        failures = 0
+        while response is None:
+            # Retried here rather than by next_chunk(num_retries=...), which
+            # would resend an already consumed slice of the spool file. After
+            # a failure next_chunk() asks the server how much arrived and
+            # continues from there.
+            try:
+                _, response = request.next_chunk()
+                failures = 0
+            except (HttpError, OSError) as e:
+                status = getattr(getattr(e, "resp", None), "status", None)
+                if (isinstance(e, HttpError) and status not in RETRYABLE_STATUSES) or failures >= UPLOAD_RETRIES:
+                    raise
+                failures += 1
+                time.sleep(backoff * (2 ** (failures - 1)))
+        return response["id"]
+
+
+def send_message(service, to, subject, body, attachments=None):
+    """
+    Send one message through a Gmail service and return its message ID.
+    Messages with attachments go through the chunked media upload path.
+    """
+    from googleapiclient.errors import HttpError
+
+    if attachments:
+        def execute():
+            return _upload_message(service, to, subject, body, attachments)
+    else:
+        raw = build_raw_message(to, subject, body)
+        request = service.users().messages().send(
+            userId="me",
+            body={"raw": raw}
+        )
+
+        def execute():
+            return request.execute()["id"]
+
+    if not metrics.enabled():
+        return execute()
+
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        return execute()
+    except HttpError as e:
+        status = str(e.resp.status)
+        raise
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        metrics.observe("gmail_send_seconds", time.perf_counter() - started)
+        metrics.inc("gmail_sends_total", status=status)
+
+
+def send_email(to: str, subject: str, body: str, attachments: list = None) -> str:
+    """
+    Sends an email using the Gmail API with automatic authentication.
+    On first run, will open browser for OAuth authorization.
+
+    Args:
+        to (str): The recipient's email address.
+        subject (str): The subject line of the email.
+        body (str): The plain text content of the email.
+        attachments (list): Optional paths of files to attach.
+
+    Returns:
+        str: A confirmation message containing the Gmail message ID.
+    """
+    try:
+        # Get auth manager and credentials (handles OAuth automatically)
+        auth_manager = get_auth_manager()
+        creds = auth_manager.get_credentials()
+        
+        # Reuse the cached Gmail service (token refreshes update it in place)
+        service = get_gmail_service(creds)
+        
+        # Create, encode and send the email message (attachments are streamed)
+        message_id = send_message(service, to, subject, body, attachments)
+        
+        return f"✓ Email sent successfully to {to} (Message ID: {message_id})"
+        
+    except FileNotFoundError as e:
+        return str(e)
+    except Exception as e:
+        return f"✗ Failed to send email: {str(e)}"
+
+
+def __getattr__(name):
+    """
+    send_email_gmail: send_email wrapped as a smolagents tool under its
+    original name (send_email_tool is an alias). Built on first access so
+    that importing this module does not import smolagents.
+    """
+    if name in ("send_email_gmail", "send_email_tool"):
+        from smolagents import tool
+
+        gmail_tool = tool(send_email)
+        gmail_tool.name = "send_email_gmail"
+        globals().update(send_email_gmail=gmail_tool, send_email_tool=gmail_tool)
+        return gmail_tool
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _new_batch(service, api_endpoint, callback):
+    """Create a BatchHttpRequest aimed at the Gmail batch endpoint"""
+    if api_endpoint:
+        from googleapiclient.http import BatchHttpRequest
+
+        # The discovery batch URI ignores client_options, so point it manually
+        batch_uri = f"{api_endpoint.rstrip('/')}/{GMAIL_BATCH_PATH}"
+        return BatchHttpRequest(callback=callback, batch_uri=batch_uri)
+    return service.new_batch_http_request(callback=callback)
+
+
+def send_emails_gmail_batch(messages, batch_size=GMAIL_BATCH_LIMIT, max_retries=3,
+                            backoff=1.0, creds=None, api_endpoint=None):
+    """
+    Send many emails through the Gmail multipart batch endpoint.
+
+    Args:
+        messages: Iterable of dicts with "to", "subject" and "body" keys
+        batch_size: Sub-requests per batch call (capped at GMAIL_BATCH_LIMIT)
+        max_retries: Extra attempts for sub-requests that failed with 429/5xx
+        backoff: Base delay in seconds, doubled after every retry round
+        creds: Credentials to use (defaults to the auth manager's)
+        api_endpoint: Optional API root override (e.g. a local fake server)
+
+    Returns:
+        list of dicts in input order: {"to", "status": "sent", "id"} or
+        {"to", "status": "failed", "error"}
+    """
+    from googleapiclient.errors import HttpError
+
+    messages = list(messages)
+    batch_size = max(1, min(batch_size, GMAIL_BATCH_LIMIT))
+    if creds is None:
+        creds = get_auth_manager().get_credentials()
+    service = get_gmail_service(creds, api_endpoint)
+
+    results = [None] * len(messages)
+    retryable = set()
+
+    def on_response(request_id, response, exception):
+        index = int(request_id)
+        to = messages[index]["to"]
+        if exception is None:
+            results[index] = {"to": to, "status": "sent", "id": response["id"]}
+            retryable.discard(index)
+            return
+        status = getattr(getattr(exception, "resp", None), "status", None)
+        results[index] = {"to": to, "status": "failed", "error": str(exception)}
+        if isinstance(exception, HttpError) and status in RETRYABLE_STATUSES:
+            retryable.add(index)
+        else:
+            retryable.discard(index)
+
+    pending = list(range(len(messages)))
+    for attempt in range(max_retries + 1):
+        for start in range(0, len(pending), batch_size):
+            batch = _new_batch(service, api_endpoint, on_response)
+            for index in pending[start:start + batch_size]:
+                message = messages[index]
+                raw = build_raw_message(message["to"], message["subject"], message["body"])
+                batch.add(
+                    service.users().messages().send(userId="me", body={"raw": raw}),
+                    request_id=str(index),
+                )
+            try:
+                batch.execute()
+            except Exception as e:
+                # Whole batch call failed (transport error): retry all of it
+                for index in pending[start:start + batch_size]:
+                    results[index] = {"to": messages[index]["to"], "status": "failed", "error": str(e)}
+                    retryable.add(index)
+
+        # Only the sub-requests that failed with a retryable error go again
+        pending = sorted(retryable)
+        if not pending or attempt == max_retries:
+            break
+        time.sleep(backoff * (2 ** attempt))
+
+    return results
+
+
+def setup_gmail_auth():
+    """
+    Convenience function to setup Gmail authentication.
+    
+    Returns:
+        bool: True if authentication successful, False otherwise
+    """
+    try:
+        auth_manager = get_auth_manager()
+        
+        if auth_manager.is_authenticated():
+            print("✓ Already authenticated")
+            # Verify token is still valid
+            creds = auth_manager.get_credentials()
+            print("✓ Token is valid")
+            return True
+        else:
+            print("→ Starting authentication process...")
+            creds = auth_manager.get_credentials()
+            print("✓ Authentication complete!")
+            return True
+            
+    except Exception as e:
+        print(f"✗ Authentication failed: {e}")
+
+        return False